@@ -0,0 +1,278 @@
+"""
+Multi-pattern answer matcher for the exact-match filter stage.
+
+An AnswerMatcher is an Aho-Corasick automaton built over normalized Jeopardy answers. It finds the occurrences of
+all answers in a text in one linear pass over the text's words, independent of the number of answers.
+
+Matching is done on words, hence answers only match whole words: "Rome" matches "in Rome," but not "Romeo".
+Text and answers are normalized the same way: lowercased, accents removed, split into alphanumeric words.
+Answers also match without their parenthesized parts and leading articles, e.g. "(Lou) Gehrig" matches "Gehrig"
+and "the Appian Way" matches "Appian Way".
+
+Example command to annotate crawler outputs with the spans of their answers in snippets.
+
+$ python answer_matcher.py --input-folder OUTPUT_FOLDER --output-folder ANNOTATED_FOLDER --processes 16
+"""
+import argparse
+import array
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import unicodedata
+
+from bs4 import BeautifulSoup
+
+import crawler
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+PARENTHESIZED_PATTERN = re.compile(r'\([^)]*\)')
+LEADING_ARTICLES = ['the', 'a', 'an']
+
+AnswerOccurrence = collections.namedtuple('AnswerOccurrence', ['key', 'start', 'end'])
+
+
+class AnswerMatcher(object):
+    """
+    Aho-Corasick automaton over the words of answers.
+
+    States are integers, state 0 is the root. Transitions are kept in a single dictionary keyed by
+    (state, word), which is much more compact than a dictionary per state for hundred thousands of answers.
+    """
+    def __init__(self):
+        self.transitions = {}
+        self.depths = array.array('l', [0])
+        self.failures = array.array('l', [0])
+        self.output_links = array.array('l', [-1])  # closest state on the failure chain that has outputs
+        self.outputs = {}  # state -> list of answer keys ending at state
+        self.built = False
+
+    @classmethod
+    def from_answers(cls, answers):
+        """
+        :param answers: pairs of (key, answer) where key identifies the answer, e.g. the Jeopardy entry id
+        :type answers: collections.Iterable[(object, str)]
+        :rtype: AnswerMatcher
+        """
+        matcher = cls()
+        for key, answer in answers:
+            matcher.add_answer(key, answer)
+        matcher.build()
+        return matcher
+
+    def add_answer(self, key, answer):
+        """Add an answer with all its variants. Must be called before build()."""
+        if self.built:
+            raise RuntimeError('Answers cannot be added after the automaton is built.')
+        for words in get_answer_variants(answer):
+            self.add_pattern(key, words)
+
+    def add_pattern(self, key, words):
+        state = 0
+        for word in words:
+            next_state = self.transitions.get((state, word))
+            if next_state is None:
+                next_state = len(self.depths)
+                self.transitions[(state, word)] = next_state
+                self.depths.append(self.depths[state] + 1)
+                self.failures.append(0)
+                self.output_links.append(-1)
+            state = next_state
+        keys = self.outputs.setdefault(state, [])
+        if key not in keys:
+            keys.append(key)
+
+    def build(self):
+        """Compute failure and output links in breadth-first order of states."""
+        children = collections.defaultdict(list)
+        for (state, word), child in self.transitions.items():
+            children[state].append((word, child))
+        queue = collections.deque(child for _, child in children[0])
+        while queue:
+            state = queue.popleft()
+            for word, child in children[state]:
+                failure = self.failures[state]
+                while failure and (failure, word) not in self.transitions:
+                    failure = self.failures[failure]
+                failure = self.transitions.get((failure, word), 0)
+                self.failures[child] = failure
+                self.output_links[child] = failure if failure in self.outputs else self.output_links[failure]
+                queue.append(child)
+        self.built = True
+
+    def find(self, text, key=None):
+        """
+        Find all answer occurrences in text.
+
+        :param text: text to search answers in, e.g. a snippet. Can be None.
+        :type text: unicode
+        :param key: if given only occurrences of the answer with this key are returned
+        :return: occurrences with start and end character offsets in text
+        :rtype: list[AnswerOccurrence]
+        """
+        if not self.built:
+            raise RuntimeError('The automaton must be built before matching.')
+        if not text:
+            return []
+        occurrences = []
+        word_spans = []
+        state = 0
+        for match in WORD_PATTERN.finditer(to_unicode(text)):
+            word = normalize_word(match.group())
+            word_spans.append(match.span())
+            while state and (state, word) not in self.transitions:
+                state = self.failures[state]
+            state = self.transitions.get((state, word), 0)
+            output_state = state if state in self.outputs else self.output_links[state]
+            while output_state > 0:
+                start = word_spans[len(word_spans) - self.depths[output_state]][0]
+                for output_key in self.outputs[output_state]:
+                    if key is None or output_key == key:
+                        occurrences.append(AnswerOccurrence(output_key, start, match.end()))
+                output_state = self.output_links[output_state]
+        return occurrences
+
+    def find_spans(self, text, key):
+        """Find the (start, end) spans of the answer with the given key in text."""
+        return sorted(set((occ.start, occ.end) for occ in self.find(text, key)))
+
+    def annotate_snippets(self, snippets, key):
+        """
+        Find the spans of the answer with the given key in each snippet.
+
+        :type snippets: list[unicode]
+        :rtype: list[list[(int, int)]]
+        """
+        return [self.find_spans(snippet, key) for snippet in snippets]
+
+
+def get_answer_variants(answer):
+    """
+    Get word sequences of the answer with and without its parenthesized parts and leading article.
+
+    :param answer: Jeopardy answer, which can include HTML tags like <i>
+    :type answer: unicode
+    :rtype: list[tuple[unicode]]
+    """
+    answer = BeautifulSoup(to_unicode(answer), 'html.parser').text
+    texts = [answer, PARENTHESIZED_PATTERN.sub(u' ', answer), answer.replace(u'(', u' ').replace(u')', u' ')]
+    variants = []
+    for text in texts:
+        words = tuple(normalize_word(word) for word in WORD_PATTERN.findall(text))
+        if words and words[0] in LEADING_ARTICLES and len(words) > 1:
+            add_if_new(variants, words[1:])
+        if words:
+            add_if_new(variants, words)
+    return variants
+
+
+def add_if_new(variants, words):
+    if words not in variants:
+        variants.append(words)
+
+
+def normalize_word(word):
+    """Lowercase and remove accents, e.g. u'Caf\xe9' -> u'cafe'."""
+    word = word.lower()
+    if all(ord(ch) < 128 for ch in word):
+        return word
+    decomposed = unicodedata.normalize('NFKD', word)
+    return u''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def to_unicode(text):
+    if isinstance(text, bytes):
+        return text.decode('utf-8', 'ignore')
+    return text
+
+
+def annotate_output_files(file_paths, output_folder):
+    """
+    Annotate snippets of crawler output files with the spans of their entry's answer.
+
+    Each entry's snippets are scanned with an automaton over the variants of its own answer only, as the spans of
+    other answers are not kept. Meant to be called with a batch of files in a worker process.
+
+    :param file_paths: paths of crawler's JSON output files
+    :type file_paths: list[str]
+    :param output_folder: folder to write annotated files into
+    :type output_folder: str
+    :return: number of annotated snippets and the number of snippets that contain their answer
+    :rtype: (int, int)
+    """
+    num_snippets, num_answer_snippets = 0, 0
+    for file_path in file_paths:
+        with open(file_path, 'rt') as f:
+            output = json.load(f)
+        matcher = AnswerMatcher.from_answers([(output['id'], output['answer'])])
+        for result in output['search_results']:
+            result['answer_spans'] = matcher.find_spans(result['snippet'], output['id'])
+            num_snippets += 1
+            num_answer_snippets += bool(result['answer_spans'])
+        with open(os.path.join(output_folder, os.path.basename(file_path)), 'wt') as f:
+            json.dump(output, f, indent=4)
+    return num_snippets, num_answer_snippets
+
+
+def annotate_batch(batch):
+    return annotate_output_files(*batch)
+
+
+def annotate_crawl(input_folder, output_folder, processes=None, batch_size=256):
+    """
+    Annotate all crawler output files in input_folder in parallel.
+
+    :rtype: (int, int)
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    file_paths = crawler.list_output_files(input_folder)
+    batches = [(file_paths[no:no + batch_size], output_folder) for no in range(0, len(file_paths), batch_size)]
+    pool = multiprocessing.Pool(processes=processes)
+    num_snippets, num_answer_snippets = 0, 0
+    try:
+        for batch_num_snippets, batch_num_answer_snippets in pool.imap_unordered(annotate_batch, batches):
+            num_snippets += batch_num_snippets
+            num_answer_snippets += batch_num_answer_snippets
+    finally:
+        pool.close()
+        pool.join()
+    return num_snippets, num_answer_snippets
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Annotate snippets with the occurrences of their answers')
+    argparser.add_argument('-i', '--input-folder', type=str, required=True,
+                           help='Folder of crawler output files')
+    argparser.add_argument('-o', '--output-folder', type=str, required=True,
+                           help='Folder to write annotated files into. '
+                                'If given folder does not exist it will be created first.')
+    argparser.add_argument('-p', '--processes', type=int, default=None,
+                           help='Number of worker processes. Defaults to the number of CPUs.')
+    argparser.add_argument('-b', '--batch-size', type=int, default=256,
+                           help='Number of files whose answers are matched by one automaton')
+    args = argparser.parse_args()
+    return args
+
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s')
+    start = time.time()
+    num_snippets, num_answer_snippets = annotate_crawl(args.input_folder, args.output_folder,
+                                                       processes=args.processes, batch_size=args.batch_size)
+    logging.info('%d of %d snippets contain their answer. Annotated in %.1f seconds.' %
+                 (num_answer_snippets, num_snippets, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
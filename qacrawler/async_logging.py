@@ -0,0 +1,210 @@
+"""
+Asynchronous structured logging with size-rotated, compressed log files.
+
+Logging calls on crawling threads only create a record and put it onto an in-memory queue (QueueHandler). A
+listener thread (QueueListener) formats records as compact JSON lines and writes them into a log file that is
+rotated when it reaches a size, with rotated files compressed by gzip (GzipRotatingFileHandler). Formatting the
+message with its arguments also happens on the listener thread, hence calls should pass arguments rather than
+formatted strings, e.g. logging.debug('parsing result %s', title).
+
+DEBUG records of chatty modules can be sampled (DebugSamplingFilter), e.g. only every 100th record of sr_parser.
+If the queue is full, records are dropped instead of blocking the crawl, and the number of dropped records is
+logged later.
+
+Python 2 has no logging.handlers.QueueHandler or QueueListener, hence they are implemented here.
+"""
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import Queue
+import shutil
+import threading
+
+_STOP = object()
+
+
+class QueueHandler(logging.Handler):
+    """Puts log records onto a queue without formatting them."""
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.num_dropped = 0
+
+    def emit(self, record):
+        if record.exc_info:
+            # Tracebacks are formatted here, because exc_info can not outlive the except block it is raised in.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.num_dropped += 1
+
+
+class QueueListener(object):
+    """Thread that takes records from a queue and hands them over to handlers."""
+    def __init__(self, queue, handlers, queue_handler=None):
+        """
+        :type queue: Queue.Queue
+        :type handlers: list[logging.Handler]
+        :param queue_handler: if given, the number of records it dropped is logged
+        :type queue_handler: QueueHandler
+        """
+        self.queue = queue
+        self.handlers = handlers
+        self.queue_handler = queue_handler
+        self.num_reported_drops = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.monitor, name='log-listener')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                return
+            self.report_drops()
+            self.handle(record)
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def report_drops(self):
+        if self.queue_handler is None or self.queue_handler.num_dropped == self.num_reported_drops:
+            return
+        num_dropped = self.queue_handler.num_dropped
+        record = logging.LogRecord('async_logging', logging.WARNING, __file__, 0,
+                                   'Log queue was full, dropped %d records.', (num_dropped - self.num_reported_drops,),
+                                   None, 'report_drops')
+        self.num_reported_drops = num_dropped
+        self.handle(record)
+
+    def stop(self):
+        """Write the queued records and stop the thread."""
+        if self.thread is None:
+            return
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+        for handler in self.handlers:
+            handler.close()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a compact JSON line."""
+    def format(self, record):
+        entry = {'time': round(record.created, 3),
+                 'level': record.levelname,
+                 'module': record.module,
+                 'function': record.funcName,
+                 'thread': record.threadName,
+                 'message': record.getMessage()}
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, separators=(',', ':'))
+
+
+class GzipRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler of which rotated files are compressed: LOG.1.gz is the newest rotated file and
+    LOG.BACKUP_COUNT.gz the oldest.
+    """
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        for no in range(self.backupCount - 1, 0, -1):
+            source = '%s.%d.gz' % (self.baseFilename, no)
+            if os.path.exists(source):
+                os.rename(source, '%s.%d.gz' % (self.baseFilename, no + 1))
+        if self.backupCount > 0 and os.path.exists(self.baseFilename):
+            with open(self.baseFilename, 'rb') as source, gzip.open(self.baseFilename + '.1.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(self.baseFilename)
+        self.mode = 'w'
+        self.stream = self._open()
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps every n-th DEBUG record of sampled modules, and all other records."""
+    def __init__(self, sampling_rates):
+        """
+        :param sampling_rates: module name -> ratio of DEBUG records to keep, e.g. {'sr_parser': 0.01}
+        :type sampling_rates: dict[str, float]
+        """
+        logging.Filter.__init__(self)
+        self.intervals = dict((module, max(1, int(round(1.0 / rate))) if rate > 0 else None)
+                              for module, rate in sampling_rates.items())
+        self.counts = dict((module, 0) for module in sampling_rates)
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG or record.module not in self.intervals:
+            return True
+        interval = self.intervals[record.module]
+        if interval is None:
+            return False
+        with self.lock:
+            count = self.counts[record.module]
+            self.counts[record.module] = count + 1
+        return count % interval == 0
+
+
+def parse_sampling_rates(specifications):
+    """Parse MODULE=RATE specifications, e.g. ['sr_parser=0.01'] -> {'sr_parser': 0.01}
+
+    :type specifications: list[str]
+    :rtype: dict[str, float]
+    """
+    sampling_rates = {}
+    for specification in specifications:
+        module, _, rate = specification.partition('=')
+        try:
+            sampling_rates[module] = float(rate)
+        except ValueError:
+            raise ValueError('Debug sampling must be given as MODULE=RATE, e.g. sr_parser=0.01, not %s.' %
+                             specification)
+    return sampling_rates
+
+
+def configure_async_logging(log_file, level=logging.INFO, max_bytes=50 * 1024 * 1024, backup_count=20,
+                            sampling_rates=None, queue_size=100000):
+    """
+    Send the records of the root logger through a queue to a listener thread that writes JSON lines into log_file.
+
+    :param log_file: path to log file
+    :type log_file: str
+    :param level: the level below which records are ignored
+    :type level: int
+    :param max_bytes: the size at which the log file is rotated
+    :type max_bytes: int
+    :param backup_count: number of compressed rotated files kept
+    :type backup_count: int
+    :param sampling_rates: module name -> ratio of DEBUG records to keep
+    :type sampling_rates: dict[str, float]
+    :param queue_size: maximum number of records waiting to be written
+    :type queue_size: int
+    :return: the started listener, which is also stopped at exit
+    :rtype: QueueListener
+    """
+    queue = Queue.Queue(maxsize=queue_size)
+    queue_handler = QueueHandler(queue)
+    if sampling_rates:
+        queue_handler.addFilter(DebugSamplingFilter(sampling_rates))
+    file_handler = GzipRotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+    file_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(queue, [file_handler], queue_handler=queue_handler)
+    listener.start()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    atexit.register(listener.stop)
+    return listener
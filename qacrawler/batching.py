@@ -0,0 +1,272 @@
+"""
+Length-bucketed batches of packed SearchQA data for training.
+
+Each question has a variable number of snippets of variable length, hence batches of randomly chosen questions are
+mostly padding. BucketBatchIterator reads a packed dataset with token ids (see packed_dataset.py), and:
+
+- drops questions with min_snippets - 1 (40) or fewer snippets and keeps the first max_snippets (50) snippets, as in
+  training (see the top level README). Snippets without tokens are not counted.
+- shuffles the questions, sorts each pool of pool_size batches by the length of their longest snippet, cuts pools
+  into batches and shuffles the batches, hence questions in a batch have similar lengths and epochs still differ.
+- builds padded numpy arrays of batches on background worker processes, prefetch batches ahead.
+
+Batches are plain numpy arrays, which torch.from_numpy can wrap without copying, but nothing here depends on PyTorch.
+Padding uses the id of tokenization.Vocabulary.PADDING.
+
+Example command to measure the throughput of batching a packed dataset.
+
+$ python batching.py --packed-file crawl.sqa --batch-size 32 --workers 4
+"""
+import argparse
+import collections
+import logging
+import multiprocessing
+import random
+import time
+
+import numpy
+
+import packed_dataset
+
+Batch = collections.namedtuple('Batch', ['entry_ids', 'questions', 'question_lengths', 'answers', 'answer_lengths',
+                                         'snippets', 'snippet_lengths', 'num_tokens', 'num_padded_tokens'])
+PADDING_ID = 0  # id of tokenization.Vocabulary.PADDING, not looked up as tokenization imports nltk
+EntryLengths = collections.namedtuple('EntryLengths', ['no', 'num_snippets', 'max_snippet_length'])
+
+
+class BucketBatchIterator(object):
+    def __init__(self, dataset, batch_size=32, min_snippets=41, max_snippets=50, bucketing=True, pool_size=100,
+                 shuffle=True, seed=1, num_workers=0, prefetch=8):
+        """
+        :param dataset: packed dataset with token ids
+        :type dataset: packed_dataset.PackedDataset
+        :param batch_size: number of questions in a batch
+        :type batch_size: int
+        :param min_snippets: questions with fewer snippets are dropped
+        :type min_snippets: int
+        :param max_snippets: snippets after the first max_snippets are dropped
+        :type max_snippets: int
+        :param bucketing: whether to batch questions of similar lengths together
+        :type bucketing: bool
+        :param pool_size: number of batches sorted together when bucketing
+        :type pool_size: int
+        :param shuffle: whether to shuffle questions and batches in each epoch
+        :type shuffle: bool
+        :param num_workers: number of worker processes that build batches. If 0, batches are built when asked for.
+        :type num_workers: int
+        :param prefetch: number of batches built ahead by workers
+        :type prefetch: int
+        """
+        if not dataset.has_tokens:
+            raise ValueError('%s is packed without tokens.' % dataset.file_path)
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.max_snippets = max_snippets
+        self.bucketing = bucketing
+        self.pool_size = pool_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.entries = get_entry_lengths(dataset, min_snippets, max_snippets)
+        self.epoch = 0
+        self.num_tokens = 0
+        self.num_padded_tokens = 0
+        self.elapsed = 0.0
+
+    def __len__(self):
+        return (len(self.entries) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        """Iterate over the batches of the next epoch.
+
+        :rtype: generator[Batch]
+        """
+        entry_nos_of_batches = self.get_entry_nos_of_batches(random.Random(self.seed + self.epoch))
+        self.epoch += 1
+        if self.num_workers:
+            batches = self.build_batches_on_workers(entry_nos_of_batches)
+        else:
+            batches = (build_batch(self.dataset, entry_nos, self.max_snippets) for entry_nos in entry_nos_of_batches)
+        start = time.time()
+        try:
+            for batch in batches:
+                self.num_tokens += batch.num_tokens
+                self.num_padded_tokens += batch.num_padded_tokens
+                yield batch
+        finally:
+            self.elapsed += time.time() - start
+
+    def get_entry_nos_of_batches(self, generator):
+        """
+        :param generator: random number generator of the epoch
+        :type generator: random.Random
+        :return: entry numbers of each batch
+        :rtype: list[list[int]]
+        """
+        entries = list(self.entries)
+        if self.shuffle:
+            generator.shuffle(entries)
+        pool_length = self.batch_size * self.pool_size if self.bucketing else len(entries)
+        batches = []
+        for pool_start in range(0, len(entries), pool_length):
+            pool = entries[pool_start:pool_start + pool_length]
+            if self.bucketing:
+                pool.sort(key=lambda entry: (entry.max_snippet_length, entry.num_snippets))
+            batches.extend([entry.no for entry in pool[start:start + self.batch_size]]
+                           for start in range(0, len(pool), self.batch_size))
+        if self.shuffle:
+            generator.shuffle(batches)
+        return batches
+
+    def build_batches_on_workers(self, entry_nos_of_batches):
+        """Build batches on worker processes, keeping at most prefetch batches in flight, and yield them in order."""
+        pool = multiprocessing.Pool(processes=self.num_workers, initializer=initialize_worker,
+                                    initargs=(self.dataset, self.max_snippets))
+        pending = collections.deque()
+        try:
+            for entry_nos in entry_nos_of_batches:
+                pending.append(pool.apply_async(build_batch_on_worker, (entry_nos,)))
+                if len(pending) >= self.prefetch:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @property
+    def tokens_per_second(self):
+        """Number of (not padding) tokens batched per second of iteration."""
+        return self.num_tokens / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def padding_ratio(self):
+        """Ratio of padding in the batched arrays."""
+        if not self.num_padded_tokens:
+            return 0.0
+        return 1.0 - float(self.num_tokens) / self.num_padded_tokens
+
+
+def get_entry_lengths(dataset, min_snippets, max_snippets):
+    """
+    Get the lengths of the entries that have at least min_snippets snippets, by reading the offset tables only.
+
+    :type dataset: packed_dataset.PackedDataset
+    :rtype: list[EntryLengths]
+    """
+    entry_string_offsets = read_offset_table(dataset, dataset.entry_string_offsets_offset, dataset.size)
+    string_lengths = numpy.diff(read_offset_table(dataset, dataset.token_offsets_offset, dataset.num_strings))
+    entries = []
+    for no in range(dataset.size):
+        first, last = entry_string_offsets[no], entry_string_offsets[no + 1]
+        snippet_lengths = string_lengths[first + 2:last]
+        snippet_lengths = snippet_lengths[snippet_lengths > 0][:max_snippets]
+        if len(snippet_lengths) >= min_snippets:
+            max_snippet_length = int(snippet_lengths.max()) if len(snippet_lengths) else 0
+            entries.append(EntryLengths(no, len(snippet_lengths), max_snippet_length))
+    return entries
+
+
+def read_offset_table(dataset, table_offset, num_items):
+    return numpy.frombuffer(dataset.mmap, dtype='<u8', count=num_items + 1, offset=table_offset).astype(numpy.int64)
+
+
+def build_batch(dataset, entry_nos, max_snippets):
+    """
+    Read the token ids of entries and pad them into arrays.
+
+    :type dataset: packed_dataset.PackedDataset
+    :rtype: Batch
+    """
+    questions, answers, snippets = [], [], []
+    for no in entry_nos:
+        token_ids = dataset.get_token_ids(no)
+        questions.append(token_ids[0])
+        answers.append(token_ids[1])
+        snippets.append([ids for ids in token_ids[2:] if len(ids)][:max_snippets])
+    question_array, question_lengths = pad(questions)
+    answer_array, answer_lengths = pad(answers)
+    num_snippets = max(len(entry_snippets) for entry_snippets in snippets)
+    max_snippet_length = max(len(ids) for entry_snippets in snippets for ids in entry_snippets) if num_snippets else 0
+    snippet_array = numpy.full((len(entry_nos), num_snippets, max_snippet_length), PADDING_ID,
+                               dtype=numpy.int32)
+    snippet_lengths = numpy.zeros((len(entry_nos), num_snippets), dtype=numpy.int32)
+    for batch_no, entry_snippets in enumerate(snippets):
+        for snippet_no, ids in enumerate(entry_snippets):
+            snippet_array[batch_no, snippet_no, :len(ids)] = ids
+            snippet_lengths[batch_no, snippet_no] = len(ids)
+    entry_ids = numpy.array([dataset.get_entry_id(no) for no in entry_nos], dtype=numpy.int64)
+    num_tokens = int(question_lengths.sum() + answer_lengths.sum() + snippet_lengths.sum())
+    num_padded_tokens = question_array.size + answer_array.size + snippet_array.size
+    return Batch(entry_ids, question_array, question_lengths, answer_array, answer_lengths, snippet_array,
+                 snippet_lengths, num_tokens, num_padded_tokens)
+
+
+def pad(sequences):
+    """
+    :return: sequences padded into a 2D array, and their lengths
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    lengths = numpy.array([len(ids) for ids in sequences], dtype=numpy.int32)
+    array = numpy.full((len(sequences), lengths.max() if len(sequences) else 0), PADDING_ID,
+                       dtype=numpy.int32)
+    for no, ids in enumerate(sequences):
+        array[no, :len(ids)] = ids
+    return array, lengths
+
+
+_worker_dataset = None
+_worker_max_snippets = None
+
+
+def initialize_worker(dataset, max_snippets):
+    global _worker_dataset, _worker_max_snippets
+    _worker_dataset = dataset
+    _worker_max_snippets = max_snippets
+
+
+def build_batch_on_worker(entry_nos):
+    return build_batch(_worker_dataset, entry_nos, _worker_max_snippets)
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Measure the throughput of batching packed SearchQA data')
+    argparser.add_argument('-p', '--packed-file', type=str, required=True,
+                           help='Path of a packed dataset file with token ids')
+    argparser.add_argument('-b', '--batch-size', type=int, default=32,
+                           help='Number of questions in a batch')
+    argparser.add_argument('-w', '--workers', type=int, default=0,
+                           help='Number of worker processes that build batches')
+    argparser.add_argument('-e', '--epochs', type=int, default=1,
+                           help='Number of epochs to iterate')
+    argparser.add_argument('--no-bucketing', action='store_true',
+                           help='When included batches are made of randomly chosen questions')
+    args = argparser.parse_args()
+    return args
+
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s')
+    dataset = packed_dataset.PackedDataset(args.packed_file)
+    iterator = BucketBatchIterator(dataset, batch_size=args.batch_size, bucketing=not args.no_bucketing,
+                                   num_workers=args.workers)
+    logging.info('%d of %d questions have enough snippets, %d batches per epoch.' %
+                 (len(iterator.entries), len(dataset), len(iterator)))
+    for epoch in range(args.epochs):
+        for _ in iterator:
+            pass
+        logging.info('Epoch %d: %.0f tokens per second, %.1f%% padding.' %
+                     (epoch, iterator.tokens_per_second, 100 * iterator.padding_ratio))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,12 @@ Module to crawl entries and save the results.
 import json
 import logging
 import os
+import time
 
 import sr_parser
 
+TOKENIZED_SUFFIX = '-tok.json'  # tokenized copies of outputs, see tokenization.py
+
 
 def crawl(settings, entries):
     """
@@ -19,14 +22,18 @@ def crawl(settings, entries):
     :return:
     """
     for entry in entries:
+        if settings.watchdog is not None:
+            settings.watchdog.wait_while_paused()
         logging.info('Question no %06d: %s. Crawl!' % (entry.id, entry.question))
         results = sr_parser.collect_query_results_from_google(entry.question, settings)
         logging.info('Question no %06d. Collected %d search results.' % (entry.id, len(results)))
         if results:
-            save_results_for_entry(results, entry, settings.output_folder)
+            save_results_for_entry(results, entry, settings.output_folder, interner=settings.interner,
+                                   sinks=settings.sinks)
 
 
-def save_results_for_entry(results, entry, output_folder, file_type='json'):
+def save_results_for_entry(results, entry, output_folder, file_type='json', interner=None, sinks=(),
+                           crawled_at=None):
     """
     Format search results into json or tsv and save them to a file.
 
@@ -38,10 +45,18 @@ def save_results_for_entry(results, entry, output_folder, file_type='json'):
     :type output_folder: str
     :param file_type: the type of the saved file. Can only have values ['json', 'tsv']
     :type file_type: str
+    :param interner: if given, urls, hosts and titles are saved as ids of the interner (only for json)
+    :type interner: interning.CrawlInterner
+    :param sinks: objects with an add(entry, results) method that also receive the results, e.g. a database
+    :type sinks: list[result_store.ResultStore]
+    :param crawled_at: when the results page was crawled, as seconds since the epoch. Defaults to now.
+    :type crawled_at: float
     :rtype: None
     """
     if file_type == 'json':
-        formatted_results = results_list_to_output(results, entry)
+        formatted_results = results_list_to_output(results, entry, interner, crawled_at=crawled_at)
+        if interner is not None:
+            interner.save()  # save new strings before the output that refers to them
     else:
         formatted_results = results_list_to_tsv(results)
 
@@ -50,26 +65,57 @@ def save_results_for_entry(results, entry, output_folder, file_type='json'):
     file_path = os.path.join(file_folder, file_name)
     with open(file_path, 'wt') as f:
         f.write(formatted_results)
+    for sink in sinks:
+        sink.add(entry, results)
+
+
+def close_sinks(settings):
+    """Write what the result sinks of the settings buffer and close them."""
+    for sink in settings.sinks:
+        sink.close()
 
 
-def results_list_to_output(results, entry):
+def results_list_to_output(results, entry, interner=None, crawled_at=None):
     """
     Format a list of SearchResults into a JSON string.
 
     :param results: a list of SearchResults
     :type results: list[sr_parser.SearchResult]
-    :param entry: Jeopardy entry
+    :param entry: Jeopardy entry. If None, only search results are formatted.
     :type entry: jeopardy.Entry
+    :param interner: if given, urls, hosts and titles are formatted as their ids
+    :type interner: interning.CrawlInterner
+    :param crawled_at: when the results page was crawled, as seconds since the epoch. Defaults to now.
+    :type crawled_at: float
     :return: string in JSON format
     :rtype: str
     """
-    result_dicts = [res.to_dict() for res in results]
-    output_dict = {'search_results': result_dicts}
-    output_dict.update(entry.to_dict())
+    if interner is not None:
+        result_dicts = [interner.intern_result(res) for res in results]
+    else:
+        result_dicts = [res.to_dict() for res in results]
+    output_dict = {'search_results': result_dicts, 'crawl_metadata': get_crawl_metadata(results, crawled_at)}
+    if entry is not None:
+        output_dict.update(entry.to_dict())
     results_json = json.dumps(output_dict, indent=4)  # Pretty-print via indent. Splits keys into multiple lines.
     return results_json
 
 
+def get_crawl_metadata(results, crawled_at=None):
+    """
+    Get the information to decide whether results need to be re-crawled (see refresh.py).
+
+    :type results: list[sr_parser.SearchResult]
+    :param crawled_at: when the results page was crawled, as seconds since the epoch. Defaults to now.
+    :type crawled_at: float
+    :rtype: dict
+    """
+    return {'crawled_at': crawled_at if crawled_at is not None else time.time(),
+            'num_results': len(results),
+            'num_snippets': sr_parser.count_snippets(results),
+            'parser_version': sr_parser.PARSER_VERSION}
+
+
 def results_list_to_tsv(results):
     """
     Format a list of SearchResults into a TSV (Tab Separated Values) string.
@@ -89,6 +135,13 @@ def generate_filename(entry, extension):
     return filename
 
 
+def list_output_files(folder):
+    """Get paths of crawler's JSON output files in folder, in entry order."""
+    file_names = sorted(name for name in os.listdir(folder)
+                        if name.endswith('.json') and not name.endswith(TOKENIZED_SUFFIX))
+    return [os.path.join(folder, name) for name in file_names]
+
+
 # TODO have a process pipeline
 def process_pipeline():
     pass
@@ -104,7 +157,8 @@ def process_pipeline():
 
 class CrawlerSettings:
     def __init__(self, driver, num_pages, output_folder, wait_duration,
-                 simulate_typing, simulate_clicking, disable_javascript):
+                 simulate_typing, simulate_clicking, disable_javascript, interner=None, pipeline=False,
+                 pagination_policy=None, watchdog=None, sinks=None, num_tabs=1, route=None):
         """
         Singleton class that holds configuration info for crawler.
 
@@ -122,6 +176,20 @@ class CrawlerSettings:
         :type simulate_typing: bool
         :param simulate_typing: indicates whether or not to simulate human mouse clicking
         :type simulate_clicking: bool
+        :param interner: if given, urls, hosts and titles in outputs are replaced with their interned ids
+        :type interner: interning.CrawlInterner
+        :param pipeline: indicates whether or not to parse and write on helper threads (see pipeline.crawl)
+        :type pipeline: bool
+        :param pagination_policy: if given, decides whether to request the next page by the number of snippets
+        :type pagination_policy: pagination.PaginationPolicy
+        :param watchdog: if given, watches the parse yield of pages and pauses the crawl when it drops
+        :type watchdog: watchdog.ParseWatchdog
+        :param sinks: objects with add(entry, results) and close() methods that also receive saved results
+        :type sinks: list[result_store.ResultStore]
+        :param num_tabs: number of queries crawled at once in the tabs of the driver's browser (see tabs.crawl)
+        :type num_tabs: int
+        :param route: if given, the proxy route the driver's requests go through, which limits their rate
+        :type route: proxies.ProxyRoute
         """
         self.driver = driver
         self.num_pages = num_pages
@@ -130,3 +198,10 @@ class CrawlerSettings:
         self.simulate_typing = simulate_typing
         self.simulate_clicking = simulate_clicking
         self.disable_javascript = disable_javascript
+        self.interner = interner
+        self.pipeline = pipeline
+        self.pagination_policy = pagination_policy
+        self.watchdog = watchdog
+        self.sinks = sinks if sinks is not None else []
+        self.num_tabs = num_tabs
+        self.route = route
@@ -0,0 +1,408 @@
+"""
+Persistent secondary indexes over Jeopardy dataset fields, to select the entries to crawl by a filter expression.
+
+Indexed fields are category, round, air_date, show_number and value. For each field, the distinct keys are kept in
+sorted order with the list of entry numbers (postings) of each key, hence equality and range conditions are
+answered by binary search without scanning the dataset.
+
+Indexes are saved next to the dataset file: keys and the byte offset of each entry in the file in DATASET.idx.json,
+and postings in DATASET.idx.bin as little-endian 64-bit integers, whatever the size of a C long on the platform.
+They are rebuilt when the dataset file changes or were saved in another posting format. With the entry offsets, the
+selected entries are decoded from the file one at a time (see IndexedDataset), without loading the whole dataset.
+
+Filter expressions combine conditions with "and", "or", "not" and parentheses. A condition is FIELD OP VALUE,
+where OP is one of ==, !=, <, <=, >, >=, ~ (case-insensitive substring, for category families) or
+"in [VALUE, ...]". Values can be quoted. show_number and value are compared as numbers ($ and commas are ignored).
+Example:
+
+round == "Double Jeopardy!" and air_date >= 2000-01-01 and (category ~ history or value >= 1000)
+"""
+import argparse
+import array
+import bisect
+import json
+import os
+import re
+import struct
+
+import jeopardy
+
+INDEXED_FIELDS = ['category', 'round', 'air_date', 'show_number', 'value']
+NUMERIC_FIELDS = ['show_number', 'value']
+POSTING_TYPECODE = 'l'  # in memory only, saved postings are packed with POSTING_FORMAT
+POSTING_FORMAT = '<q'
+POSTING_SIZE = struct.calcsize(POSTING_FORMAT)
+WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
+
+
+class DatasetIndex(object):
+    """Sorted keys and postings of each indexed field of a dataset."""
+    def __init__(self, size, keys, postings, entry_offsets=None):
+        """
+        :param size: number of entries in the dataset
+        :type size: int
+        :param keys: field -> sorted distinct keys
+        :type keys: dict[str, list]
+        :param postings: field -> postings (sorted entry numbers) of keys, in the order of keys
+        :type postings: dict[str, list[array.array]]
+        :param entry_offsets: byte offsets where each entry starts in the dataset file, followed by where the last
+        one ends. None if the index is built from a loaded dataset.
+        :type entry_offsets: list[int]
+        """
+        self.size = size
+        self.keys = keys
+        self.postings = postings
+        self.entry_offsets = entry_offsets
+
+    @classmethod
+    def build(cls, dataset):
+        """
+        :type dataset: jeopardy.Dataset
+        :rtype: DatasetIndex
+        """
+        keys, postings = index_fields(dataset.data)
+        return cls(dataset.size, keys, postings)
+
+    @classmethod
+    def build_from_file(cls, dataset_path):
+        """Build the indexes of a dataset file, with the offsets of its entries.
+
+        :rtype: DatasetIndex
+        """
+        entry_dicts, entry_offsets = scan_dataset_file(dataset_path)
+        keys, postings = index_fields(entry_dicts)
+        return cls(len(entry_dicts), keys, postings, entry_offsets)
+
+    @classmethod
+    def load_or_build(cls, dataset_path):
+        """Load the saved indexes of the dataset file, or build and save them if they are missing or stale.
+
+        :rtype: DatasetIndex
+        """
+        index = cls.load(dataset_path)
+        if index is None or index.entry_offsets is None:
+            index = cls.build_from_file(dataset_path)
+            index.save(dataset_path)
+        return index
+
+    @classmethod
+    def load(cls, dataset_path):
+        """
+        :return: saved indexes of the dataset file or None if they are missing or stale
+        :rtype: DatasetIndex
+        """
+        keys_path, postings_path = get_index_paths(dataset_path)
+        if not os.path.exists(keys_path) or not os.path.exists(postings_path):
+            return None
+        with open(keys_path, 'rt') as f:
+            saved = json.load(f)
+        if saved['source'] != get_file_signature(dataset_path) or saved.get('posting_format') != POSTING_FORMAT:
+            return None
+        with open(postings_path, 'rb') as f:
+            data = f.read(saved['num_postings'] * POSTING_SIZE)
+        if len(data) != saved['num_postings'] * POSTING_SIZE:
+            return None
+        postings = {}
+        for field in INDEXED_FIELDS:
+            offsets = saved['offsets'][field]
+            postings[field] = [unpack_postings(data, offsets[no], offsets[no + 1])
+                               for no in range(len(offsets) - 1)]
+        return cls(saved['size'], saved['keys'], postings, saved.get('entry_offsets'))
+
+    def save(self, dataset_path):
+        keys_path, postings_path = get_index_paths(dataset_path)
+        offsets = {}
+        num_postings = 0
+        with open(postings_path, 'wb') as f:
+            for field in INDEXED_FIELDS:
+                offsets[field] = [num_postings]
+                for key_postings in self.postings[field]:
+                    f.write(struct.pack('<%dq' % len(key_postings), *key_postings))
+                    num_postings += len(key_postings)
+                    offsets[field].append(num_postings)
+        saved = {'source': get_file_signature(dataset_path), 'size': self.size, 'posting_format': POSTING_FORMAT,
+                 'num_postings': num_postings, 'keys': self.keys, 'offsets': offsets,
+                 'entry_offsets': self.entry_offsets}
+        with open(keys_path, 'wt') as f:
+            json.dump(saved, f)
+
+    def select(self, expression):
+        """
+        Get the numbers of entries that satisfy a filter expression.
+
+        :param expression: filter expression, e.g. 'round == "Jeopardy!" and value >= 1000'
+        :type expression: str
+        :return: sorted entry numbers
+        :rtype: list[int]
+        """
+        return sorted(FilterParser(expression, self).parse())
+
+    def lookup(self, field, operator, value):
+        """Get the set of entry numbers of which field satisfies the condition."""
+        if field not in INDEXED_FIELDS:
+            raise FilterSyntaxError('"%s" is not an indexed field. Indexed fields: %s' %
+                                    (field, ', '.join(INDEXED_FIELDS)))
+        keys = self.keys[field]
+        if operator == 'in':
+            return set().union(*[self.lookup(field, '==', item) for item in value])
+        if operator == '~':
+            value = value.lower()
+            matching_key_nos = [no for no, key in enumerate(keys) if value in (u'%s' % key).lower()]
+            return self.union_postings(field, matching_key_nos)
+        key = get_key(field, value)
+        if key is None:
+            raise FilterSyntaxError('"%s" is not a valid value for %s.' % (value, field))
+        if operator == '!=':
+            return set(range(self.size)) - self.lookup(field, '==', value)
+        ranges = {'==': (bisect.bisect_left(keys, key), bisect.bisect_right(keys, key)),
+                  '<': (0, bisect.bisect_left(keys, key)),
+                  '<=': (0, bisect.bisect_right(keys, key)),
+                  '>': (bisect.bisect_right(keys, key), len(keys)),
+                  '>=': (bisect.bisect_left(keys, key), len(keys))}
+        first, last = ranges[operator]
+        return self.union_postings(field, range(first, last))
+
+    def union_postings(self, field, key_nos):
+        entry_nos = set()
+        for no in key_nos:
+            entry_nos.update(self.postings[field][no])
+        return entry_nos
+
+
+class IndexedDataset(object):
+    """Dataset of which entries are decoded from the file by their offsets when they are asked for."""
+    def __init__(self, dataset_path, index):
+        """
+        :type dataset_path: str
+        :param index: indexes of the dataset file, with entry offsets
+        :type index: DatasetIndex
+        """
+        self.dataset_path = dataset_path
+        self.entry_offsets = index.entry_offsets
+        self.size = index.size
+        self.decoder = json.JSONDecoder()
+
+    def get_entry(self, no):
+        """
+        :param no: The number of entry, in the order they are saved in json file
+        :rtype: jeopardy.Entry
+        """
+        start, end = self.entry_offsets[no], self.entry_offsets[no + 1]
+        with open(self.dataset_path, 'rb') as f:
+            f.seek(start)
+            entry_json = f.read(end - start)
+        entry_dict, _ = self.decoder.raw_decode(entry_json)
+        return jeopardy.Entry(entry_dict=entry_dict, entry_id=no)
+
+
+class FilterParser(object):
+    """
+    Recursive descent parser that evaluates a filter expression into a set of entry numbers.
+
+    expression := term ("or" term)*
+    term := factor ("and" factor)*
+    factor := "not" factor | "(" expression ")" | FIELD OP VALUE | FIELD "in" "[" VALUE ("," VALUE)* "]"
+    """
+    TOKEN_PATTERN = re.compile(r'\s*(?:(==|!=|<=|>=|<|>|~|\(|\)|\[|\]|,)'  # symbols
+                               r'|"([^"]*)"|\'([^\']*)\''  # quoted values
+                               r'|([^\s()\[\],=!<>~]+))')  # words: field names, keywords and unquoted values
+
+    def __init__(self, expression, index):
+        self.index = index
+        self.tokens = self.tokenize(expression)
+        self.position = 0
+
+    def tokenize(self, expression):
+        tokens = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = FilterParser.TOKEN_PATTERN.match(expression, position)
+            if match is None:
+                raise FilterSyntaxError('Cannot parse filter at: %s' % expression[position:])
+            symbol, double_quoted, single_quoted, word = match.groups()
+            if symbol is not None:
+                tokens.append(('symbol', symbol))
+            elif word is not None:
+                tokens.append(('word', word))
+            else:
+                tokens.append(('value', double_quoted if double_quoted is not None else single_quoted))
+            position = match.end()
+        return tokens
+
+    def parse(self):
+        entry_nos = self.parse_expression()
+        if self.position != len(self.tokens):
+            raise FilterSyntaxError('Unexpected "%s" in filter.' % self.tokens[self.position][1])
+        return entry_nos
+
+    def parse_expression(self):
+        entry_nos = self.parse_term()
+        while self.accept_word('or'):
+            entry_nos = entry_nos | self.parse_term()
+        return entry_nos
+
+    def parse_term(self):
+        entry_nos = self.parse_factor()
+        while self.accept_word('and'):
+            entry_nos = entry_nos & self.parse_factor()
+        return entry_nos
+
+    def parse_factor(self):
+        if self.accept_word('not'):
+            return set(range(self.index.size)) - self.parse_factor()
+        if self.accept_symbol('('):
+            entry_nos = self.parse_expression()
+            self.expect_symbol(')')
+            return entry_nos
+        field = self.next_token('field name')[1]
+        if self.accept_word('in'):
+            self.expect_symbol('[')
+            values = [self.next_value()]
+            while self.accept_symbol(','):
+                values.append(self.next_value())
+            self.expect_symbol(']')
+            return self.index.lookup(field, 'in', values)
+        kind, operator = self.next_token('operator')
+        if kind != 'symbol' or operator not in ('==', '!=', '<', '<=', '>', '>=', '~'):
+            raise FilterSyntaxError('Expected an operator after %s but found "%s".' % (field, operator))
+        return self.index.lookup(field, operator, self.next_value())
+
+    def next_value(self):
+        kind, value = self.next_token('value')
+        if kind == 'symbol':
+            raise FilterSyntaxError('Expected a value but found "%s".' % value)
+        return value
+
+    def next_token(self, expected):
+        if self.position == len(self.tokens):
+            raise FilterSyntaxError('Expected a %s at the end of filter.' % expected)
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def accept_word(self, word):
+        if self.position < len(self.tokens) and self.tokens[self.position] == ('word', word):
+            self.position += 1
+            return True
+        return False
+
+    def accept_symbol(self, symbol):
+        if self.position < len(self.tokens) and self.tokens[self.position] == ('symbol', symbol):
+            self.position += 1
+            return True
+        return False
+
+    def expect_symbol(self, symbol):
+        if not self.accept_symbol(symbol):
+            raise FilterSyntaxError('Expected "%s" in filter.' % symbol)
+
+
+class FilterSyntaxError(Exception):
+    pass
+
+
+def index_fields(entry_dicts):
+    """
+    :type entry_dicts: list[dict]
+    :return: field -> sorted distinct keys, and field -> postings of keys
+    :rtype: (dict[str, list], dict[str, list[array.array]])
+    """
+    keys, postings = {}, {}
+    for field in INDEXED_FIELDS:
+        entry_nos_by_key = {}
+        for no, entry_dict in enumerate(entry_dicts):
+            key = get_key(field, entry_dict.get(field))
+            if key is not None:
+                entry_nos_by_key.setdefault(key, []).append(no)
+        keys[field] = sorted(entry_nos_by_key)
+        postings[field] = [array.array(POSTING_TYPECODE, entry_nos_by_key[key]) for key in keys[field]]
+    return keys, postings
+
+
+def scan_dataset_file(dataset_path):
+    """Decode the entries of a dataset file, a JSON array of entries, with their byte offsets in the file.
+
+    :return: entry dicts, and the offsets where each entry starts followed by where the last one ends
+    :rtype: (list[dict], list[int])
+    """
+    with open(dataset_path, 'rb') as f:
+        text = f.read()
+    decoder = json.JSONDecoder()
+    position = WHITESPACE_PATTERN.match(text).end()
+    if text[position:position + 1] != '[':
+        raise ValueError('%s is not a JSON array of entries.' % dataset_path)
+    position = WHITESPACE_PATTERN.match(text, position + 1).end()
+    entry_dicts, entry_offsets, end = [], [], position
+    while text[position:position + 1] != ']':
+        if entry_dicts:
+            if text[position:position + 1] != ',':
+                raise ValueError('Expected "," at byte %d of %s.' % (position, dataset_path))
+            position = WHITESPACE_PATTERN.match(text, position + 1).end()
+        entry_offsets.append(position)
+        entry_dict, end = decoder.raw_decode(text, position)
+        entry_dicts.append(entry_dict)
+        position = WHITESPACE_PATTERN.match(text, end).end()
+    entry_offsets.append(end)
+    return entry_dicts, entry_offsets
+
+
+def get_key(field, value):
+    """Convert a field value into its index key. Numeric fields become integers, e.g. '$1,200' -> 1200.
+
+    :return: index key or None if the value is missing or not valid
+    """
+    if value is None:
+        return None
+    if field in NUMERIC_FIELDS:
+        digits = value.replace('$', '').replace(',', '').strip() if isinstance(value, basestring) else value
+        try:
+            return int(digits)
+        except ValueError:
+            return None
+    return value
+
+
+def unpack_postings(data, start, end):
+    """Get postings start to end of the saved postings."""
+    return array.array(POSTING_TYPECODE, struct.unpack_from('<%dq' % (end - start), data, start * POSTING_SIZE))
+
+
+def get_index_paths(dataset_path):
+    return dataset_path + '.idx.json', dataset_path + '.idx.bin'
+
+
+def get_file_signature(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def select_entries(dataset_path, expression):
+    """
+    Get the numbers of dataset entries that satisfy a filter expression, using the saved indexes of the dataset.
+
+    The dataset is not loaded: the selected entries are decoded from the file when they are asked for.
+
+    :return: the dataset and the sorted numbers of the selected entries
+    :rtype: (IndexedDataset, list[int])
+    """
+    index = DatasetIndex.load_or_build(dataset_path)
+    return IndexedDataset(dataset_path, index), index.select(expression)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Build the indexes of a Jeopardy dataset and test a filter')
+    argparser.add_argument('-j', '--jeopardy-json', type=str, required=True,
+                           help='Path to Jeopardy dataset file')
+    argparser.add_argument('--filter', type=str, default=None,
+                           help='Filter expression, e.g. \'round == "Final Jeopardy!" and air_date >= 2000\'')
+    args = argparser.parse_args()
+    index = DatasetIndex.build_from_file(args.jeopardy_json)
+    index.save(args.jeopardy_json)
+    if args.filter:
+        entry_nos = index.select(args.filter)
+        print('%d entries. First ones: %s' % (len(entry_nos), entry_nos[:10]))
+
+
+if __name__ == '__main__':
+    main()
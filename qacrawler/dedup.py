@@ -0,0 +1,282 @@
+"""
+Near-duplicate snippet detection and deduplicated storage of crawl outputs.
+
+Near-duplicates are found by MinHash signatures of word shingles and Locality Sensitive Hashing (LSH): signatures
+are split into bands and snippets that share a band are candidates, whose estimated Jaccard similarity is then
+compared with a threshold. Detection works within a query's results (deduplicate_results) and across a whole crawl
+(NearDuplicateIndex).
+
+Deduplicated storage keeps every distinct snippet once in snippets.jsonl (line number is the snippet id) and
+replaces snippets in output files with their snippet_id. Result order is kept. Near-duplicates are not merged,
+only marked with the id of the snippet they are near-duplicate of, hence storage is lossless.
+
+Example command to deduplicate a crawl.
+
+$ python dedup.py --input-folder OUTPUT_FOLDER --output-folder DEDUPLICATED_FOLDER --threshold 0.8
+"""
+import argparse
+import codecs
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import zlib
+
+import crawler
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+SNIPPETS_FILE_NAME = 'snippets.jsonl'
+
+
+class MinHasher(object):
+    """Computes MinHash signatures of texts with num_permutations universal hash functions."""
+    def __init__(self, num_permutations=64, shingle_size=3, seed=1):
+        generator = random.Random(seed)
+        self.permutations = [(generator.randint(1, MERSENNE_PRIME - 1), generator.randint(0, MERSENNE_PRIME - 1))
+                             for _ in range(num_permutations)]
+        self.shingle_size = shingle_size
+
+    def get_signature(self, text):
+        """
+        :type text: unicode
+        :return: MinHash signature. Empty if the text has no words.
+        :rtype: tuple[int]
+        """
+        shingles = get_shingles(text, self.shingle_size)
+        if not shingles:
+            return ()
+        return tuple(min(((a * shingle + b) % MERSENNE_PRIME) & MAX_HASH for shingle in shingles)
+                     for a, b in self.permutations)
+
+
+class NearDuplicateIndex(object):
+    """
+    LSH index of MinHash signatures.
+
+    Only the signatures of first-seen snippets are kept, later near-duplicates are reported as duplicates of them.
+    Each bucket keeps the keys of all texts that share its band, and candidates from all buckets of a text are
+    verified by their estimated similarity, hence a removed text does not hide the other texts of its buckets.
+    """
+    def __init__(self, threshold=0.8, num_permutations=64, num_bands=8, shingle_size=3):
+        """
+        :param threshold: minimum estimated Jaccard similarity of shingles to be near-duplicates
+        :type threshold: float
+        :param num_permutations: length of MinHash signatures
+        :type num_permutations: int
+        :param num_bands: number of LSH bands. Must divide num_permutations. More bands find less similar candidates.
+        :type num_bands: int
+        """
+        if num_permutations % num_bands:
+            raise ValueError('num_bands (%d) must divide num_permutations (%d).' % (num_bands, num_permutations))
+        self.threshold = threshold
+        self.hasher = MinHasher(num_permutations, shingle_size)
+        self.num_bands = num_bands
+        self.rows_per_band = num_permutations // num_bands
+        self.buckets = {}
+        self.signatures = {}
+
+    def find_or_add(self, key, text):
+        """
+        Find a near-duplicate of text among the added texts. If there is none, add text with key.
+
+        :param key: identifier of the text, e.g. a snippet id
+        :param text: snippet text
+        :type text: unicode
+        :return: key of the near-duplicate text, or None if text is added as a new one
+        """
+        signature = self.hasher.get_signature(text)
+        if not signature:
+            return None
+        bands = self.get_bands(signature)
+        near_duplicate = self.find_most_similar(signature, bands)
+        if near_duplicate is not None:
+            return near_duplicate
+        self.signatures[key] = signature
+        for band in bands:
+            self.buckets.setdefault(band, []).append(key)
+        return None
+
+    def find_most_similar(self, signature, bands):
+        """
+        :return: key of the candidate in the buckets of bands that is the most similar to signature, if it is at
+        least as similar as threshold, else None
+        """
+        best_key, best_similarity = None, self.threshold
+        checked = set()
+        for band in bands:
+            for candidate in self.buckets.get(band, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = estimate_similarity(signature, self.signatures[candidate])
+                if similarity >= best_similarity:
+                    best_key, best_similarity = candidate, similarity
+        return best_key
+
+    def remove(self, key):
+        """Remove the text with key, e.g. when its snippet is dropped. Later texts are not compared with it."""
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for band in self.get_bands(signature):
+            bucket = self.buckets[band]
+            bucket.remove(key)
+            if not bucket:
+                del self.buckets[band]
+
+    def get_bands(self, signature):
+        rows = self.rows_per_band
+        return [(no, hash(signature[no * rows:(no + 1) * rows])) for no in range(self.num_bands)]
+
+
+class SnippetStore(object):
+    """Keeps every distinct snippet once and gives it an integer id."""
+    def __init__(self):
+        self.snippets = []
+        self.snippet_ids = {}
+
+    def add(self, snippet):
+        """
+        :return: id of the snippet and whether it is seen for the first time
+        :rtype: (int, bool)
+        """
+        digest = hashlib.md5(snippet.encode('utf-8')).digest()
+        snippet_id = self.snippet_ids.get(digest)
+        if snippet_id is not None:
+            return snippet_id, False
+        snippet_id = len(self.snippets)
+        self.snippet_ids[digest] = snippet_id
+        self.snippets.append(snippet)
+        return snippet_id, True
+
+    def get(self, snippet_id):
+        return self.snippets[snippet_id]
+
+    def save(self, file_path):
+        with codecs.open(file_path, 'w', encoding='utf-8') as f:
+            for snippet in self.snippets:
+                f.write(json.dumps(snippet) + u'\n')
+
+    @classmethod
+    def load(cls, file_path):
+        store = cls()
+        with codecs.open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                store.add(json.loads(line))
+        return store
+
+
+def deduplicate_results(results, threshold=0.8):
+    """
+    Drop the results of a query whose snippets are near-duplicates of an earlier result's snippet.
+
+    :param results: a list of SearchResults in rank order
+    :type results: list[sr_parser.SearchResult]
+    :rtype: list[sr_parser.SearchResult]
+    """
+    index = NearDuplicateIndex(threshold=threshold)
+    return [res for no, res in enumerate(results)
+            if not res.snippet or index.find_or_add(no, to_unicode(res.snippet)) is None]
+
+
+def deduplicate_crawl(input_folder, output_folder, threshold=0.8):
+    """
+    Write deduplicated copies of crawler outputs and the snippet store into output_folder.
+
+    Each search result's snippet is replaced with snippet_id. Results whose snippet is a near-duplicate of an
+    earlier snippet in the crawl get near_duplicate_of, the id of that snippet.
+
+    :return: the number of snippets and the number of distinct snippets
+    :rtype: (int, int)
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    store = SnippetStore()
+    index = NearDuplicateIndex(threshold=threshold)
+    num_snippets = 0
+    for file_path in crawler.list_output_files(input_folder):
+        with open(file_path, 'rt') as f:
+            output = json.load(f)
+        for result in output['search_results']:
+            snippet = result.pop('snippet')
+            if snippet is None:
+                result['snippet_id'] = None
+                continue
+            num_snippets += 1
+            snippet_id, is_new = store.add(snippet)
+            result['snippet_id'] = snippet_id
+            if is_new:
+                near_duplicate_of = index.find_or_add(snippet_id, snippet)
+                if near_duplicate_of is not None:
+                    result['near_duplicate_of'] = near_duplicate_of
+        with open(os.path.join(output_folder, os.path.basename(file_path)), 'wt') as f:
+            json.dump(output, f, indent=4)
+    store.save(os.path.join(output_folder, SNIPPETS_FILE_NAME))
+    return num_snippets, len(store.snippets)
+
+
+def restore_snippets(output, store):
+    """Put snippets back into a deduplicated output dict in place.
+
+    :type output: dict
+    :type store: SnippetStore
+    :rtype: dict
+    """
+    for result in output['search_results']:
+        snippet_id = result.pop('snippet_id')
+        result['snippet'] = store.get(snippet_id) if snippet_id is not None else None
+    return output
+
+
+def get_shingles(text, shingle_size):
+    """Get hashes of the word n-grams of text. Texts shorter than shingle_size have one shingle."""
+    words = [word.lower() for word in WORD_PATTERN.findall(text)]
+    num_shingles = max(1, len(words) - shingle_size + 1) if words else 0
+    return set(zlib.crc32(u' '.join(words[no:no + shingle_size]).encode('utf-8')) & MAX_HASH
+               for no in range(num_shingles))
+
+
+def estimate_similarity(signature1, signature2):
+    """Estimate Jaccard similarity as the ratio of equal MinHash values."""
+    equal = sum(1 for value1, value2 in zip(signature1, signature2) if value1 == value2)
+    return float(equal) / len(signature1)
+
+
+def to_unicode(text):
+    if isinstance(text, bytes):
+        return text.decode('utf-8', 'ignore')
+    return text
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Deduplicate snippets of crawled SearchQA data')
+    argparser.add_argument('-i', '--input-folder', type=str, required=True,
+                           help='Folder of crawler output files')
+    argparser.add_argument('-o', '--output-folder', type=str, required=True,
+                           help='Folder to write deduplicated files and the snippet store into. '
+                                'If given folder does not exist it will be created first.')
+    argparser.add_argument('-t', '--threshold', type=float, default=0.8,
+                           help='Minimum estimated Jaccard similarity of near-duplicate snippets')
+    args = argparser.parse_args()
+    return args
+
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s')
+    num_snippets, num_distinct = deduplicate_crawl(args.input_folder, args.output_folder, args.threshold)
+    logging.info('Kept %d distinct snippets of %d.' % (num_distinct, num_snippets))
+
+
+if __name__ == '__main__':
+    main()
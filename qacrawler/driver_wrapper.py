@@ -2,53 +2,94 @@
 This module abstracts away getting a browser driver.
 
 Currently we only have Chrome bindings.
+
+Selenium is imported by the functions that use it, hence it is loaded only when a browser is actually launched.
 """
 import logging
 import time
 
-from selenium import webdriver
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import NoSuchElementException
-
 
-def get_selenium_driver(driver_type='Firefox'):
+def get_selenium_driver(driver_type='Firefox', proxy=None):
+    """
+    :param proxy: if given, the browser sends its requests through this proxy
+    :type proxy: qacrawler.proxies.Proxy
+    """
     if driver_type == 'Firefox':
-        return get_firefox_driver()
+        return get_firefox_driver(proxy)
     elif driver_type == 'Chrome':
-        return get_chrome_driver()
+        return get_chrome_driver(proxy)
     elif driver_type == 'PhantomJS':
         raise NotImplementedError('PhantomJS usage is not implemented.')
 
 
-def get_chrome_driver():
+def get_chrome_driver(proxy=None):
     """
     Get a Chrome Driver.
 
     The driver executable (chromedriver) must be in the system path.
 
+    :param proxy: if given, the browser sends its requests through this proxy, also the ones to local addresses
+    :type proxy: qacrawler.proxies.Proxy
     :return: selenium Chrome webdriver
     :rtype: selenium.webdriver.chrome.webdriver.WebDriver
     """
-    driver = webdriver.Chrome()
+    from selenium import webdriver
+    options = webdriver.ChromeOptions()
+    if proxy is not None:
+        options.add_argument('--proxy-server=%s://%s:%d' % (proxy.scheme, proxy.host, proxy.port))
+        options.add_argument('--proxy-bypass-list=<-loopback>')
+    driver = webdriver.Chrome(chrome_options=options)
     return driver
 
 
-def get_firefox_driver():
+def get_firefox_driver(proxy=None):
     """
     Get a Firefox Driver.
 
     The driver executable (wires) must be in the system path.
 
+    :param proxy: if given, the browser sends its requests through this proxy, also the ones to local addresses
+    :type proxy: qacrawler.proxies.Proxy
     :return: selenium Firefox webdriver
     :rtype: selenium.webdriver.firefox.webdriver.WebDriver
     """
+    from selenium import webdriver
+    from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
     firefox_capabilities = DesiredCapabilities.FIREFOX
     firefox_capabilities['marionette'] = True
-    driver = webdriver.Firefox(capabilities=firefox_capabilities)
+    profile = None
+    if proxy is not None:
+        profile = webdriver.FirefoxProfile()
+        for name, value in get_firefox_proxy_preferences(proxy):
+            profile.set_preference(name, value)
+        profile.update_preferences()
+    driver = webdriver.Firefox(firefox_profile=profile, capabilities=firefox_capabilities)
     return driver
 
 
+def get_firefox_proxy_preferences(proxy):
+    """
+    Firefox preferences that send all requests through the proxy.
+
+    :type proxy: qacrawler.proxies.Proxy
+    :rtype: list[(str, object)]
+    """
+    preferences = [('network.proxy.type', 1),  # manual proxy configuration
+                   ('network.proxy.no_proxies_on', ''),
+                   ('network.proxy.allow_hijacking_localhost', True)]
+    if proxy.is_socks:
+        preferences += [('network.proxy.socks', proxy.host),
+                        ('network.proxy.socks_port', proxy.port),
+                        ('network.proxy.socks_version', 4 if proxy.scheme == 'socks4' else 5),
+                        ('network.proxy.socks_remote_dns', True)]
+    else:
+        preferences += [('network.proxy.http', proxy.host),
+                        ('network.proxy.http_port', proxy.port),
+                        ('network.proxy.ssl', proxy.host),
+                        ('network.proxy.ssl_port', proxy.port)]
+    return preferences
+
+
 def disable_javascript(driver, driver_type='Firefox'):
     if driver_type == 'Firefox':
         return disable_javascript_on_firefox(driver)
@@ -72,6 +113,8 @@ def disable_javascript_on_firefox(driver):
     profile.set_preference("javascript.enabled", False);
     driver = webdriver.Firefox(profile)
     """
+    from selenium.common.exceptions import NoSuchElementException
+    from selenium.webdriver.common.keys import Keys
     logging.info('Disabling Javascript...')
     driver.get(FirefoxConfigInfo.CONFIG_PAGE_URL)  # Firefox's configuration page opens when this url is visited
     try:
@@ -12,6 +12,8 @@ class GoogleDomInfoBase(object):
     RESULT_RELATED_LINKS_DIV_CLASS = 'osl'
     RESULT_RELATED_LINK_CLASS = 'fl'
     NEXT_PAGE_ID = 'pnnext'
+    RESULT_STATS_ID = 'resultStats'
+    RESULTS_CONTAINER_ID = 'ires'
 
 
 class GoogleDomInfoWithJS(GoogleDomInfoBase):
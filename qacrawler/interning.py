@@ -0,0 +1,119 @@
+"""
+Crawl-wide interning of URLs, hosts and titles.
+
+The same hosts and pages appear in the results of tens of thousands of questions. A CrawlInterner maps each
+distinct URL, host and title to an integer id, so that output records hold ids instead of repeated strings. In
+memory, parsed SearchResults already share their title and url strings (see sr_parser.SearchResult), since they are
+interned when pages are parsed.
+
+String tables are persisted next to the crawl outputs as JSON lines files (interned_urls.jsonl,
+interned_hosts.jsonl, interned_titles.jsonl) where line number is the id. Tables are only appended to, hence
+saving after each entry only writes the new strings, and an interrupted crawl continues with the same ids.
+"""
+import codecs
+import json
+import os
+from urlparse import urlparse
+
+
+class StringTable(object):
+    """Append-only mapping between strings and integer ids."""
+    def __init__(self, file_path=None):
+        """
+        :param file_path: path to persist the table. If the file exists the table is loaded from it.
+        :type file_path: str
+        """
+        self.file_path = file_path
+        self.strings = []
+        self.string_ids = {}
+        self.num_saved = 0
+        if file_path is not None and os.path.exists(file_path):
+            self.load()
+
+    def get_id(self, string):
+        """Get the id of string, adding it to the table if it is new.
+
+        :rtype: int
+        """
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.string_ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def get_string(self, string_id):
+        return self.strings[string_id]
+
+    def load(self):
+        with codecs.open(self.file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self.get_id(json.loads(line))
+        self.num_saved = len(self.strings)
+
+    def save(self):
+        """Append the strings added since the last save to the file."""
+        if self.num_saved == len(self.strings):
+            return
+        with codecs.open(self.file_path, 'a', encoding='utf-8') as f:
+            for string in self.strings[self.num_saved:]:
+                f.write(json.dumps(string) + u'\n')
+        self.num_saved = len(self.strings)
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class CrawlInterner(object):
+    """String tables of a crawl for URLs, hosts and titles."""
+    TABLE_FILE_NAMES = {'url': 'interned_urls.jsonl',
+                        'host': 'interned_hosts.jsonl',
+                        'title': 'interned_titles.jsonl'}
+
+    def __init__(self, folder=None):
+        """
+        :param folder: folder to persist string tables into, usually the crawl's output folder. If None, the
+        tables are kept in memory only.
+        :type folder: str
+        """
+        self.folder = folder
+        self.tables = {}
+        for name, file_name in CrawlInterner.TABLE_FILE_NAMES.items():
+            self.tables[name] = StringTable(os.path.join(folder, file_name) if folder is not None else None)
+
+    def intern_result(self, result):
+        """
+        Convert a SearchResult into a dictionary where url, host and title are ids.
+
+        :type result: sr_parser.SearchResult
+        :rtype: dict
+        """
+        return {'title_id': self.tables['title'].get_id(result.title),
+                'url_id': self.tables['url'].get_id(result.url),
+                'host_id': self.tables['host'].get_id(get_host(result.url)),
+                'snippet': result.snippet,
+                'related_links': result.related_links}
+
+    def resolve_result(self, result_dict):
+        """Convert an interned result dictionary back into a SearchResult dictionary.
+
+        :rtype: dict
+        """
+        return {'title': self.tables['title'].get_string(result_dict['title_id']),
+                'url': self.tables['url'].get_string(result_dict['url_id']),
+                'snippet': result_dict['snippet'],
+                'related_links': result_dict['related_links']}
+
+    def get_result_host(self, result_dict):
+        return self.tables['host'].get_string(result_dict['host_id'])
+
+    def save(self):
+        if self.folder is None:
+            return
+        for table in self.tables.values():
+            table.save()
+
+
+def get_host(url):
+    """Get the host name of a URL, e.g. 'https://en.wikipedia.org/wiki/Cheese' -> 'en.wikipedia.org'"""
+    return urlparse(url).netloc
@@ -4,45 +4,271 @@ Main entry point of qacrawler
 Parses command line arguments. Loads the dataset. Chooses the entries to crawl. Crawl chosen entries. Quit.
 """
 import argparse
+import collections
 import logging
 import os
+import sys
 import time
+from multiprocessing.pool import ThreadPool
 
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import Select
-
+import async_logging
+import dataset_index
 import driver_wrapper
 import jeopardy
 import crawler
+import interning
+import pagination
+import parquet_export
+import pipeline
+import profiling
+import proxies
+import refresh
+import result_store
 import sr_parser
+import startup
+import tabs
+import watchdog
 from google_dom_info import GoogleDomInfoWithoutJS as GDom
 
+DEFAULT_RESULTS_PER_PAGE = 10  # Google's default, which needs no preferences to be saved
+SELENIUM_LOGGER_NAME = 'selenium.webdriver.remote.remote_connection'
+
 
 def main():
-    crawler_settings, entries = initialize()
-    crawler.crawl(crawler_settings, entries)
+    crawler_settings, entries, get_driver = initialize()
+    if crawler_settings.route is not None:
+        entries = FailoverEntries(entries, num_in_flight=crawler_settings.num_tabs)
+    try:
+        while True:
+            try:
+                crawl(crawler_settings, entries)
+                break
+            except SystemExit:  # the driver is blocked or fails and sr_parser quits it
+                if crawler_settings.route is None:
+                    raise
+                fail_over(crawler_settings, entries, get_driver)
+    finally:  # also when the bot police exits the crawl, so that the sinks write the results they hold
+        crawler.close_sinks(crawler_settings)
     finalize(crawler_settings.driver)
 
 
+def crawl(settings, entries):
+    if settings.num_tabs > 1:
+        tabs.crawl(settings, entries)
+    elif settings.pipeline:
+        pipeline.crawl(settings, entries)
+    else:
+        crawler.crawl(settings, entries)
+
+
+class FailoverEntries(object):
+    """Iterator over the entries to crawl that can put back the entries in flight when the driver stops, to crawl
+    them again first with the next driver."""
+    def __init__(self, entries, num_in_flight=1):
+        """
+        :param num_in_flight: number of entries crawled at once, e.g. the number of tabs
+        :type num_in_flight: int
+        """
+        self.entries = iter(entries)
+        self.recent = collections.deque(maxlen=num_in_flight)
+        self.requeued = []
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        entry = self.requeued.pop() if self.requeued else next(self.entries)
+        self.recent.append(entry)
+        return entry
+
+    def requeue_in_flight(self):
+        """Put back the most recently taken entries, in their order."""
+        self.requeued.extend(reversed(self.recent))
+        self.recent.clear()
+
+
+def fail_over(settings, entries, get_driver):
+    """Go on crawling through another proxy of the pool after the driver of the route is blocked or fails.
+
+    Leases routes until a driver can be prepared through one, and puts back the entries that were in flight.
+
+    :type settings: crawler.CrawlerSettings
+    :type entries: FailoverEntries
+    :param get_driver: function that prepares a driver that sends its requests through the given route
+    :type get_driver: (proxies.ProxyRoute) -> selenium.webdriver.remote.webdriver.WebDriver
+    :raises SystemExit: when all proxies are retired
+    """
+    pool = settings.route.pool
+    settings.route.release()
+    while True:
+        try:
+            route = pool.lease()
+        except proxies.NoProxyAvailable as e:
+            logging.critical('%s Exiting...' % e)
+            sys.exit()
+        logging.warning('Failing over to proxy %s.' % route.proxy.url)
+        try:
+            settings.driver = get_driver(route)
+        except SystemExit:  # blocked while preparing the driver
+            route.release()
+            continue
+        settings.route = route
+        entries.requeue_in_flight()
+        return
+
+
 def initialize():
     """Initialize collector.
 
     Initialize by parsing command line arguments, reading Jeopardy entries from dataset file
     and getting browser driver.
+
+    :return: crawler settings, entries to crawl and a function that prepares another driver through a given route
+    :rtype: (crawler.CrawlerSettings, collections.Iterable[jeopardy.Entry], function)
     """
+    report = startup.StartupReport()
     args = parse_command_line_arguments()
-    configure_logging(log_level=args.log_level)
+    configure_logging_by_arguments(args)
+    if args.profile:
+        profiling.profile_crawler(args.profile_folder, dump_interval=args.profile_dump_interval)
     create_folder_if_not_exists(args.output_folder)
-    dataset = jeopardy.Dataset(filepath=args.jeopardy_json)
-    entries = get_entries_to_search(dataset, first=args.first, last=args.last)
-    driver = driver_wrapper.get_selenium_driver(args.driver_type)
-    if args.disable_javascript:
-        driver_wrapper.disable_javascript(driver, args.driver_type)
-    set_number_of_results_per_page(driver, args.results_per_page)
-    settings = crawler.CrawlerSettings(driver, args.num_pages, args.output_folder, args.wait_duration,
-                                       args.simulate_typing, args.simulate_clicking, args.disable_javascript)
+    # The dataset is loaded on a helper thread while the browser is brought up, which mostly waits on the browser.
+    background = ThreadPool(processes=1)
+    entries_result = background.apply_async(prepare_entries, (args, report))
+    background.close()
+    policy, results_per_page, num_pages = get_pagination(args)
+    proxy_pool = proxies.get_proxy_pool(args)
+    # One route at a time: when it is blocked, main() fails over to another lease.
+    route = proxy_pool.lease() if proxy_pool is not None else None
+    driver = get_prepared_driver(args.driver_type, args.disable_javascript, results_per_page, report=report,
+                                 route=route)
+    try:
+        entries = entries_result.get()
+    except BaseException:
+        driver.quit()
+        raise
+    interner = interning.CrawlInterner(args.output_folder) if args.intern_strings else None
+    settings = crawler.CrawlerSettings(driver, num_pages, args.output_folder, args.wait_duration,
+                                       args.simulate_typing, args.simulate_clicking, args.disable_javascript,
+                                       interner=interner, pipeline=args.pipeline, pagination_policy=policy,
+                                       watchdog=get_watchdog(args), sinks=get_sinks(args), num_tabs=args.tabs,
+                                       route=route)
+    report.log_ready()
     logging.info('Start.')
-    return settings, entries
+
+    def get_driver(next_route):
+        return get_prepared_driver(args.driver_type, args.disable_javascript, results_per_page, route=next_route)
+    return settings, entries, get_driver
+
+
+def prepare_entries(args, report):
+    """Load the dataset and choose the entries to crawl. With --filter, only the selected entries are read from the
+    dataset file, by the entry offsets saved with its indexes.
+
+    :type report: startup.StartupReport
+    :rtype: generator[jeopardy.Entry]
+    """
+    if args.filter:
+        with report.phase('select entries'):
+            dataset, entry_nos = dataset_index.select_entries(args.jeopardy_json, args.filter)
+    else:
+        with report.phase('load dataset'):
+            dataset = jeopardy.Dataset(filepath=args.jeopardy_json)
+        entry_nos = None
+    if args.refresh:
+        with report.phase('schedule refresh'):
+            entry_nos = get_entries_to_refresh(args, entry_nos)
+    return get_entries_to_search(dataset, first=args.first, last=args.last, entry_nos=entry_nos)
+
+
+def get_entries_to_refresh(args, entry_nos=None):
+    """Get the numbers of the entries in the output folder that need to be re-crawled, in priority order.
+
+    :param entry_nos: if given, only these entries are refreshed
+    :type entry_nos: list[int]
+    :rtype: list[int]
+    """
+    scheduled = refresh.schedule_refresh(args.output_folder, refresh.get_criteria(args, prefix='refresh-'))
+    if entry_nos is not None:
+        selected = set(entry_nos)
+        scheduled = [no for no in scheduled if no in selected]
+    logging.info('%d entries need a refresh.' % len(scheduled))
+    return scheduled
+
+
+def get_pagination(args):
+    """Get the pagination policy, the number of results per page and the maximum number of pages per query.
+
+    Without --target-snippets, pages are read as given by --results-per-page and --num-pages. With it, the number of
+    results per page defaults to the one that reaches the target in the fewest pages, and --num-pages defaults to
+    the number of pages needed if they are full plus one, for pages with fewer results.
+
+    :rtype: (pagination.PaginationPolicy, int, int)
+    """
+    if args.target_snippets is None:
+        return None, args.results_per_page or DEFAULT_RESULTS_PER_PAGE, args.num_pages or 1
+    policy = pagination.PaginationPolicy(target_snippets=args.target_snippets, min_snippets=args.min_snippets)
+    results_per_page = args.results_per_page or policy.choose_results_per_page()
+    num_pages = args.num_pages or policy.get_num_pages(results_per_page) + 1
+    logging.info('Collect %d snippets per query with %d results per page in at most %d pages.' %
+                 (args.target_snippets, results_per_page, num_pages))
+    return policy, results_per_page, num_pages
+
+
+def get_sinks(args):
+    """Get the sinks that receive crawled results in addition to the output files.
+
+    :rtype: list
+    """
+    sinks = []
+    if args.sqlite:
+        sinks.append(result_store.ResultStore(args.sqlite))
+    if args.parquet:
+        sinks.append(parquet_export.ParquetSink(args.parquet))
+    return sinks
+
+
+def get_watchdog(args):
+    """Get a parse yield watchdog that is resumed by SIGUSR1 if asked, else None.
+
+    :rtype: watchdog.ParseWatchdog
+    """
+    if not args.watchdog:
+        return None
+    parse_watchdog = watchdog.ParseWatchdog(snapshot_folder=args.watchdog_folder)
+    parse_watchdog.install_resume_signal()
+    return parse_watchdog
+
+
+def get_prepared_driver(driver_type, disable_javascript, results_per_page, report=None, route=None):
+    """Get a browser driver that is ready to crawl.
+
+    Launch the browser, disable Javascript if asked and set the number of search results per page, unless it is
+    Google's default.
+
+    :param driver_type: The browser/driver type. One of ['Firefox', 'Chrome', 'PhantomJS']
+    :type driver_type: str
+    :param disable_javascript: whether to disable Javascript on the browser
+    :type disable_javascript: bool
+    :param results_per_page: the number of search results in a page per query
+    :type results_per_page: int
+    :param report: if given, durations of the steps are recorded into it
+    :type report: startup.StartupReport
+    :param route: if given, the browser sends its requests through the route's proxy, and blocks and timeouts of
+    the pages that set the number of results per page are reported to its pool
+    :type route: proxies.ProxyRoute
+    :rtype: selenium.webdriver.remote.webdriver.WebDriver
+    """
+    report = report if report is not None else startup.StartupReport()
+    with report.phase('launch browser'):
+        driver = driver_wrapper.get_selenium_driver(driver_type, proxy=route.proxy if route is not None else None)
+    if disable_javascript:
+        with report.phase('disable javascript'):
+            driver_wrapper.disable_javascript(driver, driver_type)
+    if results_per_page != DEFAULT_RESULTS_PER_PAGE:
+        with report.phase('set results per page'):
+            set_number_of_results_per_page(driver, results_per_page, route=route)
+    return driver
 
 
 def parse_command_line_arguments():
@@ -64,11 +290,17 @@ def parse_command_line_arguments():
                            help='First entry from which to start reading questions')
     argparser.add_argument('-l', '--last', type=int, default=216930,
                            help='Last entry at which to stop reading questions')
-    argparser.add_argument('-n', '--num-pages', type=int, default=1,
-                           help='Number of search result pages to parse per query')
-    argparser.add_argument('-g', '--log-level', type=str, default='INFO',
-                           help='Set the level of log messages below which will be saved to log file',
-                           choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    argparser.add_argument('--filter', type=str, default=None,
+                           help='Only crawl entries that satisfy this filter expression over category, round, '
+                                'air_date, show_number and value, e.g. \'round == "Jeopardy!" and value >= 1000\'')
+    argparser.add_argument('--refresh', action='store_true',
+                           help='When included only re-crawls the entries of which outputs in the output folder '
+                                'satisfy any of the --refresh-* criteria, in priority order')
+    refresh.add_criteria_arguments(argparser, prefix='refresh-')
+    argparser.add_argument('-n', '--num-pages', type=int, default=None,
+                           help='Number of search result pages to parse per query (at most, with --target-snippets). '
+                                'Defaults to 1, or to the pages needed for --target-snippets.')
+    add_logging_arguments(argparser)
     argparser.add_argument('-w', '--wait-duration', type=int, default=4,
                            help='Number of seconds to wait before getting the next page')
     argparser.add_argument('--simulate-typing', action='store_true',
@@ -77,22 +309,90 @@ def parse_command_line_arguments():
                            help='When included simulates mouse clicking on next page link')
     argparser.add_argument('--disable-javascript', action='store_true',
                            help='When included disables JavaScript (only for Firefox)')
-    argparser.add_argument('--results-per-page', type=int, default=10,
-                           help='The number of search results in a page per query',
-                           choices=[10, 20, 30, 50, 100])
+    argparser.add_argument('--results-per-page', type=int, default=None,
+                           help='The number of search results in a page per query. Defaults to 10, or to the one '
+                                'that needs the fewest pages for --target-snippets.',
+                           choices=pagination.RESULTS_PER_PAGE_CHOICES)
+    argparser.add_argument('--target-snippets', type=int, default=None,
+                           help='When given stops requesting pages of a query once this many snippets are collected')
+    argparser.add_argument('--min-snippets', type=int, default=41,
+                           help='With --target-snippets, stops requesting pages of a query that can not reach this '
+                                'many snippets. Capped at --target-snippets')
+    argparser.add_argument('--sqlite', type=str, default=None,
+                           help='When given results are also stored into this SQLite database (see result_store.py)')
+    argparser.add_argument('--parquet', type=str, default=None,
+                           help='When given results are also written into partitioned Parquet files in this folder '
+                                '(see parquet_export.py, needs pyarrow)')
+    argparser.add_argument('--watchdog', action='store_true',
+                           help='When included pauses the crawl if parse yields drop, e.g. when Google changes its '
+                                'page layout, until the crawler receives SIGUSR1')
+    argparser.add_argument('--watchdog-folder', type=str, default='watchdog',
+                           help='The folder into which the watchdog saves offending pages')
+    proxies.add_proxy_arguments(argparser)
+    argparser.add_argument('--pipeline', action='store_true',
+                           help='When included parsing and writing run on helper threads while the next page loads')
+    argparser.add_argument('--tabs', type=int, default=1,
+                           help='Number of queries crawled at once in the tabs of one browser. Tabs share the '
+                                'browser\'s Javascript and results per page setup.')
+    argparser.add_argument('--intern-strings', action='store_true',
+                           help='When included urls, hosts and titles are saved as ids of crawl-wide string tables')
+    argparser.add_argument('--profile', action='store_true',
+                           help='When included samples CPU stacks and measures crawler phases')
+    argparser.add_argument('--profile-folder', type=str, default='profile',
+                           help='The folder into which profiles are dumped')
+    argparser.add_argument('--profile-dump-interval', type=int, default=600,
+                           help='Number of seconds between two profile dumps')
     args = argparser.parse_args()
+    if args.tabs > 1 and (args.pipeline or args.simulate_typing or args.simulate_clicking):
+        argparser.error('--tabs requests pages by url, hence can not be used with --pipeline, --simulate-typing '
+                        'or --simulate-clicking')
+    if args.refresh and not refresh.get_criteria(args, prefix='refresh-').has_criteria():
+        argparser.error('--refresh needs at least one of --refresh-older-than, --refresh-min-snippets and '
+                        '--refresh-outdated-parser')
     return args
 
 
+def add_logging_arguments(argparser):
+    """Add the command line arguments of configure_logging_by_arguments."""
+    argparser.add_argument('-g', '--log-level', type=str, default='INFO',
+                           help='Set the level of log messages below which will be saved to log file',
+                           choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    argparser.add_argument('--structured-logs', action='store_true',
+                           help='When included logs are written as JSON lines by a background thread into '
+                                'size-rotated, gzip compressed files')
+    argparser.add_argument('--log-max-megabytes', type=int, default=50,
+                           help='With --structured-logs, the size at which the log file is rotated')
+    argparser.add_argument('--log-backups', type=int, default=20,
+                           help='With --structured-logs, the number of compressed rotated log files kept')
+    argparser.add_argument('--debug-sample', type=str, nargs='*', default=[], metavar='MODULE=RATE',
+                           help='With --structured-logs, the ratio of DEBUG records kept per module, '
+                                'e.g. sr_parser=0.01')
+
+
+def configure_logging_by_arguments(args, log_file='jeopardy_crawler.log'):
+    """Configure logging by the command line arguments added by add_logging_arguments."""
+    configure_logging(log_level=args.log_level, log_file=log_file, structured=args.structured_logs,
+                      max_bytes=args.log_max_megabytes * 1024 * 1024, backup_count=args.log_backups,
+                      sampling_rates=async_logging.parse_sampling_rates(args.debug_sample))
+
+
 def configure_logging(log_level, log_file='jeopardy_crawler.log',
-                      log_format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s'):
+                      log_format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s',
+                      structured=False, max_bytes=None, backup_count=None, sampling_rates=None):
     """Configure Crawler's logger and Suppress selenium's browser logger.
 
-    Selenium's browser logger logs every HTTP requests etc. We are not interested in that."""
+    Selenium's browser logger logs every HTTP requests etc. We are not interested in that.
+
+    If structured, records are written as JSON lines by a listener thread into size-rotated, compressed files
+    (see async_logging.configure_async_logging for the other arguments)."""
     log_level_num = getattr(logging, log_level)
-    logging.basicConfig(filename=log_file, format=log_format, level=log_level_num)
-    from selenium.webdriver.remote.remote_connection import LOGGER as SELENIUM_LOGGER
-    SELENIUM_LOGGER.setLevel(logging.INFO)
+    if structured:
+        async_logging.configure_async_logging(log_file, level=log_level_num, max_bytes=max_bytes,
+                                              backup_count=backup_count, sampling_rates=sampling_rates)
+    else:
+        logging.basicConfig(filename=log_file, format=log_format, level=log_level_num)
+    # Set the level by logger name, so that selenium is imported only when a browser is launched.
+    logging.getLogger(SELENIUM_LOGGER_NAME).setLevel(logging.INFO)
 
 
 def create_folder_if_not_exists(folder):
@@ -105,65 +405,83 @@ def create_folder_if_not_exists(folder):
         os.makedirs(folder)
 
 
-def get_entries_to_search(dataset, first, last):
+def get_entries_to_search(dataset, first, last, entry_nos=None):
     """Get entries to do search queries.
 
+    :param entry_nos: if given, only these entries between first and last are searched
+    :type entry_nos: list[int]
     :rtype generator[jeopardy.Entry]"""
     if last >= dataset.size: last = dataset.size
-    entries = (dataset.get_entry(no) for no in range(first, last))
+    if entry_nos is not None:
+        entries = (dataset.get_entry(no) for no in entry_nos if first <= no < last)
+    else:
+        entries = (dataset.get_entry(no) for no in range(first, last))
     return entries
 
 
-def set_number_of_results_per_page(driver, num_results):
+def set_number_of_results_per_page(driver, num_results, route=None):
     """Manually set the number of search results per page when Javascript is disabled.
 
     Manually
     - visit Google Search's preferences page
     - find the element to set number of results per page
     - set it to the value given in command-line arguments
+
+    :param route: if given, the visits wait for the route's rate limit, and blocks and timeouts are reported to its
+    pool
+    :type route: proxies.ProxyRoute
     """
     logging.debug('Setting search results per page to %d...' % num_results)
-    redirect_nonjavascript_version_of_google_by_making_a_dummy_query(driver)
-    visit_google_search_preferences_page(driver)
-    find_select_and_set(driver, num_results)
+    redirect_nonjavascript_version_of_google_by_making_a_dummy_query(driver, route)
+    visit_google_search_preferences_page(driver, route)
+    find_select_and_set(driver, num_results, route)
     save_preferences(driver)
 
 
-def redirect_nonjavascript_version_of_google_by_making_a_dummy_query(driver):
+def redirect_nonjavascript_version_of_google_by_making_a_dummy_query(driver, route=None):
     """
     If we first visit preferences page directly, Google gives "Your cookies seem to be disabled." warning.
     Hence first do a dummy search, so that Google redirects us to its non-Javascript version.
     """
+    if route is not None:
+        route.wait()
     sr_parser.visit_google(driver, 'Increase search results per page...')
-    sr_parser.wait_for_presence_and_get_element(driver, (By.XPATH, GDom.SEARCH_BOX_XPATH))
+    sr_parser.check_google_bot_police(driver, route)
+    from selenium.webdriver.common.by import By
+    sr_parser.wait_for_presence_and_get_element(driver, (By.XPATH, GDom.SEARCH_BOX_XPATH), route=route)
 
 
-def visit_google_search_preferences_page(driver):
-    google_preferences_page_url = 'http://www.google.com/preferences?hl=en'
-    driver.get(google_preferences_page_url)
+def visit_google_search_preferences_page(driver, route=None):
+    if route is not None:
+        route.wait()
+    driver.get(sr_parser.GOOGLE_PREFERENCES_URL)
+    sr_parser.check_google_bot_police(driver, route)
 
 
-def find_select_and_set(driver, num_results):
-    select = wait_for_and_scroll_into_view_and_get_num_results_select(driver)
+def find_select_and_set(driver, num_results, route=None):
+    select = wait_for_and_scroll_into_view_and_get_num_results_select(driver, route)
     time.sleep(1)
     select.select_by_value(str(num_results))
     logging.info('Selected value: %s' % select.first_selected_option.text)
     time.sleep(1)
 
 
-def wait_for_and_scroll_into_view_and_get_num_results_select(driver):
+def wait_for_and_scroll_into_view_and_get_num_results_select(driver, route=None):
     """
     :return: Select html element to set number of search results per page
     :rtype: selenium.webdriver.support.ui.Select
     """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import Select
     select_locator = (By.ID, GDom.NUMBER_OF_RESULTS_SELECT_ID)
-    select = sr_parser.wait_for_presence_and_get_element(driver, select_locator)
+    select = sr_parser.wait_for_presence_and_get_element(driver, select_locator, route=route)
     coordinates = select.location_once_scrolled_into_view  # first scrolls to element then returns location
     select = Select(select)
     return select
 
 
 def save_preferences(driver):
+    from selenium.webdriver.common.by import By
     save_preferences_button = driver.find_element(By.NAME, GDom.SAVE_PREFERENCES_BUTTON_NAME)
     save_preferences_button.click()
     time.sleep(1)
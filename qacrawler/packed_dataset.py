@@ -0,0 +1,338 @@
+"""
+Packed, memory-mapped SearchQA dataset format.
+
+Packs crawled entries (question, answer and snippets, and optionally their token ids) into a single binary file
+that can be read by index without loading the whole dataset. Readers memory-map the file, hence data-loading
+workers that read the same file share its pages through the OS page cache.
+
+File layout (little-endian):
+
+- header: magic, version, flags, number of entries, strings and tokens, and the offsets of the sections below
+- text: UTF-8 encoded strings, one after another
+- tokens: int32 token ids of all strings, one after another (only if packed with tokens)
+- entry ids: int64 per entry, the Jeopardy entry id
+- entry string offsets: uint64 per entry + 1. Strings of entry i are [offsets[i], offsets[i + 1]) and they are
+  question, answer, snippet 1, snippet 2, ...
+- string offsets: uint64 per string + 1, byte offsets of strings in text section
+- token offsets: uint64 per string + 1, offsets of token ids of strings in tokens section (only if packed with tokens)
+
+Example command to pack crawler outputs, with the token ids written by tokenization.py.
+
+$ python packed_dataset.py --input-folder OUTPUT_FOLDER --tokenized-folder TOKENIZED_FOLDER --output-file crawl.sqa
+"""
+import argparse
+import array
+import collections
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+import crawler
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'SQAPACK\x00'
+VERSION = 1
+FLAG_HAS_TOKENS = 1
+HEADER_FORMAT = '<8sII3Q6Q'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+OFFSET_FORMAT = '<Q'
+OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+TOKEN_ID_SIZE = 4
+ALIGNMENT = 8
+
+PackedEntry = collections.namedtuple('PackedEntry', ['id', 'question', 'answer', 'snippets'])
+
+
+class PackedDatasetWriter(object):
+    """
+    Writes entries into a packed dataset file, one entry at a time.
+
+    Text is streamed into the file and token ids into a temporary file, hence only the offset tables are kept
+    in memory.
+    """
+    def __init__(self, file_path, with_tokens=False):
+        """
+        :param file_path: path of the packed dataset file to write
+        :type file_path: str
+        :param with_tokens: whether token ids of strings are packed too
+        :type with_tokens: bool
+        """
+        self.file_path = file_path
+        self.with_tokens = with_tokens
+        self.file = open(file_path, 'wb')
+        self.file.write(b'\x00' * HEADER_SIZE)
+        self.text_size = 0
+        self.tokens_file = tempfile.TemporaryFile() if with_tokens else None
+        self.entry_ids = Int64Table(signed=True)
+        self.entry_string_offsets = Int64Table(values=[0])
+        self.string_offsets = Int64Table(values=[0])
+        self.token_offsets = Int64Table(values=[0])
+
+    def add(self, entry_id, question, answer, snippets, token_ids=None):
+        """
+        Append an entry.
+
+        :param entry_id: Jeopardy entry id
+        :type entry_id: int
+        :param question: question text
+        :type question: unicode
+        :param answer: answer text
+        :type answer: unicode
+        :param snippets: snippet texts in search result order. None snippets are packed as empty strings.
+        :type snippets: list[unicode]
+        :param token_ids: token ids of question, answer and snippets, in that order. Required if with_tokens.
+        :type token_ids: list[list[int]]
+        """
+        strings = [question, answer] + list(snippets)
+        if self.with_tokens and (token_ids is None or len(token_ids) != len(strings)):
+            raise ValueError('Entry %d must have token ids for its question, answer and %d snippets.' %
+                             (entry_id, len(snippets)))
+        for no, string in enumerate(strings):
+            encoded = to_unicode(string).encode('utf-8')
+            self.file.write(encoded)
+            self.text_size += len(encoded)
+            self.string_offsets.append(self.text_size)
+            if self.with_tokens:
+                ids = array.array('i', token_ids[no])
+                write_little_endian(ids, self.tokens_file)
+                self.token_offsets.append(self.token_offsets[-1] + len(ids))
+        self.entry_ids.append(entry_id)
+        self.entry_string_offsets.append(len(self.string_offsets) - 1)
+
+    def close(self):
+        """Write the token ids and the offset tables after the text, then the header."""
+        self.pad_to_alignment()
+        tokens_offset = self.file.tell()
+        num_tokens = 0
+        if self.with_tokens:
+            self.tokens_file.seek(0)
+            shutil.copyfileobj(self.tokens_file, self.file)
+            self.tokens_file.close()
+            num_tokens = self.token_offsets[-1]
+            self.pad_to_alignment()
+        section_offsets = []
+        for table in [self.entry_ids, self.entry_string_offsets, self.string_offsets, self.token_offsets]:
+            section_offsets.append(self.file.tell())
+            if table is not self.token_offsets or self.with_tokens:
+                table.write(self.file)
+        flags = FLAG_HAS_TOKENS if self.with_tokens else 0
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, flags,
+                             len(self.entry_ids), len(self.string_offsets) - 1, num_tokens,
+                             HEADER_SIZE, tokens_offset, *section_offsets)
+        self.file.seek(0)
+        self.file.write(header)
+        self.file.close()
+
+    def pad_to_alignment(self):
+        padding = -self.file.tell() % ALIGNMENT
+        self.file.write(b'\x00' * padding)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PackedDataset(object):
+    """
+    Random-access reader of a packed dataset file.
+
+    The file is memory-mapped read-only. Offsets are read in place, text is decoded on access and token ids are
+    returned as numpy arrays viewing the mapped file (or as arrays copied from it when numpy is not installed).
+    Pickling a PackedDataset pickles only its path, so it can be sent to data-loading worker processes.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.open()
+
+    def open(self):
+        with open(self.file_path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = struct.unpack_from(HEADER_FORMAT, self.mmap, 0)
+        magic, version, flags, self.size, self.num_strings, self.num_tokens = header[:6]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a packed dataset file of version %d.' % (self.file_path, VERSION))
+        self.has_tokens = bool(flags & FLAG_HAS_TOKENS)
+        (self.text_offset, self.tokens_offset, self.entry_ids_offset, self.entry_string_offsets_offset,
+         self.string_offsets_offset, self.token_offsets_offset) = header[6:]
+
+    def close(self):
+        self.mmap.close()
+
+    def __getstate__(self):
+        return {'file_path': self.file_path}
+
+    def __setstate__(self, state):
+        self.file_path = state['file_path']
+        self.open()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, no):
+        """
+        :param no: the number of entry, in the order they were packed
+        :type no: int
+        :rtype: PackedEntry
+        """
+        first, last = self.get_string_range(no)
+        strings = [self.get_string(string_no) for string_no in range(first, last)]
+        return PackedEntry(self.get_entry_id(no), strings[0], strings[1], strings[2:])
+
+    def get_entry_id(self, no):
+        self.check_entry_no(no)
+        return struct.unpack_from('<q', self.mmap, self.entry_ids_offset + 8 * no)[0]
+
+    def get_num_snippets(self, no):
+        first, last = self.get_string_range(no)
+        return last - first - 2
+
+    def get_token_ids(self, no):
+        """
+        Get token ids of the question, the answer and the snippets of an entry, in that order.
+
+        :rtype: list[numpy.ndarray]
+        """
+        if not self.has_tokens:
+            raise ValueError('%s is packed without tokens.' % self.file_path)
+        first, last = self.get_string_range(no)
+        return [self.get_string_token_ids(string_no) for string_no in range(first, last)]
+
+    def get_string_range(self, no):
+        self.check_entry_no(no)
+        return self.read_offsets(self.entry_string_offsets_offset, no)
+
+    def get_string(self, string_no):
+        start, end = self.read_offsets(self.string_offsets_offset, string_no)
+        return self.mmap[self.text_offset + start:self.text_offset + end].decode('utf-8')
+
+    def get_string_token_ids(self, string_no):
+        start, end = self.read_offsets(self.token_offsets_offset, string_no)
+        position = self.tokens_offset + TOKEN_ID_SIZE * start
+        if numpy is not None:
+            return numpy.frombuffer(self.mmap, dtype='<i4', count=end - start, offset=position)
+        ids = array.array('i')
+        ids.fromstring(self.mmap[position:position + TOKEN_ID_SIZE * (end - start)])
+        return ids
+
+    def read_offsets(self, table_offset, no):
+        """Read the offsets no and no + 1 of an offset table, i.e. the range of item no."""
+        return struct.unpack_from('<2Q', self.mmap, table_offset + OFFSET_SIZE * no)
+
+    def check_entry_no(self, no):
+        if not 0 <= no < self.size:
+            raise IndexError('Entry no %d is out of range [0, %d).' % (no, self.size))
+
+
+def pack_crawl(input_folder, output_path, tokenized_folder=None):
+    """
+    Pack crawler output files in input_folder into a packed dataset file.
+
+    :param input_folder: folder of crawler's JSON output files
+    :type input_folder: str
+    :param output_path: path of the packed dataset file to write
+    :type output_path: str
+    :param tokenized_folder: folder of tokenization.py outputs. If given token ids are packed too.
+    :type tokenized_folder: str
+    :return: number of packed entries
+    :rtype: int
+    """
+    import tokenization  # here, as it imports nltk, which reading packed datasets does not need
+
+    file_paths = crawler.list_output_files(input_folder)
+    with PackedDatasetWriter(output_path, with_tokens=tokenized_folder is not None) as writer:
+        for file_path in file_paths:
+            with open(file_path, 'rt') as f:
+                output = json.load(f)
+            snippets = [result['snippet'] for result in output['search_results']]
+            token_ids = None
+            if tokenized_folder is not None:
+                with open(tokenization.tokenized_file_path(tokenized_folder, file_path), 'rt') as f:
+                    tokenized = json.load(f)
+                token_ids = [tokenized['question_ids'], tokenized['answer_ids']] + tokenized['snippet_ids']
+            writer.add(output['id'], output['question'], output['answer'], snippets, token_ids)
+    return len(file_paths)
+
+
+class Int64Table(object):
+    """
+    Growable table of 64-bit integers, kept as little-endian bytes.
+
+    Python 2's array module has no 8 byte typecodes ('q' and 'Q'), and its 'l' and 'L' are 4 bytes on some platforms,
+    hence values are packed explicitly.
+    """
+    def __init__(self, signed=False, values=()):
+        self.format = '<q' if signed else '<Q'
+        self.data = bytearray()
+        for value in values:
+            self.append(value)
+
+    def append(self, value):
+        self.data += struct.pack(self.format, value)
+
+    def __len__(self):
+        return len(self.data) // 8
+
+    def __getitem__(self, no):
+        if no < 0:
+            no += len(self)
+        if not 0 <= no < len(self):
+            raise IndexError('Table index out of range')
+        return struct.unpack_from(self.format, self.data, 8 * no)[0]
+
+    def write(self, f):
+        f.write(self.data)
+
+
+def write_little_endian(table, f):
+    if struct.pack('=H', 1) != struct.pack('<H', 1):
+        table = array.array(table.typecode, table)
+        table.byteswap()
+    table.tofile(f)
+
+
+def to_unicode(string):
+    if string is None:
+        return u''
+    if isinstance(string, bytes):
+        return string.decode('utf-8')
+    return string
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Pack crawled SearchQA data into a memory-mappable file')
+    argparser.add_argument('-i', '--input-folder', type=str, required=True,
+                           help='Folder of crawler output files')
+    argparser.add_argument('-o', '--output-file', type=str, required=True,
+                           help='Path of the packed dataset file to write')
+    argparser.add_argument('-t', '--tokenized-folder', type=str, default=None,
+                           help='Folder of tokenization.py outputs. If given token ids are packed too.')
+    args = argparser.parse_args()
+    return args
+
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s')
+    num_entries = pack_crawl(args.input_folder, args.output_file, tokenized_folder=args.tokenized_folder)
+    logging.info('Packed %d entries into %s (%d bytes).' %
+                 (num_entries, args.output_file, os.path.getsize(args.output_file)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Target-driven pagination policy.
+
+Training keeps the first 50 snippets of a question and drops questions with 40 or fewer snippets. Reading every
+question's --num-pages pages wastes requests on both ends: pages after the target is met are thrown away, and
+questions that cannot reach the minimum are dropped anyway. A PaginationPolicy stops requesting pages as soon as
+either is known, and chooses the number of results per page that needs the fewest round trips.
+"""
+import math
+
+RESULTS_PER_PAGE_CHOICES = [10, 20, 30, 50, 100]
+
+
+class PaginationPolicy(object):
+    def __init__(self, target_snippets=50, min_snippets=41):
+        """
+        :param target_snippets: stop requesting pages when this many snippets are collected
+        :type target_snippets: int
+        :param min_snippets: stop requesting pages when a question can not reach this many snippets. At most
+        target_snippets, e.g. the default is lowered to 30 for a target of 30.
+        :type min_snippets: int
+        """
+        self.target_snippets = target_snippets
+        self.min_snippets = min(min_snippets, target_snippets)
+
+    def choose_results_per_page(self):
+        """Choose the smallest page size that can reach the target in one page, or else the largest page size.
+
+        :rtype: int
+        """
+        for results_per_page in RESULTS_PER_PAGE_CHOICES:
+            if results_per_page >= self.target_snippets:
+                return results_per_page
+        return RESULTS_PER_PAGE_CHOICES[-1]
+
+    def get_num_pages(self, results_per_page):
+        """Number of pages needed to reach the target if every page is full."""
+        return int(math.ceil(float(self.target_snippets) / results_per_page))
+
+    def should_request_next_page(self, num_snippets, estimated_num_results, pages_left, results_per_page):
+        """
+        Decide whether the next page is worth requesting.
+
+        :param num_snippets: number of snippets collected so far for the question
+        :type num_snippets: int
+        :param estimated_num_results: Google's estimate of the number of results ("About N results"), None if unknown
+        :type estimated_num_results: int
+        :param pages_left: number of pages that may still be requested
+        :type pages_left: int
+        :param results_per_page: the number of search results in a page
+        :type results_per_page: int
+        :rtype: bool
+        """
+        if pages_left <= 0 or num_snippets >= self.target_snippets:
+            return False
+        if estimated_num_results is not None and estimated_num_results < self.min_snippets:
+            return False
+        return num_snippets + pages_left * results_per_page >= self.min_snippets
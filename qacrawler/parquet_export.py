@@ -0,0 +1,241 @@
+"""
+Export crawl results to partitioned Parquet files for analytics.
+
+Each row is a search result with its entry's metadata (see COLUMNS). Rows are partitioned by blocks of entry ids
+into Hive-style folders, e.g. EXPORT_FOLDER/entry_block=3/part-....parquet holds entries 30000 to 39999, and
+written in row groups with column statistics. Hence pandas/pyarrow read only the columns and the files or row
+groups a query needs:
+
+import pyarrow.parquet as pq
+pq.read_table(EXPORT_FOLDER, columns=['entry_id', 'url'], filters=[('entry_block', '<', 2)]).to_pandas()
+
+A ParquetSink writes results as they are crawled (main.py --parquet). It writes a file every rows_per_file rows or
+flush_interval seconds, hence a crawl that is stopped loses few rows, at the cost of small files that can be
+compacted by exporting the crawl's outputs again. It only appends, hence a re-crawled entry has rows of each crawl,
+which can be told apart by crawled_at.
+
+pyarrow is an optional dependency that is only needed to write or read Parquet files.
+
+Example command to export a crawl.
+
+$ python parquet_export.py --input-folder OUTPUT_FOLDER --output-folder EXPORT_FOLDER
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import crawler
+import interning
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ENTRY_COLUMNS = [('entry_id', 'int64'), ('category', 'string'), ('air_date', 'string'), ('question', 'string'),
+                 ('answer', 'string'), ('round', 'string'), ('show_number', 'string'), ('value', 'string'),
+                 ('crawled_at', 'float64'), ('parser_version', 'int32')]
+RESULT_COLUMNS = [('rank', 'int32'), ('title', 'string'), ('url', 'string'), ('host', 'string'),
+                  ('snippet', 'string'), ('related_links', 'list<string>')]
+COLUMNS = ENTRY_COLUMNS + RESULT_COLUMNS
+PARTITION_COLUMN = 'entry_block'
+
+
+def get_schema():
+    """
+    :rtype: pyarrow.Schema
+    """
+    check_pyarrow()
+    types = {'int32': pyarrow.int32(), 'int64': pyarrow.int64(), 'float64': pyarrow.float64(),
+             'string': pyarrow.string(), 'list<string>': pyarrow.list_(pyarrow.string())}
+    return pyarrow.schema([pyarrow.field(name, types[type_name]) for name, type_name in COLUMNS])
+
+
+def check_pyarrow():
+    if pyarrow is None:
+        raise ImportError('pyarrow is needed to write Parquet files. Install it with: pip install pyarrow')
+
+
+class ParquetWriter(object):
+    """Buffers result rows of consecutive entries and writes them into the partition of their entry block."""
+    def __init__(self, folder, block_size=10000, rows_per_file=100000, row_group_size=10000):
+        """
+        :param folder: the export folder
+        :type folder: str
+        :param block_size: number of entry ids per partition
+        :type block_size: int
+        :param rows_per_file: buffered rows are written into a file when there are this many of them
+        :type rows_per_file: int
+        :param row_group_size: number of rows in a row group
+        :type row_group_size: int
+        """
+        check_pyarrow()
+        self.folder = folder
+        self.block_size = block_size
+        self.rows_per_file = rows_per_file
+        self.row_group_size = row_group_size
+        self.schema = get_schema()
+        self.run_id = '%s-%d' % (time.strftime('%Y%m%d%H%M%S'), os.getpid())
+        self.num_files = 0
+        self.block = None
+        self.columns = empty_columns()
+
+    def add_rows(self, entry_dict, result_dicts, crawl_metadata=None):
+        """
+        Add an entry's results as they are in crawler's JSON outputs.
+
+        :param entry_dict: entry information with keys id, category, air_date, question, answer, round, show_number
+        and value
+        :type entry_dict: dict
+        :param result_dicts: search results in rank order with keys title, url, snippet and related_links
+        :type result_dicts: list[dict]
+        :param crawl_metadata: crawl metadata of the output (see crawler.get_crawl_metadata)
+        :type crawl_metadata: dict
+        """
+        block = entry_dict['id'] // self.block_size
+        if block != self.block:
+            self.flush()
+            self.block = block
+        append_rows(self.columns, entry_dict, result_dicts, crawl_metadata or {})
+        if len(self.columns['rank']) >= self.rows_per_file:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows into a new file in their partition."""
+        if not self.columns['rank']:
+            return
+        arrays = [pyarrow.array(self.columns[name], type=field.type)
+                  for name, field in zip([name for name, _ in COLUMNS], self.schema)]
+        table = pyarrow.Table.from_arrays(arrays, schema=self.schema)
+        partition_folder = os.path.join(self.folder, '%s=%d' % (PARTITION_COLUMN, self.block))
+        if not os.path.exists(partition_folder):
+            os.makedirs(partition_folder)
+        file_path = os.path.join(partition_folder, 'part-%s-%05d.parquet' % (self.run_id, self.num_files))
+        pyarrow.parquet.write_table(table, file_path, row_group_size=self.row_group_size)
+        self.num_files += 1
+        self.columns = empty_columns()
+
+    def close(self):
+        self.flush()
+
+
+class ParquetSink(ParquetWriter):
+    """Live sink of crawler.save_results_for_entry."""
+    def __init__(self, folder, rows_per_file=1000, flush_interval=60.0, **kwargs):
+        """
+        :param folder: the export folder
+        :type folder: str
+        :param rows_per_file: buffered rows are written into a file when there are this many of them
+        :type rows_per_file: int
+        :param flush_interval: maximum seconds rows are buffered before they are written
+        :type flush_interval: float
+        """
+        ParquetWriter.__init__(self, folder, rows_per_file=rows_per_file, **kwargs)
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+        self.lock = threading.Lock()  # results can be added by pipeline's writer thread
+
+    def add(self, entry, results):
+        """
+        :type entry: jeopardy.Entry
+        :type results: list[sr_parser.SearchResult]
+        """
+        with self.lock:
+            self.add_rows(entry.to_dict(), [res.to_dict() for res in results], crawler.get_crawl_metadata(results))
+            if time.time() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        ParquetWriter.flush(self)
+        self.last_flush = time.time()
+
+    def close(self):
+        with self.lock:
+            ParquetWriter.close(self)
+
+
+def empty_columns():
+    return dict((name, []) for name, _ in COLUMNS)
+
+
+def append_rows(columns, entry_dict, result_dicts, crawl_metadata):
+    """Append a row per search result into lists of column values.
+
+    :type columns: dict[str, list]
+    """
+    entry_values = dict(entry_dict, entry_id=entry_dict['id'], crawled_at=crawl_metadata.get('crawled_at'),
+                        parser_version=crawl_metadata.get('parser_version'))
+    for rank, result in enumerate(result_dicts):
+        for name, _ in ENTRY_COLUMNS:
+            columns[name].append(to_unicode(entry_values.get(name)))
+        columns['rank'].append(rank)
+        columns['title'].append(to_unicode(result['title']))
+        columns['url'].append(to_unicode(result['url']))
+        columns['host'].append(to_unicode(interning.get_host(result['url'])) if result['url'] else None)
+        columns['snippet'].append(to_unicode(result['snippet']))
+        columns['related_links'].append([to_unicode(link) for link in result['related_links'] or []])
+
+
+def to_unicode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def export_crawl(input_folder, output_folder, block_size=10000):
+    """
+    Export crawler's JSON outputs in input_folder into partitioned Parquet files. Interned outputs are resolved.
+
+    :return: number of exported entries
+    :rtype: int
+    """
+    writer = ParquetWriter(output_folder, block_size=block_size)
+    interner = None
+    num_entries = 0
+    for file_path in crawler.list_output_files(input_folder):
+        with open(file_path, 'rt') as f:
+            output = json.load(f)
+        if 'id' not in output:
+            continue
+        result_dicts = output.pop('search_results')
+        if result_dicts and 'url_id' in result_dicts[0]:
+            interner = interner or interning.CrawlInterner(input_folder)
+            result_dicts = [interner.resolve_result(result) for result in result_dicts]
+        writer.add_rows(output, result_dicts, output.get('crawl_metadata'))
+        num_entries += 1
+    writer.close()
+    return num_entries
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Export crawled SearchQA data into partitioned Parquet files')
+    argparser.add_argument('-i', '--input-folder', type=str, required=True,
+                           help='Folder of crawler output files')
+    argparser.add_argument('-o', '--output-folder', type=str, required=True,
+                           help='Folder to write Parquet files into. If given folder does not exist it will be '
+                                'created first.')
+    argparser.add_argument('-b', '--block-size', type=int, default=10000,
+                           help='Number of entry ids per partition')
+    args = argparser.parse_args()
+    return args
+
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s')
+    num_entries = export_crawl(args.input_folder, args.output_folder, block_size=args.block_size)
+    logging.info('Exported %d entries.' % num_entries)
+
+
+if __name__ == '__main__':
+    main()
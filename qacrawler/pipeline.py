@@ -0,0 +1,102 @@
+"""
+Pipelined crawling within one worker.
+
+crawler.crawl runs the steps of a query strictly in sequence: load a page, parse it, wait, load the next page,
+and finally format and write the results. Here the driver thread only loads pages, while a parser thread parses
+page k and a writer thread saves query q, both in parallel with the driver waiting for the next page. Hence the
+politeness wait and page loads overlap with parsing and writing instead of adding to them.
+
+Helper threads (rather than processes) are enough: the driver thread spends its time sleeping or waiting on
+sockets to the browser, during which the parser thread has the interpreter to itself. Queues between stages
+are bounded, so the driver slows down instead of piling up pages if parsing falls behind.
+"""
+import logging
+import Queue
+import threading
+
+import crawler
+import sr_parser
+
+_STOP = object()
+
+
+def crawl(settings, entries, queue_size=16):
+    """
+    Crawl search results of given Jeopardy entries like crawler.crawl, but with parsing and writing pipelined.
+
+    :param settings: Crawler settings object
+    :type settings: crawler.CrawlerSettings
+    :param entries: Jeopary dataset entries
+    :type entries: collections.Iterable[qacrawler.jeopardy.Entry]
+    :param queue_size: maximum number of items waiting between stages
+    :type queue_size: int
+    """
+    page_queue = Queue.Queue(maxsize=queue_size)
+    results_queue = Queue.Queue(maxsize=queue_size)
+    parser = threading.Thread(target=parse_pages, args=(page_queue, results_queue, settings.watchdog),
+                              name='pipeline-parser')
+    writer = threading.Thread(target=write_results, args=(results_queue, settings), name='pipeline-writer')
+    for thread in [parser, writer]:
+        thread.daemon = True
+        thread.start()
+    try:
+        for entry in entries:
+            if settings.watchdog is not None:
+                settings.watchdog.wait_while_paused()
+            logging.info('Question no %06d: %s. Crawl!' % (entry.id, entry.question))
+            for page_source in sr_parser.iterate_search_result_page_sources(entry.question, settings):
+                page_queue.put((entry, page_source))
+            page_queue.put((entry, None))  # all pages of entry are loaded
+    finally:
+        # Even when the driver thread stops (e.g. sr_parser exits when caught by bot police),
+        # finish parsing and writing the pages that are already loaded.
+        page_queue.put(_STOP)
+        parser.join()
+        writer.join()
+
+
+def parse_pages(page_queue, results_queue, watchdog=None):
+    """Parse loaded pages and pass the results of each entry to the writer when all its pages are parsed.
+
+    :type watchdog: qacrawler.watchdog.ParseWatchdog
+    """
+    results = []
+    page_no = 0
+    while True:
+        item = page_queue.get()
+        if item is _STOP:
+            results_queue.put(_STOP)
+            return
+        entry, page_source = item
+        if page_source is None:
+            results_queue.put((entry, results))
+            results = []
+            page_no = 0
+            continue
+        try:
+            page_results = sr_parser.parse_results_page_source(page_source)
+            logging.debug('Collected %d search results.', len(page_results))
+            results.extend(page_results)
+        except Exception:
+            logging.exception('Question no %06d. Could not parse a page.' % entry.id)
+            page_results = []
+        if watchdog is not None:
+            watchdog.observe_page(page_results, lambda: page_source, query=entry.question, page_no=page_no)
+        page_no += 1
+
+
+def write_results(results_queue, settings):
+    """Save the results of entries as they are parsed."""
+    while True:
+        item = results_queue.get()
+        if item is _STOP:
+            return
+        entry, results = item
+        logging.info('Question no %06d. Collected %d search results.' % (entry.id, len(results)))
+        if not results:
+            continue
+        try:
+            crawler.save_results_for_entry(results, entry, settings.output_folder, interner=settings.interner,
+                                           sinks=settings.sinks)
+        except Exception:
+            logging.exception('Question no %06d. Could not save results.' % entry.id)
@@ -0,0 +1,217 @@
+"""
+Built-in profiling of a running crawler.
+
+A Profiler samples the call stacks of all threads periodically (a sampling CPU profiler) and measures the duration
+and memory allocations of instrumented crawler phases. Its reports are dumped periodically and on exit into a folder:
+
+- cpu.collapsed: stack samples in collapsed-stack format, i.e. "frame;frame;frame count" lines, which can be turned
+  into a flame graph by flamegraph.pl or speedscope.
+- phases.tsv: number of calls, wall-clock and CPU durations and allocated memory of each phase. CPU durations are
+  of the thread that runs the phase, hence they do not include the time of other threads (e.g. pipeline threads or
+  the sampler). They are reported as NA where the CPU time of a thread can not be measured.
+- memory-NNNNN.snapshot: tracemalloc snapshots, loadable via tracemalloc.Snapshot.load(). Only written when
+  tracemalloc is available (Python 3.4+).
+"""
+import atexit
+import collections
+import functools
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import crawler
+import pipeline
+import sr_parser
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Python 2 has no resource.RUSAGE_THREAD, but Linux accepts its value.
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', 1 if sys.platform.startswith('linux') else None)
+
+
+class Profiler(object):
+    """Sampling CPU profiler with phase timers and memory snapshots."""
+    def __init__(self, output_folder, sampling_interval=0.01, dump_interval=600, trace_memory=True):
+        """
+        :param output_folder: folder to dump the reports into
+        :type output_folder: str
+        :param sampling_interval: number of seconds between two stack samples
+        :type sampling_interval: float
+        :param dump_interval: number of seconds between two report dumps
+        :type dump_interval: float
+        :param trace_memory: whether to trace memory allocations with tracemalloc
+        :type trace_memory: bool
+        """
+        self.output_folder = output_folder
+        self.sampling_interval = sampling_interval
+        self.dump_interval = dump_interval
+        if trace_memory and tracemalloc is None:
+            logging.warning('tracemalloc is not available. Memory snapshots are disabled.')
+        self.trace_memory = trace_memory and tracemalloc is not None
+        self.stack_counts = collections.Counter()
+        self.phase_stats = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.num_snapshots = 0
+
+    def start(self):
+        if not os.path.exists(self.output_folder):
+            os.makedirs(self.output_folder)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.threads = [threading.Thread(target=self.sample_stacks, name='profiler-sampler'),
+                        threading.Thread(target=self.dump_periodically, name='profiler-dumper')]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        atexit.register(self.stop)
+        logging.info('Profiling into %s.' % self.output_folder)
+
+    def stop(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.dump()
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def sample_stacks(self):
+        while not self.stopped.wait(self.sampling_interval):
+            own_thread_ids = set(thread.ident for thread in self.threads)
+            thread_names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, frame in frames.items():
+                    if thread_id in own_thread_ids:
+                        continue
+                    stack = collapse_stack(thread_names.get(thread_id, str(thread_id)), frame)
+                    self.stack_counts[stack] += 1
+
+    def dump_periodically(self):
+        while not self.stopped.wait(self.dump_interval):
+            self.dump()
+
+    def dump(self):
+        """Write the reports collected so far. Stack samples and phase stats are cumulative."""
+        with self.lock:
+            stack_counts = list(self.stack_counts.items())
+            phase_stats = list(self.phase_stats.values())
+        with open(os.path.join(self.output_folder, 'cpu.collapsed'), 'wt') as f:
+            f.writelines('%s %d\n' % (stack, count) for stack, count in sorted(stack_counts))
+        with open(os.path.join(self.output_folder, 'phases.tsv'), 'wt') as f:
+            f.write(PhaseStats.TSV_HEADER + '\n')
+            f.writelines(str(stats) + '\n' for stats in phase_stats)
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            snapshot.dump(os.path.join(self.output_folder, 'memory-%05d.snapshot' % self.num_snapshots))
+            self.num_snapshots += 1
+        logging.debug('Dumped profile into %s.', self.output_folder)
+
+    @contextmanager
+    def phase(self, name):
+        """Measure the duration and memory allocations of the code in the with block as phase name."""
+        memory_before = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        wall_start, cpu_start = time.time(), get_thread_cpu_time()
+        try:
+            yield
+        finally:
+            wall_duration = time.time() - wall_start
+            cpu_duration = get_thread_cpu_time() - cpu_start if cpu_start is not None else None
+            memory_delta = tracemalloc.get_traced_memory()[0] - memory_before if self.trace_memory else 0
+            with self.lock:
+                if name not in self.phase_stats:
+                    self.phase_stats[name] = PhaseStats(name)
+                self.phase_stats[name].add(wall_duration, cpu_duration, memory_delta)
+
+    def instrument(self, module, function_name):
+        """Replace module.function_name with a wrapper that measures each call as a phase of the same name."""
+        function = getattr(module, function_name)
+
+        @functools.wraps(function)
+        def measured(*args, **kwargs):
+            with self.phase(function_name):
+                return function(*args, **kwargs)
+        setattr(module, function_name, measured)
+
+
+class PhaseStats(object):
+    """Cumulative measurements of a phase."""
+    TSV_HEADER = 'phase\tcalls\twall_total\twall_mean\twall_max\tcpu_total\tmemory_delta_total'
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_total = 0.0
+        self.wall_max = 0.0
+        self.cpu_total = 0.0
+        self.cpu_measured = True
+        self.memory_delta_total = 0
+
+    def add(self, wall_duration, cpu_duration, memory_delta):
+        self.calls += 1
+        self.wall_total += wall_duration
+        self.wall_max = max(self.wall_max, wall_duration)
+        if cpu_duration is None:
+            self.cpu_measured = False
+        else:
+            self.cpu_total += cpu_duration
+        self.memory_delta_total += memory_delta
+
+    def __str__(self):
+        """Format phase stats into a tab separated string"""
+        wall_mean = self.wall_total / self.calls if self.calls else 0.0
+        cpu_total = '%.3f' % self.cpu_total if self.cpu_measured else 'NA'
+        return '%s\t%d\t%.3f\t%.3f\t%.3f\t%s\t%d' % (self.name, self.calls, self.wall_total, wall_mean,
+                                                   self.wall_max, cpu_total, self.memory_delta_total)
+
+
+def get_thread_cpu_time():
+    """
+    :return: CPU seconds used by the calling thread, None where it can not be measured
+    :rtype: float
+    """
+    if hasattr(time, 'clock_gettime') and hasattr(time, 'CLOCK_THREAD_CPUTIME_ID'):
+        return time.clock_gettime(time.CLOCK_THREAD_CPUTIME_ID)
+    if RUSAGE_THREAD is None:
+        return None
+    usage = resource.getrusage(RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+def collapse_stack(thread_name, frame):
+    """Format a call stack as "thread;outermost frame;...;innermost frame"."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append('%s:%s:%d' % (os.path.basename(code.co_filename), code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ';'.join(reversed(frames))
+
+
+def profile_crawler(output_folder, dump_interval=600):
+    """
+    Start profiling the crawler phases: crawl, collect_query_results_from_google, parse_opened_results_page
+    (and parse_results_page_source, which also measures parsing in pipelined crawls) and save_results_for_entry.
+
+    :rtype: Profiler
+    """
+    profiler = Profiler(output_folder, dump_interval=dump_interval)
+    profiler.instrument(crawler, 'crawl')
+    profiler.instrument(pipeline, 'crawl')
+    profiler.instrument(sr_parser, 'collect_query_results_from_google')
+    profiler.instrument(sr_parser, 'parse_opened_results_page')
+    profiler.instrument(sr_parser, 'parse_results_page_source')
+    profiler.instrument(crawler, 'save_results_for_entry')
+    profiler.start()
+    return profiler
@@ -0,0 +1,265 @@
+"""
+Pool of outbound HTTP/SOCKS proxies, to crawl through several routes instead of the single route of the host.
+
+Google's bot police caps the request rate per route, hence throughput grows with the number of routes. A
+ProxyPool leases each browser driver a proxy (a ProxyRoute), preferring the ones leased by the fewest drivers and
+then the healthiest ones. Each route has its own rate limit: a token bucket of requests_per_minute that allows
+bursts of burst requests. Drivers report whether each results page got through, was blocked or failed to load (e.g.
+a dead proxy). A proxy's health score is the exponentially weighted ratio of its pages that got through, and a
+proxy is retired when too many of its recent pages are blocked, or it is blocked or fails several times in a row.
+
+Failing over to another proxy is up to the owner of the driver. The workers of service.py restart with a new lease
+when their driver exits, e.g. on a block. main.py crawls through one route at a time, and when its driver is
+blocked or fails it brings up a driver through a new lease and crawls the entries in flight again, until all
+proxies are retired.
+
+A proxies file has a proxy url per line, e.g.
+
+http://10.0.0.1:3128
+socks5://10.0.0.2:1080
+
+Example command to crawl through a pool of proxies.
+
+$ python main.py --jeopardy-json JEOPARDY_JSON --output-folder OUTPUT_FOLDER --proxies proxies.txt
+"""
+import collections
+import logging
+import threading
+import time
+import urllib2
+from urlparse import urlparse
+
+OK = 'ok'
+BLOCKED = 'blocked'
+FAILED = 'failed'
+SCHEMES = ['http', 'https', 'socks4', 'socks5']
+
+
+class NoProxyAvailable(Exception):
+    pass
+
+
+class TokenBucket(object):
+    """Allows rate requests per second on average, and bursts of up to capacity requests."""
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = now if now is not None else time.time()
+
+    def take(self, now):
+        """Take a token if there is one.
+
+        :return: 0 if a token is taken, else the number of seconds until there is one
+        :rtype: float
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Proxy(object):
+    """An outbound proxy, its rate limit and its record of outcomes."""
+    def __init__(self, url, bucket, window=20):
+        """
+        :param url: proxy url, e.g. http://10.0.0.1:3128 or socks5://10.0.0.2:1080
+        :type url: str
+        :type bucket: TokenBucket
+        :param window: number of recent outcomes the block rate is computed over
+        :type window: int
+        """
+        parsed = urlparse(url)
+        if parsed.scheme not in SCHEMES or not parsed.hostname or not parsed.port:
+            raise ValueError('Proxy url must be SCHEME://HOST:PORT with a scheme in %s, not %s.' % (SCHEMES, url))
+        self.url = url
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.bucket = bucket
+        self.recent = collections.deque(maxlen=window)
+        self.health = 1.0
+        self.num_leases = 0
+        self.counts = dict((outcome, 0) for outcome in [OK, BLOCKED, FAILED])
+        self.consecutive_blocks = 0
+        self.consecutive_failures = 0
+        self.retired = False
+
+    @property
+    def is_socks(self):
+        return self.scheme.startswith('socks')
+
+    @property
+    def block_rate(self):
+        """Ratio of the recent outcomes that are blocks."""
+        if not self.recent:
+            return 0.0
+        return float(sum(1 for outcome in self.recent if outcome == BLOCKED)) / len(self.recent)
+
+    def build_opener(self):
+        """Get a urllib2 opener whose requests go through this proxy, for fetches without a browser.
+
+        :rtype: urllib2.OpenerDirector
+        """
+        if self.is_socks:
+            raise ValueError('urllib2 can not fetch through SOCKS proxy %s.' % self.url)
+        address = 'http://%s:%d' % (self.host, self.port)
+        return urllib2.build_opener(urllib2.ProxyHandler({'http': address, 'https': address}))
+
+    def to_dict(self):
+        return {'url': self.url,
+                'health': round(self.health, 3),
+                'block_rate': round(self.block_rate, 3),
+                'leases': self.num_leases,
+                'counts': dict(self.counts),
+                'retired': self.retired}
+
+
+class ProxyRoute(object):
+    """A proxy leased from a pool for one driver."""
+    def __init__(self, pool, proxy):
+        """
+        :type pool: ProxyPool
+        :type proxy: Proxy
+        """
+        self.pool = pool
+        self.proxy = proxy
+        self.released = False
+
+    def wait(self):
+        """Wait until the rate limit of the route allows another request."""
+        self.pool.wait_for_turn(self.proxy)
+
+    def report(self, outcome):
+        """Record whether a request through the route got through (OK), was blocked (BLOCKED) or failed (FAILED)."""
+        self.pool.report(self.proxy, outcome)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.pool.release(self.proxy)
+
+
+class ProxyPool(object):
+    def __init__(self, proxy_urls, requests_per_minute=6.0, burst=1, window=20, min_observations=5,
+                 max_block_rate=0.5, max_consecutive_blocks=3, max_consecutive_failures=3, health_decay=0.8):
+        """
+        :param proxy_urls: urls of the proxies
+        :type proxy_urls: list[str]
+        :param requests_per_minute: average rate limit of each route
+        :type requests_per_minute: float
+        :param burst: number of requests a route can send at once after being idle
+        :type burst: int
+        :param window: number of recent outcomes of a proxy its block rate is computed over
+        :type window: int
+        :param min_observations: a proxy is not retired for its block rate before this many outcomes
+        :type min_observations: int
+        :param max_block_rate: a proxy is retired when its block rate is above this
+        :type max_block_rate: float
+        :param max_consecutive_blocks: a proxy is retired when it is blocked this many times in a row
+        :type max_consecutive_blocks: int
+        :param max_consecutive_failures: a proxy is retired when its requests fail this many times in a row
+        :type max_consecutive_failures: int
+        :param health_decay: weight of the previous health score when an outcome is recorded
+        :type health_decay: float
+        """
+        if not proxy_urls:
+            raise ValueError('A proxy pool needs at least one proxy.')
+        self.proxies = [Proxy(url, TokenBucket(requests_per_minute / 60.0, burst), window=window)
+                        for url in proxy_urls]
+        self.min_observations = min_observations
+        self.max_block_rate = max_block_rate
+        self.max_consecutive_blocks = max_consecutive_blocks
+        self.max_consecutive_failures = max_consecutive_failures
+        self.health_decay = health_decay
+        self.lock = threading.Lock()
+
+    def lease(self):
+        """Lease the live proxy with the fewest leases, the healthiest one among them.
+
+        :rtype: ProxyRoute
+        :raises NoProxyAvailable: when all proxies are retired
+        """
+        with self.lock:
+            live = [proxy for proxy in self.proxies if not proxy.retired]
+            if not live:
+                raise NoProxyAvailable('All %d proxies are retired.' % len(self.proxies))
+            proxy = min(live, key=lambda proxy: (proxy.num_leases, -proxy.health))
+            proxy.num_leases += 1
+        logging.info('Leased proxy %s (health %.2f).' % (proxy.url, proxy.health))
+        return ProxyRoute(self, proxy)
+
+    def release(self, proxy):
+        with self.lock:
+            proxy.num_leases -= 1
+
+    def wait_for_turn(self, proxy):
+        """Wait until the token bucket of the proxy has a token, and take it."""
+        while True:
+            with self.lock:
+                delay = proxy.bucket.take(time.time())
+            if not delay:
+                return
+            time.sleep(delay)
+
+    def report(self, proxy, outcome):
+        """Update the health of the proxy with the outcome of a request, and retire it if it keeps being blocked or
+        failing."""
+        with self.lock:
+            proxy.counts[outcome] += 1
+            proxy.recent.append(outcome)
+            proxy.health = self.health_decay * proxy.health + (1 - self.health_decay) * (outcome == OK)
+            proxy.consecutive_blocks = proxy.consecutive_blocks + 1 if outcome == BLOCKED else 0
+            proxy.consecutive_failures = proxy.consecutive_failures + 1 if outcome == FAILED else 0
+            if proxy.retired or not self.should_retire(proxy):
+                return
+            proxy.retired = True
+        logging.warning('Retired proxy %s: %d blocks and %d failures in a row, block rate %.2f.' %
+                        (proxy.url, proxy.consecutive_blocks, proxy.consecutive_failures, proxy.block_rate))
+
+    def should_retire(self, proxy):
+        """
+        :type proxy: Proxy
+        :rtype: bool
+        """
+        return (proxy.consecutive_blocks >= self.max_consecutive_blocks or
+                proxy.consecutive_failures >= self.max_consecutive_failures or
+                (len(proxy.recent) >= self.min_observations and proxy.block_rate > self.max_block_rate))
+
+    def stats(self):
+        with self.lock:
+            return [proxy.to_dict() for proxy in self.proxies]
+
+
+def read_proxy_urls(file_path):
+    """Read proxy urls from a file with a url per line. Empty lines and lines starting with # are skipped.
+
+    :rtype: list[str]
+    """
+    with open(file_path, 'rt') as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def add_proxy_arguments(argparser):
+    """Add the command line arguments of a ProxyPool."""
+    argparser.add_argument('--proxies', type=str, default=None,
+                           help='When given requests go through the proxies listed in this file, a url per line, '
+                                'e.g. socks5://10.0.0.2:1080 (see proxies.py)')
+    argparser.add_argument('--proxy-requests-per-minute', type=float, default=6.0,
+                           help='With --proxies, the average number of requests per minute through each proxy')
+    argparser.add_argument('--proxy-burst', type=int, default=1,
+                           help='With --proxies, the number of requests a proxy can send at once after being idle')
+
+
+def get_proxy_pool(args):
+    """Get the ProxyPool of command line arguments added by add_proxy_arguments, None without --proxies.
+
+    :rtype: ProxyPool
+    """
+    if not args.proxies:
+        return None
+    return ProxyPool(read_proxy_urls(args.proxies), requests_per_minute=args.proxy_requests_per_minute,
+                     burst=args.proxy_burst)
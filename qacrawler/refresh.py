@@ -0,0 +1,125 @@
+"""
+Schedule the re-crawl of entries whose saved results are stale, low-yield or parsed by an older parser version.
+
+Each JSON output has crawl_metadata recorded at save time: when it was crawled, the number of results and
+snippets, and sr_parser.PARSER_VERSION. Outputs saved before metadata was recorded are taken as parser version 0,
+crawled at their file modification time. Entries are scheduled in priority order: outputs of older parser versions
+first, then the ones with fewer snippets, then the oldest ones.
+
+Re-crawl with main.py --refresh and the criteria below, or list the scheduled entries with this script.
+
+$ python refresh.py --output-folder OUTPUT_FOLDER --older-than 90 --min-snippets 41 --outdated-parser
+"""
+import argparse
+import collections
+import json
+import os
+import time
+
+import crawler
+import reparser
+import sr_parser
+
+OutputStatus = collections.namedtuple('OutputStatus', ['entry_no', 'crawled_at', 'num_snippets', 'parser_version'])
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class RefreshCriteria(object):
+    """An output needs a refresh if it satisfies any of the given criteria."""
+    def __init__(self, older_than_days=None, min_snippets=None, outdated_parser=False, now=None):
+        """
+        :param older_than_days: refresh outputs crawled more than this many days ago
+        :type older_than_days: float
+        :param min_snippets: refresh outputs with fewer snippets than this
+        :type min_snippets: int
+        :param outdated_parser: refresh outputs of parser versions older than sr_parser.PARSER_VERSION
+        :type outdated_parser: bool
+        :param now: the time ages are computed at. Defaults to the current time.
+        :type now: float
+        """
+        now = now if now is not None else time.time()
+        self.cutoff = now - older_than_days * SECONDS_PER_DAY if older_than_days is not None else None
+        self.min_snippets = min_snippets
+        self.outdated_parser = outdated_parser
+
+    def has_criteria(self):
+        return self.cutoff is not None or self.min_snippets is not None or self.outdated_parser
+
+    def needs_refresh(self, status):
+        """
+        :type status: OutputStatus
+        :rtype: bool
+        """
+        return ((self.cutoff is not None and status.crawled_at < self.cutoff) or
+                (self.min_snippets is not None and status.num_snippets < self.min_snippets) or
+                (self.outdated_parser and status.parser_version < sr_parser.PARSER_VERSION))
+
+
+def read_output_status(file_path):
+    """
+    :param file_path: path to a crawler JSON output named after its entry
+    :type file_path: str
+    :return: status of the output, None if the file is not named after an entry
+    :rtype: OutputStatus
+    """
+    match = reparser.ENTRY_FILENAME_PATTERN.match(os.path.basename(file_path))
+    if match is None:
+        return None
+    with open(file_path, 'rt') as f:
+        output = json.load(f)
+    metadata = output.get('crawl_metadata')
+    if metadata is None:
+        num_snippets = sum(1 for result in output['search_results'] if result.get('snippet'))
+        return OutputStatus(int(match.group(1)), os.path.getmtime(file_path), num_snippets, 0)
+    return OutputStatus(int(match.group(1)), metadata['crawled_at'], metadata['num_snippets'],
+                        metadata['parser_version'])
+
+
+def schedule_refresh(output_folder, criteria):
+    """
+    Get the numbers of the entries to re-crawl, in priority order.
+
+    :param output_folder: folder of crawler's JSON outputs
+    :type output_folder: str
+    :type criteria: RefreshCriteria
+    :rtype: list[int]
+    """
+    statuses = [read_output_status(file_path) for file_path in crawler.list_output_files(output_folder)]
+    scheduled = [status for status in statuses if status is not None and criteria.needs_refresh(status)]
+    scheduled.sort(key=lambda status: (status.parser_version, status.num_snippets, status.crawled_at))
+    return [status.entry_no for status in scheduled]
+
+
+def add_criteria_arguments(argparser, prefix=''):
+    """Add the command line arguments of RefreshCriteria, e.g. --PREFIXolder-than."""
+    argparser.add_argument('--%solder-than' % prefix, type=float, default=None, metavar='DAYS',
+                           help='Refresh outputs crawled more than this many days ago')
+    argparser.add_argument('--%smin-snippets' % prefix, type=int, default=None,
+                           help='Refresh outputs with fewer snippets than this')
+    argparser.add_argument('--%soutdated-parser' % prefix, action='store_true',
+                           help='Refresh outputs parsed by parser versions older than %d' % sr_parser.PARSER_VERSION)
+
+
+def get_criteria(args, prefix=''):
+    """Get RefreshCriteria from command line arguments added by add_criteria_arguments.
+
+    :rtype: RefreshCriteria
+    """
+    prefix = prefix.replace('-', '_')
+    return RefreshCriteria(older_than_days=getattr(args, prefix + 'older_than'),
+                           min_snippets=getattr(args, prefix + 'min_snippets'),
+                           outdated_parser=getattr(args, prefix + 'outdated_parser'))
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='List the entries that need to be re-crawled')
+    argparser.add_argument('-o', '--output-folder', type=str, required=True,
+                           help='Folder of crawler output files')
+    add_criteria_arguments(argparser)
+    args = argparser.parse_args()
+    entry_nos = schedule_refresh(args.output_folder, get_criteria(args))
+    print('%d entries need a refresh. First ones: %s' % (len(entry_nos), entry_nos[:10]))
+
+
+if __name__ == '__main__':
+    main()
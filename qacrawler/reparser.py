@@ -0,0 +1,266 @@
+"""
+Re-parse saved search result pages straight from disk.
+
+Reads the HTML files in a folder or in an archive (.zip, .tar, .tar.gz, .tgz), parses each page into SearchResults
+without a browser and writes them in crawler's JSON or TSV format. Pages are parsed in parallel by a process pool.
+
+If a page is named after its Jeopardy entry as the crawler names its outputs
+(e.g. 000042-4680_jeopardy_history_200.html) and the Jeopardy dataset is given, the entry information is included in
+JSON outputs. Other pages are saved under their path relative to the input folder or in the archive, e.g. the
+results of 2016/05/page.html are saved into OUTPUT_FOLDER/2016/05/page.json, hence pages with the same file name in
+different folders do not overwrite each other. The crawl time in the outputs' crawl metadata is when the page was
+saved, i.e. its modification time in the folder or the archive, while the parser version is the current one.
+
+Example command to re-parse a folder of saved pages.
+
+$ python reparser.py --input SAVED_PAGES_FOLDER --output-folder OUTPUT_FOLDER --processes 16 --jeopardy-json JSON
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import tarfile
+import time
+import zipfile
+
+import crawler
+import jeopardy
+import sr_parser
+
+HTML_EXTENSIONS = ('.html', '.htm')
+ENTRY_FILENAME_PATTERN = re.compile(r'^(\d{6})-')
+
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(level=getattr(logging, args.log_level),
+                        format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s')
+    if not os.path.exists(args.output_folder):
+        os.makedirs(args.output_folder)
+    dataset = jeopardy.Dataset(filepath=args.jeopardy_json) if args.jeopardy_json else None
+    start = time.time()
+    num_pages, num_results = reparse(args.input, args.output_folder, dataset=dataset, file_type=args.file_type,
+                                     disable_javascript=not args.javascript_pages, processes=args.processes)
+    logging.info('Parsed %d search results from %d pages in %.1f seconds.' %
+                 (num_results, num_pages, time.time() - start))
+
+
+def reparse(input_path, output_folder, dataset=None, file_type='json', disable_javascript=True, processes=None,
+            chunksize=16):
+    """
+    Parse all saved result pages at input_path in parallel and save their results into output_folder.
+
+    :param input_path: a folder or an archive of saved search result pages
+    :type input_path: str
+    :param output_folder: path to output folder
+    :type output_folder: str
+    :param dataset: Jeopardy dataset to look up entries of the pages. Can be None.
+    :type dataset: jeopardy.Dataset
+    :param file_type: the type of the saved files. Can only have values ['json', 'tsv']
+    :type file_type: str
+    :param disable_javascript: whether pages were saved with Javascript disabled. Chooses the Google DOM information.
+    :type disable_javascript: bool
+    :param processes: number of worker processes. Defaults to the number of CPUs.
+    :type processes: int
+    :param chunksize: number of pages sent to a worker at once
+    :type chunksize: int
+    :return: number of parsed pages and the total number of search results
+    :rtype: (int, int)
+    """
+    tasks = (ReparseTask(source, name, content, saved_at, find_entry(dataset, name), output_folder, file_type)
+             for source, name, content, saved_at in iterate_saved_pages(input_path))
+    pool = multiprocessing.Pool(processes=processes, initializer=sr_parser.set_gdom,
+                                initargs=(disable_javascript,))
+    num_pages, num_results = 0, 0
+    try:
+        for name, page_num_results in pool.imap_unordered(reparse_page, tasks, chunksize=chunksize):
+            if page_num_results is None:
+                continue
+            num_pages += 1
+            num_results += page_num_results
+            if num_pages % 10000 == 0:
+                logging.info('Parsed %d pages.' % num_pages)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return num_pages, num_results
+
+
+class ReparseTask(object):
+    """A saved page to be parsed by a worker process, and where to save its results."""
+    def __init__(self, source, name, content, saved_at, entry, output_folder, file_type):
+        """
+        :param source: path of the folder or the archive the page is in
+        :type source: str
+        :param name: path of the page relative to the folder or member name in the archive
+        :type name: str
+        :param content: HTML source of the page. If None the worker reads the page itself.
+        :type content: str
+        :param saved_at: modification time of the page, as seconds since the epoch, i.e. when it was crawled
+        :type saved_at: float
+        :param entry: Jeopardy entry of the page if known, else None
+        :type entry: jeopardy.Entry
+        """
+        self.source = source
+        self.name = name
+        self.content = content
+        self.saved_at = saved_at
+        self.entry = entry
+        self.output_folder = output_folder
+        self.file_type = file_type
+
+
+def reparse_page(task):
+    """
+    Parse one saved page and save its results. Runs in a worker process.
+
+    :type task: ReparseTask
+    :return: name of the page and the number of results in it, which is None when the page could not be parsed
+    :rtype: (str, int)
+    """
+    try:
+        page_source = task.content if task.content is not None else read_saved_page(task.source, task.name)
+        results = sr_parser.parse_results_page_source(page_source)
+        save_reparsed_results(results, task)
+    except Exception:
+        logging.exception('Could not re-parse %s.' % task.name)
+        return task.name, None
+    return task.name, len(results)
+
+
+def save_reparsed_results(results, task):
+    """Save results with the crawler's file name if the entry is known, otherwise with the page's file name."""
+    if task.entry is not None:
+        crawler.save_results_for_entry(results, task.entry, task.output_folder, file_type=task.file_type,
+                                       crawled_at=task.saved_at)
+        return
+    if task.file_type == 'json':
+        formatted_results = crawler.results_list_to_output(results, entry=None, crawled_at=task.saved_at)
+    else:
+        formatted_results = crawler.results_list_to_tsv(results)
+    file_path = get_output_path(task)
+    try:
+        os.makedirs(os.path.dirname(file_path))
+    except OSError:
+        if not os.path.isdir(os.path.dirname(file_path)):  # else another worker created it first
+            raise
+    with open(file_path, 'wt') as f:
+        f.write(formatted_results)
+
+
+def get_output_path(task):
+    """Output path of a page, at the page's relative path in the output folder, with the output file type.
+
+    :type task: ReparseTask
+    :rtype: str
+    """
+    parts = [part for part in task.name.replace('\\', '/').split('/') if part and part != '.']
+    if '..' in parts:
+        raise ValueError('Page path %s is outside of its folder or archive.' % task.name)
+    page_name = os.path.splitext(parts[-1])[0]
+    return os.path.join(task.output_folder, *(parts[:-1] + ['%s.%s' % (page_name, task.file_type)]))
+
+
+def iterate_saved_pages(input_path):
+    """
+    Iterate over the saved pages in a folder or an archive, with their modification times.
+
+    Pages in folders and zip archives are read by the workers, hence only their names are yielded. Tar archives
+    can only be read sequentially, hence their pages are yielded with contents.
+
+    :param input_path: a folder or an archive of saved search result pages
+    :type input_path: str
+    :return: source, name, content (or None) and modification time (seconds since the epoch) of pages
+    :rtype: generator[(str, str, str, float)]
+    """
+    if os.path.isdir(input_path):
+        for folder, _, file_names in os.walk(input_path):
+            for file_name in sorted(file_names):
+                if is_html_file(file_name):
+                    file_path = os.path.join(folder, file_name)
+                    yield input_path, os.path.relpath(file_path, input_path), None, os.path.getmtime(file_path)
+    elif zipfile.is_zipfile(input_path):
+        with zipfile.ZipFile(input_path) as archive:
+            infos = archive.infolist()
+        for info in infos:
+            if is_html_file(info.filename):
+                yield input_path, info.filename, None, time.mktime(info.date_time + (0, 0, -1))  # local time
+    elif tarfile.is_tarfile(input_path):
+        archive = tarfile.open(input_path)
+        try:
+            for member in archive:
+                if member.isfile() and is_html_file(member.name):
+                    yield input_path, member.name, archive.extractfile(member).read(), float(member.mtime)
+        finally:
+            archive.close()
+    else:
+        raise ValueError('%s is neither a folder nor a zip or tar archive.' % input_path)
+
+
+_open_zip_archives = {}
+
+
+def read_saved_page(source, name):
+    """Read a saved page from a folder or a zip archive. Zip archives are kept open per worker process."""
+    if os.path.isdir(source):
+        with open(os.path.join(source, name), 'rt') as f:
+            return f.read()
+    if source not in _open_zip_archives:
+        _open_zip_archives[source] = zipfile.ZipFile(source)
+    return _open_zip_archives[source].read(name)
+
+
+def is_html_file(name):
+    return name.lower().endswith(HTML_EXTENSIONS)
+
+
+def find_entry(dataset, name):
+    """Get the Jeopardy entry of a page named as the crawler names its outputs, if possible.
+
+    :rtype: jeopardy.Entry
+    """
+    if dataset is None:
+        return None
+    match = ENTRY_FILENAME_PATTERN.match(os.path.basename(name))
+    if match is None:
+        return None
+    entry_no = int(match.group(1))
+    if entry_no >= dataset.size:
+        return None
+    return dataset.get_entry(entry_no)
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Re-parse saved Google search result pages')
+    argparser.add_argument('-i', '--input', type=str, required=True,
+                           help='A folder or an archive (.zip, .tar, .tar.gz, .tgz) of saved result pages')
+    argparser.add_argument('-o', '--output-folder', type=str, required=True,
+                           help='The output files will be written there. '
+                                'If given folder does not exist it will be created first.')
+    argparser.add_argument('-j', '--jeopardy-json', type=str, default=None,
+                           help='Path to Jeopardy dataset file to include entry information in outputs')
+    argparser.add_argument('-t', '--file-type', type=str, default='json',
+                           help='The type of the output files',
+                           choices=['json', 'tsv'])
+    argparser.add_argument('-p', '--processes', type=int, default=None,
+                           help='Number of worker processes. Defaults to the number of CPUs.')
+    argparser.add_argument('--javascript-pages', action='store_true',
+                           help='When included pages are parsed as if they were saved with JavaScript enabled')
+    argparser.add_argument('-g', '--log-level', type=str, default='INFO',
+                           help='Set the level of log messages',
+                           choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = argparser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    main()
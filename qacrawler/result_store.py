@@ -0,0 +1,266 @@
+"""
+SQLite store of crawled entries and search results, with full-text search over snippets.
+
+Tables:
+- entries: one row per Jeopardy entry with its metadata, the number of results and when they were stored
+- urls: distinct result URLs and their hosts
+- results: one row per search result with entry_id, rank (starting from 0), url_id, title, snippet and related
+  links (a JSON list). Indexed on entry id, rank and URL.
+- snippets: FTS4 index of result snippets, where docid is the id of the result
+
+A ResultStore can be a sink of crawler.save_results_for_entry (see main.py --sqlite), to store results as they are
+crawled. Inserts are buffered and written in one transaction per batch, so the store keeps up with the crawl.
+Re-crawled entries replace their earlier results. Existing crawler outputs can be imported with this script.
+
+Example command to import a crawl.
+
+$ python result_store.py --input-folder OUTPUT_FOLDER --database crawl.db
+
+Example queries:
+
+SELECT entry_id, rank FROM results JOIN urls ON urls.id = results.url_id WHERE url = 'https://en.wikipedia.org/...';
+SELECT results.entry_id, results.rank FROM snippets JOIN results ON results.id = snippets.docid
+    WHERE snippets MATCH '"swiss cheese"';
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import crawler
+import interning
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    tag TEXT,
+    question TEXT,
+    answer TEXT,
+    category TEXT,
+    air_date TEXT,
+    show_number TEXT,
+    round TEXT,
+    value TEXT,
+    num_results INTEGER,
+    stored_at REAL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT UNIQUE NOT NULL,
+    host TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    entry_id INTEGER NOT NULL REFERENCES entries(id),
+    rank INTEGER NOT NULL,
+    url_id INTEGER REFERENCES urls(id),
+    title TEXT,
+    snippet TEXT,
+    related_links TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS results_entry_id_rank ON results (entry_id, rank);
+CREATE INDEX IF NOT EXISTS results_rank ON results (rank);
+CREATE INDEX IF NOT EXISTS results_url_id ON results (url_id);
+CREATE INDEX IF NOT EXISTS urls_host ON urls (host);
+"""
+FULL_TEXT_SCHEMA = 'CREATE VIRTUAL TABLE IF NOT EXISTS snippets USING fts4(snippet)'
+ENTRY_COLUMNS = ['id', 'tag', 'question', 'answer', 'category', 'air_date', 'show_number', 'round', 'value']
+
+
+class ResultStore(object):
+    def __init__(self, database_path, batch_size=100, flush_interval=10.0):
+        """
+        :param database_path: path to SQLite database file. It is created if it does not exist.
+        :type database_path: str
+        :param batch_size: number of entries written in one transaction
+        :type batch_size: int
+        :param flush_interval: maximum seconds an added entry waits to be written
+        :type flush_interval: float
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Entries can be added from another thread than the one that opened the store, e.g. pipeline's writer.
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.has_full_text_search = self.create_full_text_index()
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last_flush = time.time()
+
+    def create_full_text_index(self):
+        try:
+            self.connection.execute(FULL_TEXT_SCHEMA)
+            return True
+        except sqlite3.OperationalError:
+            logging.warning('SQLite is compiled without FTS4. Snippets are searched without a full-text index.')
+            return False
+
+    def add(self, entry, results):
+        """
+        Add an entry and its search results. Called by crawler.save_results_for_entry.
+
+        :type entry: jeopardy.Entry
+        :type results: list[sr_parser.SearchResult]
+        """
+        entry_dict = entry.to_dict()
+        entry_dict['tag'] = entry.tag
+        self.add_result_dicts(entry_dict, [res.to_dict() for res in results])
+
+    def add_result_dicts(self, entry_dict, result_dicts):
+        """
+        Add an entry and its search results as they are in crawler's JSON outputs.
+
+        :param entry_dict: entry information with keys in ENTRY_COLUMNS
+        :type entry_dict: dict
+        :param result_dicts: search results in rank order with keys title, url, snippet and related_links
+        :type result_dicts: list[dict]
+        """
+        with self.lock:
+            self.pending.append((entry_dict, result_dicts, time.time()))
+            if len(self.pending) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval:
+                self.flush_pending()
+
+    def flush(self):
+        """Write all pending entries."""
+        with self.lock:
+            self.flush_pending()
+
+    def flush_pending(self):
+        pending, self.pending = self.pending, []
+        self.last_flush = time.time()
+        if not pending:
+            return
+        with self.connection:  # one transaction, committed at the end or rolled back on error
+            for entry_dict, result_dicts, stored_at in pending:
+                self.write_entry(entry_dict, result_dicts, stored_at)
+        logging.debug('Stored %d entries.', len(pending))
+
+    def write_entry(self, entry_dict, result_dicts, stored_at):
+        cursor = self.connection.cursor()
+        entry_id = entry_dict['id']
+        if self.has_full_text_search:
+            cursor.execute('DELETE FROM snippets WHERE docid IN (SELECT id FROM results WHERE entry_id = ?)',
+                           (entry_id,))
+        cursor.execute('DELETE FROM results WHERE entry_id = ?', (entry_id,))
+        cursor.execute('INSERT OR REPLACE INTO entries (%s, num_results, stored_at) VALUES (%s)' %
+                       (', '.join(ENTRY_COLUMNS), ', '.join('?' * (len(ENTRY_COLUMNS) + 2))),
+                       [entry_dict.get(column) for column in ENTRY_COLUMNS] + [len(result_dicts), stored_at])
+        for rank, result in enumerate(result_dicts):
+            cursor.execute('INSERT INTO results (entry_id, rank, url_id, title, snippet, related_links) '
+                           'VALUES (?, ?, ?, ?, ?, ?)',
+                           (entry_id, rank, self.get_url_id(cursor, result['url']), result['title'],
+                            result['snippet'], json.dumps(result['related_links'])))
+            if self.has_full_text_search and result['snippet']:
+                cursor.execute('INSERT INTO snippets (docid, snippet) VALUES (?, ?)',
+                               (cursor.lastrowid, result['snippet']))
+
+    @staticmethod
+    def get_url_id(cursor, url):
+        if url is None:
+            return None
+        cursor.execute('INSERT OR IGNORE INTO urls (url, host) VALUES (?, ?)', (url, interning.get_host(url)))
+        cursor.execute('SELECT id FROM urls WHERE url = ?', (url,))
+        return cursor.fetchone()[0]
+
+    def find_url(self, url):
+        """
+        Get the entries that returned a URL.
+
+        :return: (entry id, rank) pairs
+        :rtype: list[(int, int)]
+        """
+        self.flush()
+        return self.connection.execute('SELECT entry_id, rank FROM results JOIN urls ON urls.id = results.url_id '
+                                       'WHERE url = ? ORDER BY entry_id, rank', (url,)).fetchall()
+
+    def search_snippets(self, text, max_rank=None):
+        """
+        Get the results of which snippet contains a phrase, e.g. the answer of a question.
+
+        :param text: phrase to search for
+        :type text: unicode
+        :param max_rank: if given, only results ranked below this are searched, e.g. 10 for the top 10
+        :type max_rank: int
+        :return: (entry id, rank) pairs
+        :rtype: list[(int, int)]
+        """
+        self.flush()
+        rank_condition = ' AND results.rank < %d' % max_rank if max_rank is not None else ''
+        if self.has_full_text_search:
+            phrase = u'"%s"' % text.replace(u'"', u' ')
+            query = ('SELECT results.entry_id, results.rank FROM snippets JOIN results ON results.id = snippets.docid '
+                     'WHERE snippets MATCH ?')
+            parameters = (phrase,)
+        else:
+            query = 'SELECT entry_id, rank FROM results WHERE snippet LIKE ?'
+            parameters = (u'%%%s%%' % text,)
+        return self.connection.execute(query + rank_condition + ' ORDER BY results.entry_id, results.rank',
+                                       parameters).fetchall()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def import_crawl(input_folder, store):
+    """
+    Add crawler's JSON outputs in input_folder into a store. Outputs with interned strings are resolved.
+
+    :type store: ResultStore
+    :return: number of imported entries
+    :rtype: int
+    """
+    interner = None
+    num_entries = 0
+    for file_path in crawler.list_output_files(input_folder):
+        with open(file_path, 'rt') as f:
+            output = json.load(f)
+        if 'id' not in output:
+            continue
+        result_dicts = output.pop('search_results')
+        if result_dicts and 'url_id' in result_dicts[0]:
+            interner = interner or interning.CrawlInterner(input_folder)
+            result_dicts = [interner.resolve_result(result) for result in result_dicts]
+        output['tag'] = os.path.splitext(os.path.basename(file_path))[0].split('-', 1)[1]
+        store.add_result_dicts(output, result_dicts)
+        num_entries += 1
+    store.flush()
+    return num_entries
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Import crawled SearchQA data into a SQLite database')
+    argparser.add_argument('-i', '--input-folder', type=str, required=True,
+                           help='Folder of crawler output files')
+    argparser.add_argument('-d', '--database', type=str, required=True,
+                           help='Path to SQLite database file. It is created if it does not exist.')
+    argparser.add_argument('-b', '--batch-size', type=int, default=1000,
+                           help='Number of entries written in one transaction')
+    args = argparser.parse_args()
+    return args
+
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s')
+    store = ResultStore(args.database, batch_size=args.batch_size)
+    try:
+        num_entries = import_crawl(args.input_folder, store)
+    finally:
+        store.close()
+    logging.info('Imported %d entries.' % num_entries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,480 @@
+"""
+Long-running search snippet service.
+
+Keeps a pool of warm crawler workers and answers search requests over a local HTTP/JSON API. Each worker owns a
+browser driver that has already been launched, had its Javascript disabled and its preferences set, hence
+serving a question costs one search round trip instead of a whole crawler start-up.
+
+API
+- POST /search with body {"question": "..."} returns {"question": "...", "search_results": [...]}
+- POST /search with body {"questions": ["...", ...]} returns {"batch": [{"question": ..., "search_results": ...}]}
+  Both accept an optional "timeout" in seconds.
+- GET /health returns the state of the queue, the workers and the cache.
+
+Example command to run the service.
+
+$ python service.py --workers 2 --port 8080 --driver-type Firefox --disable-javascript --results-per-page 50
+"""
+import argparse
+import collections
+import json
+import logging
+import Queue
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import crawler
+import main
+import proxies
+import sr_parser
+import startup
+
+
+class SearchService(object):
+    """
+    Class that dispatches search queries to a pool of warm crawler workers.
+
+    Queries wait in a bounded queue until a worker is free. Results are cached, so that repeated questions do not
+    reach the search engine at all.
+    """
+    def __init__(self, settings_factory, num_workers=1, queue_size=100, cache_size=10000, cache_ttl=86400,
+                 restart_delay=30):
+        """
+        :param settings_factory: function with no arguments that returns a CrawlerSettings with a ready driver
+        :type settings_factory: callable
+        :param num_workers: number of workers, i.e. number of browsers
+        :type num_workers: int
+        :param queue_size: maximum number of queries waiting for a worker
+        :type queue_size: int
+        :param cache_size: maximum number of questions whose results are cached
+        :type cache_size: int
+        :param cache_ttl: number of seconds after which cached results expire
+        :type cache_ttl: float
+        :param restart_delay: number of seconds a worker waits before replacing its broken driver
+        :type restart_delay: float
+        """
+        self.queue = Queue.Queue(maxsize=queue_size)
+        self.cache = ResultCache(max_size=cache_size, ttl=cache_ttl)
+        self.workers = [CrawlerWorker(self.queue, self.cache, settings_factory, restart_delay)
+                        for _ in range(num_workers)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        for _ in self.workers:
+            self.queue.put(None)  # wake up the idle workers
+        for worker in self.workers:
+            worker.join()
+
+    def search(self, question, timeout=60):
+        """
+        Get search results of a question as a list of SearchResult dicts.
+
+        :param question: search query
+        :type question: str
+        :param timeout: number of seconds to wait for the results
+        :type timeout: float
+        :rtype: list[dict]
+        :raises ServiceBusy: when the queue is full
+        :raises SearchTimeout: when the results do not arrive on time
+        """
+        return self.search_batch([question], timeout=timeout)[0]
+
+    def search_batch(self, questions, timeout=60):
+        """
+        Get search results of many questions. All questions are queued at once hence they are served in parallel.
+
+        :param questions: search queries
+        :type questions: list[str]
+        :param timeout: number of seconds to wait for the results of the whole batch
+        :type timeout: float
+        :return: list of SearchResult dict lists, in the order of questions
+        :rtype: list[list[dict]]
+        """
+        deadline = time.time() + timeout
+        jobs = self.submit_batch(questions, deadline)
+        return [job.wait(deadline) for job in jobs]
+
+    def submit_batch(self, questions, deadline):
+        """Put questions in the queue. If the queue fills up, the questions that do not fit fail with ServiceBusy,
+        while the ones already queued are still served.
+
+        :rtype: list[SearchJob]
+        """
+        jobs = []
+        for question in questions:
+            try:
+                jobs.append(self.submit(question, deadline))
+            except ServiceBusy as e:
+                jobs.append(SearchJob.failed(question, e))
+        return jobs
+
+    def submit(self, question, deadline):
+        """Put a question in the queue unless its results are cached.
+
+        :rtype: SearchJob
+        """
+        cached = self.cache.get(question)
+        if cached is not None:
+            logging.debug('Cache hit: %s', question)
+            return SearchJob.finished(question, cached)
+        job = SearchJob(question, deadline)
+        try:
+            self.queue.put_nowait(job)
+        except Queue.Full:
+            raise ServiceBusy('There are already %d queries waiting.' % self.queue.maxsize)
+        return job
+
+    def health(self):
+        return {'queued': self.queue.qsize(),
+                'workers': [worker.state for worker in self.workers],
+                'cache': self.cache.stats()}
+
+
+class CrawlerWorker(threading.Thread):
+    """Thread that owns a browser driver and crawls the queued questions one-by-one."""
+    def __init__(self, queue, cache, settings_factory, restart_delay):
+        super(CrawlerWorker, self).__init__()
+        self.daemon = True
+        self.queue = queue
+        self.cache = cache
+        self.settings_factory = settings_factory
+        self.restart_delay = restart_delay
+        self.settings = None
+        self.state = 'starting'
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.settings is None:
+                self.bring_up_driver()
+                continue
+            job = self.queue.get()
+            if job is None or self.stopped.is_set():
+                break
+            self.serve(job)
+        if self.settings is not None:
+            self.settings.driver.quit()
+            self.release_route()
+
+    def release_route(self):
+        """Give the proxy route of the driver back to the pool, so that the next driver may get another proxy."""
+        if self.settings.route is not None:
+            self.settings.route.release()
+
+    def bring_up_driver(self):
+        self.state = 'starting'
+        try:
+            self.settings = self.settings_factory()
+            self.state = 'ready'
+        except SystemExit:
+            # sr_parser quits the driver and exits when the visits that prepare the driver are blocked or time out.
+            logging.error('The driver stopped while starting. Retrying in %d seconds.', self.restart_delay)
+            self.state = 'restarting'
+            self.stopped.wait(self.restart_delay)
+        except Exception:
+            logging.exception('Could not start a driver. Retrying in %d seconds.' % self.restart_delay)
+            self.stopped.wait(self.restart_delay)
+
+    def serve(self, job):
+        if job.expired():
+            job.fail(SearchTimeout('Timed out while waiting in the queue.'))
+            return
+        self.state = 'busy'
+        try:
+            results = sr_parser.collect_query_results_from_google(job.question, self.settings)
+        except SystemExit:
+            # sr_parser quits the driver and exits when caught by bot police or on connection problems.
+            self.release_route()
+            self.settings = None
+            self.state = 'restarting'
+            job.fail(WorkerFailure('The driver of the worker stopped while searching.'))
+            self.stopped.wait(self.restart_delay)
+            return
+        except Exception as e:
+            logging.exception('Searching "%s" failed.' % job.question)
+            job.fail(WorkerFailure(str(e)))
+        else:
+            result_dicts = [res.to_dict() for res in results]
+            if result_dicts:  # no results may be a failed or unparsable page, which should not be kept for ttl
+                self.cache.put(job.question, result_dicts)
+            job.finish(result_dicts)
+        self.state = 'ready'
+
+    def stop(self):
+        self.stopped.set()
+
+
+class SearchJob(object):
+    """A question waiting in the queue, and later, its results."""
+    def __init__(self, question, deadline):
+        self.question = question
+        self.deadline = deadline
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+    @classmethod
+    def finished(cls, question, results):
+        job = cls(question, deadline=None)
+        job.finish(results)
+        return job
+
+    @classmethod
+    def failed(cls, question, error):
+        job = cls(question, deadline=None)
+        job.fail(error)
+        return job
+
+    def expired(self):
+        return self.deadline is not None and time.time() > self.deadline
+
+    def finish(self, results):
+        self.results = results
+        self.done.set()
+
+    def fail(self, error):
+        self.error = error
+        self.done.set()
+
+    def wait(self, deadline):
+        self.done.wait(max(0.0, deadline - time.time()))
+        if not self.done.is_set():
+            raise SearchTimeout('No results for "%s" in time.' % self.question)
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+
+class ResultCache(object):
+    """Thread-safe least-recently-used cache whose items expire after ttl seconds."""
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is None or time.time() - item[0] > self.ttl:
+                self.misses += 1
+                return None
+            self.items[key] = item  # re-insert to mark as most recently used
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = (time.time(), value)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def stats(self):
+        return {'size': len(self.items), 'hits': self.hits, 'misses': self.misses}
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """Translates HTTP requests into SearchService calls. The service is reached via self.server.service."""
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, self.server.service.health())
+        else:
+            self.send_json(404, {'error': 'Unknown path %s' % self.path})
+
+    def do_POST(self):
+        if self.path != '/search':
+            self.send_json(404, {'error': 'Unknown path %s' % self.path})
+            return
+        try:
+            length = int(self.headers.getheader('content-length', 0))
+            request = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_json(400, {'error': 'Request body is not valid JSON.'})
+            return
+        error = validate_search_request(request)
+        if error is not None:
+            self.send_json(400, {'error': error})
+            return
+        timeout = request.get('timeout') or self.server.default_timeout
+        try:
+            if 'questions' in request:
+                response = self.search_batch(request['questions'], timeout)
+            else:
+                results = self.server.service.search(request['question'], timeout)
+                response = {'question': request['question'], 'search_results': results}
+        except ServiceError as e:
+            self.send_json(e.http_status, {'error': str(e)})
+            return
+        self.send_json(200, response)
+
+    def search_batch(self, questions, timeout):
+        """Answer every question of the batch. Failures are reported per question."""
+        deadline = time.time() + timeout
+        jobs = self.server.service.submit_batch(questions, deadline)
+        batch = []
+        for job in jobs:
+            try:
+                batch.append({'question': job.question, 'search_results': job.wait(deadline)})
+            except ServiceError as e:
+                batch.append({'question': job.question, 'error': str(e)})
+        return {'batch': batch}
+
+    def send_json(self, status, body):
+        content = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug('%s ' + format, self.client_address[0], *args)  # address_string() looks up the host name
+
+
+def validate_search_request(request):
+    """
+    :return: what is wrong with the body of a search request, None if it is valid
+    :rtype: str
+    """
+    if not isinstance(request, dict):
+        return 'Request must be a JSON object.'
+    if 'questions' in request:
+        questions = request['questions']
+        if not isinstance(questions, list) or not all(isinstance(question, basestring) for question in questions):
+            return '"questions" must be a list of strings.'
+    elif 'question' in request:
+        if not isinstance(request['question'], basestring):
+            return '"question" must be a string.'
+    else:
+        return 'Request must have "question" or "questions".'
+    timeout = request.get('timeout')
+    if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, long, float)) or
+                                timeout <= 0):
+        return '"timeout" must be a positive number of seconds.'
+    return None
+
+
+class SearchHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server that handles each request in its own thread, so that a slow batch does not block others."""
+    daemon_threads = True
+
+    def __init__(self, address, service, default_timeout=60):
+        HTTPServer.__init__(self, address, SearchRequestHandler)
+        self.service = service
+        self.default_timeout = default_timeout
+
+
+class ServiceError(Exception):
+    http_status = 500
+
+
+class ServiceBusy(ServiceError):
+    http_status = 503
+
+
+class SearchTimeout(ServiceError):
+    http_status = 504
+
+
+class WorkerFailure(ServiceError):
+    http_status = 502
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Serve Google search results of questions over HTTP')
+    argparser.add_argument('--host', type=str, default='127.0.0.1',
+                           help='Address on which the service listens')
+    argparser.add_argument('-p', '--port', type=int, default=8080,
+                           help='Port on which the service listens')
+    argparser.add_argument('-k', '--workers', type=int, default=1,
+                           help='Number of warm crawler workers (browsers)')
+    argparser.add_argument('-d', '--driver-type', type=str, default='Firefox',
+                           help='The browser/driver type to be used by crawler',
+                           choices=['Firefox', 'Chrome', 'PhantomJS'])
+    argparser.add_argument('-n', '--num-pages', type=int, default=1,
+                           help='Number of search result pages to parse per query')
+    main.add_logging_arguments(argparser)
+    argparser.add_argument('-w', '--wait-duration', type=int, default=4,
+                           help='Number of seconds to wait before getting the next page')
+    argparser.add_argument('--simulate-typing', action='store_true',
+                           help='When included simulates human typing by pressing keys one-by-one')
+    argparser.add_argument('--simulate-clicking', action='store_true',
+                           help='When included simulates mouse clicking on next page link')
+    argparser.add_argument('--disable-javascript', action='store_true',
+                           help='When included disables JavaScript (only for Firefox)')
+    argparser.add_argument('--results-per-page', type=int, default=10,
+                           help='The number of search results in a page per query',
+                           choices=[10, 20, 30, 50, 100])
+    argparser.add_argument('--queue-size', type=int, default=100,
+                           help='Maximum number of questions waiting for a worker')
+    argparser.add_argument('--timeout', type=float, default=60,
+                           help='Default number of seconds to wait for the results of a request')
+    argparser.add_argument('--cache-size', type=int, default=10000,
+                           help='Maximum number of questions whose results are cached')
+    argparser.add_argument('--cache-ttl', type=float, default=86400,
+                           help='Number of seconds after which cached results expire')
+    proxies.add_proxy_arguments(argparser)
+    args = argparser.parse_args()
+    return args
+
+
+def get_settings_factory(args):
+    """Get a function that brings up a new driver and wraps it into CrawlerSettings.
+
+    With --proxies, each driver gets a proxy route of a pool shared by the workers."""
+    proxy_pool = proxies.get_proxy_pool(args)
+
+    def settings_factory():
+        report = startup.StartupReport()
+        route = proxy_pool.lease() if proxy_pool is not None else None
+        try:
+            driver = main.get_prepared_driver(args.driver_type, args.disable_javascript, args.results_per_page,
+                                              report=report, route=route)
+        except BaseException:
+            if route is not None:
+                route.release()
+            raise
+        report.log_ready()
+        return crawler.CrawlerSettings(driver, args.num_pages, None, args.wait_duration,
+                                       args.simulate_typing, args.simulate_clicking, args.disable_javascript,
+                                       route=route)
+    return settings_factory
+
+
+def serve():
+    args = parse_command_line_arguments()
+    main.configure_logging_by_arguments(args, log_file='search_service.log')
+    service = SearchService(get_settings_factory(args), num_workers=args.workers, queue_size=args.queue_size,
+                            cache_size=args.cache_size, cache_ttl=args.cache_ttl)
+    service.start()
+    server = SearchHTTPServer((args.host, args.port), service, default_timeout=args.timeout)
+    logging.info('Serving on %s:%d with %d workers.' % (args.host, args.port, args.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        logging.info('End.')
+
+
+if __name__ == '__main__':
+    serve()
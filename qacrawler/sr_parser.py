@@ -6,24 +6,28 @@ A SearchResult is an object that holds parsed search results.
 collect_query_results_from_google() function is to crawl a query's search results into SearchResult objects.
 
 Terminology is taken from Google help at: https://support.google.com/websearch/answer/35891?hl=en#results
+
+Selenium is imported by the functions that drive the browser, hence parsing saved pages does not load it.
 """
 import logging
 import random
+import re
 import sys
 import time
+import urllib
 
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
 from bs4 import BeautifulSoup
 
 import google_dom_info
+import proxies
 
 GDOM = None
+GOOGLE_URL = 'http://google.com'
+GOOGLE_PREFERENCES_URL = 'http://www.google.com/preferences?hl=en'
+# Increase when a change in parsing changes the results, so that outputs of older versions can be re-crawled.
+PARSER_VERSION = 1
+NUMBER_OF_RESULTS_PATTERN = re.compile(r'(\d[\d,.\s]*)\s+results?\b', re.UNICODE)
+BOT_POLICE_TEXT = 'Our systems have detected unusual traffic'
 
 
 def collect_query_results_from_google(query, settings):
@@ -37,17 +41,68 @@ def collect_query_results_from_google(query, settings):
     :return: A list of SearchResult objects
     :rtype: list[SearchResult]
     """
+    submit_query_to_google(query, settings)
+    all_results = parse_n_search_result_pages(settings, num_pages=settings.num_pages,
+                                              wait_duration=settings.wait_duration, query=query)
+    return all_results
+
+
+def submit_query_to_google(query, settings):
+    """Open Google, check for bot police and submit the query into the search box."""
+    from selenium.common.exceptions import WebDriverException
     set_gdom(settings.disable_javascript)
-    if settings.disable_javascript:
-        visit_google(settings.driver, query='%20')  # request a search result page with no results
-    else:
-        visit_google(settings.driver)
-    check_google_bot_police(settings.driver)
-    search_box = wait_for_and_get_search_box(settings.driver)
+    wait_for_route(settings)
+    try:
+        if settings.disable_javascript:
+            visit_google(settings.driver, query='%20')  # request a search result page with no results
+        else:
+            visit_google(settings.driver)
+    except WebDriverException:
+        report_to_route(settings.route, proxies.FAILED)
+        raise
+    check_google_bot_police(settings.driver, settings.route)
+    search_box = wait_for_and_get_search_box(settings.driver, settings.route)
     submit_query(query, search_box, settings.simulate_typing, settings.driver)
-    all_results = parse_n_search_result_pages(settings,
-                                              num_pages=settings.num_pages, wait_duration=settings.wait_duration)
-    return all_results
+
+
+def iterate_search_result_page_sources(query, settings):
+    """
+    Submit query and yield the HTML source of each search result page, without parsing them.
+
+    Pages are requested the same way as in parse_n_search_result_pages: after a page is yielded, waiting before
+    and requesting the next page happen when the next item is asked for. Hence the consumer can parse a page
+    (e.g. on another thread) while the driver waits for and loads the next page.
+
+    :param query: search query
+    :type query: str
+    :param settings: Crawler settings object
+    :type settings: qacrawler.crawler.CrawlerSettings
+    :rtype: generator[str]
+    """
+    from selenium.common.exceptions import TimeoutException
+    submit_query_to_google(query, settings)
+    num_snippets = 0
+    for page_no in range(settings.num_pages):
+        logging.debug('Loading page %d.', page_no)
+        try:
+            wait_for_search_results(settings.driver)
+        except TimeoutException:
+            logging.warning('TimeoutException: Either there are no search results (e.g. false alarm) '
+                            'or there is connection problem.')
+            report_to_route(settings.route, get_outcome_of_page_without_results(settings.driver))
+            observe_page(settings, [], query, page_no)
+            return
+        check_google_bot_police(settings.driver, settings.route)
+        report_to_route(settings.route, proxies.OK)
+        yield settings.driver.page_source
+        wait_with_variance(duration=settings.wait_duration)
+        num_snippets += count_snippets_on_opened_page(settings.driver)
+        if not should_request_next_page(settings, num_snippets, page_no):
+            return
+        wait_for_route(settings)
+        next_page_exists = request_next_page(settings.driver, settings.simulate_clicking, settings.disable_javascript)
+        if not next_page_exists:
+            return
 
 
 def set_gdom(disable_javascript):
@@ -59,29 +114,87 @@ def set_gdom(disable_javascript):
         GDOM = google_dom_info.GoogleDomInfoWithJS
 
 
+def set_google_url(url):
+    """Point the crawler to another address serving Google's pages, e.g. a local stand-in server for testing."""
+    global GOOGLE_URL, GOOGLE_PREFERENCES_URL
+    GOOGLE_URL = url
+    GOOGLE_PREFERENCES_URL = url + '/preferences?hl=en'
+
+
 def visit_google(driver, query=None):
     """If a query is given directly search that query otherwise just open Google's front page."""
-    url = 'http://google.com'
+    url = GOOGLE_URL
     if query is not None:
         url = url + '/search?q=' + query
     driver.get(url)  # visit a search results page with no search results
 
 
-def check_google_bot_police(driver):
-    """Give error and quit if caught by Google Bot Police."""
-    robot_police_text = 'Our systems have detected unusual traffic'
-    if robot_police_text in driver.page_source:
+def get_search_url(query):
+    """Url of the first search result page of query, to request it without typing into the search box."""
+    if isinstance(query, unicode):
+        query = query.encode('utf-8')
+    return GOOGLE_URL + '/search?' + urllib.urlencode({'q': query})
+
+
+def check_google_bot_police(driver, route=None):
+    """Give error and quit if caught by Google Bot Police.
+
+    :param route: if given, the block is reported to the proxy pool of the route
+    :type route: qacrawler.proxies.ProxyRoute
+    """
+    if is_caught_by_bot_police(driver):
         logging.critical('Caught by Google Bot Police :-(. Exiting...')
+        report_to_route(route, proxies.BLOCKED)
         quit_driver_and_exit(driver)
 
 
-def wait_for_and_get_search_box(driver):
+def is_caught_by_bot_police(driver):
+    """Whether the opened page is Google's "unusual traffic" page instead of the requested one."""
+    return BOT_POLICE_TEXT in driver.page_source
+
+
+def report_to_route(route, outcome):
+    """Report whether a request got through (OK), was blocked (BLOCKED) or failed (FAILED) to the proxy pool of the
+    route, if there is a route.
+
+    Results pages report their outcome once they are loaded, the pages before them only report blocks and failures.
+
+    :type route: qacrawler.proxies.ProxyRoute
+    """
+    if route is not None:
+        route.report(outcome)
+
+
+def get_outcome_of_page_without_results(driver):
+    """A results page without results got through if it is Google's page, e.g. of a query without results, and
+    failed otherwise, e.g. the browser's page of a connection error."""
+    from selenium.webdriver.common.by import By
+    if driver.find_elements(By.XPATH, GDOM.SEARCH_BOX_XPATH):
+        return proxies.OK
+    return proxies.FAILED
+
+
+def wait_for_route(settings):
+    """Wait until the rate limit of the settings' proxy route allows another request, if there is a route."""
+    if settings.route is not None:
+        settings.route.wait()
+
+
+def wait_for_and_get_search_box(driver, route=None):
+    from selenium.webdriver.common.by import By
     search_box_locator = (By.XPATH, GDOM.SEARCH_BOX_XPATH)
-    search_box = wait_for_presence_and_get_element(driver, search_box_locator)
+    search_box = wait_for_presence_and_get_element(driver, search_box_locator, route=route)
     return search_box
 
 
-def wait_for_presence_and_get_element(driver, locator, timeout=10):
+def wait_for_presence_and_get_element(driver, locator, timeout=10, route=None):
+    """
+    :param route: if given, a timeout is reported to the proxy pool of the route as a failure
+    :type route: qacrawler.proxies.ProxyRoute
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
     try:
         condition = EC.presence_of_element_located(locator)
         element = WebDriverWait(driver, timeout=timeout).until(condition)
@@ -89,6 +202,7 @@ def wait_for_presence_and_get_element(driver, locator, timeout=10):
     except TimeoutException:
         logging.critical('TimeoutException: Could not get the element at %s. ' % str(locator) +
                          'There is a connection problem. Exiting.')
+        report_to_route(route, proxies.FAILED)
         quit_driver_and_exit(driver)
 
 
@@ -107,6 +221,8 @@ def submit_query(query, search_box, simulate_typing, driver):
 
 def submit_query_by_typing(driver, query, search_box):
     """Submit query by sending keys one-by-one."""
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.common.keys import Keys
     ActionChains(driver).move_to_element(search_box).click().perform()
     simulate_typing(search_box, query)
     result_divs = driver.find_elements_by_class_name(GDOM.RESULT_DIV_CLASS)
@@ -118,6 +234,8 @@ def submit_query_by_typing(driver, query, search_box):
 
 def wait_for_page_load_after_submission(driver, result_divs):
     """Wait for the query string to arrive Search Engine."""
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
     logging.debug('wait for staleness after submitting search query')
     WebDriverWait(driver, timeout=5).until(
         EC.staleness_of(result_divs[0])
@@ -133,13 +251,14 @@ def simulate_typing(element, text):
 
 def submit_query_at_once(query, search_box):
     """Submit query by entering whole question string at once."""
+    from selenium.webdriver.common.keys import Keys
     search_box.clear()
     search_box.send_keys(query)
     search_box.send_keys(Keys.ENTER)
     # search_box.submit()
 
 
-def parse_n_search_result_pages(settings, num_pages, wait_duration):
+def parse_n_search_result_pages(settings, num_pages, wait_duration, query=None):
     """
     Parse num_pages of search result pages and return all SearchResults found.
 
@@ -147,23 +266,110 @@ def parse_n_search_result_pages(settings, num_pages, wait_duration):
     :type wait_duration: float
     :param num_pages: Number of search result pages to parse per query
     :type num_pages: int
+    :param query: the submitted search query, for the watchdog's reports
+    :type query: str
     :return: list of SearchResult parsed from num_pages of search result pages
     :rtype: list[SearchResult]
     """
     all_results = []
     for page_no in range(num_pages):
-        logging.debug('Parsing page %d.' % page_no)
-        page_results = parse_one_search_result_page(settings.driver)
+        logging.debug('Parsing page %d.', page_no)
+        page_results = parse_one_search_result_page(settings.driver, settings.route)
+        observe_page(settings, page_results, query, page_no)
         if not page_results:
             return all_results
         all_results.extend(page_results)
         wait_with_variance(duration=wait_duration)
+        if not should_request_next_page(settings, count_snippets(all_results), page_no):
+            break
+        wait_for_route(settings)
         next_page_exists = request_next_page(settings.driver, settings.simulate_clicking, settings.disable_javascript)
         if not next_page_exists:
             break
     return all_results
 
 
+def observe_page(settings, results, query, page_no):
+    """Report the results parsed from the opened page to the watchdog of the settings, if there is one."""
+    if settings.watchdog is not None:
+        settings.watchdog.observe_page(results, lambda: settings.driver.page_source, query=query, page_no=page_no)
+
+
+def should_request_next_page(settings, num_snippets, page_no):
+    """
+    Decide whether to request the page after page_no. Never request a page beyond settings.num_pages. If the
+    settings have a pagination policy, also stop when the policy's snippet target is met or can not be reached.
+
+    :param settings: Crawler settings object
+    :type settings: qacrawler.crawler.CrawlerSettings
+    :param num_snippets: number of snippets collected so far for the query
+    :type num_snippets: int
+    :param page_no: number of the opened page, starting from 0
+    :type page_no: int
+    :rtype: bool
+    """
+    pages_left = settings.num_pages - page_no - 1
+    if pages_left <= 0:
+        return False
+    policy = settings.pagination_policy
+    if policy is None:
+        return True
+    estimated_num_results = get_estimated_number_of_results(settings.driver) if page_no == 0 else None
+    num_results_on_page = len(get_search_result_divs_on_opened_page(settings.driver))
+    request_next = policy.should_request_next_page(num_snippets, estimated_num_results, pages_left,
+                                                   num_results_on_page)
+    if not request_next:
+        logging.debug('Stop after page %d with %d snippets (about %s results).',
+                      page_no, num_snippets, estimated_num_results)
+    return request_next
+
+
+def get_estimated_number_of_results(driver):
+    """
+    Get Google's estimate of the total number of results of the opened query, e.g. 'About 1,230 results'.
+
+    :return: estimated number of results, None if the page does not show it
+    :rtype: int
+    """
+    from selenium.webdriver.common.by import By
+    result_stats = driver.find_elements(By.ID, GDOM.RESULT_STATS_ID)
+    if not result_stats:
+        return None
+    return parse_number_of_results(result_stats[0].text)
+
+
+def parse_number_of_results(text):
+    """Parse the number in result stats text, e.g. 'About 1,230 results (0.42 seconds)' -> 1230. None if not found.
+
+    :rtype: int
+    """
+    match = NUMBER_OF_RESULTS_PATTERN.search(text)
+    if match is None:
+        return None
+    return int(re.sub(r'\D', '', match.group(1)))
+
+
+def count_snippets(results):
+    """Number of results that have a snippet.
+
+    :type results: list[SearchResult]
+    :rtype: int
+    """
+    return sum(1 for result in results if result.snippet)
+
+
+def count_snippets_on_opened_page(driver):
+    """Number of results with a snippet on the opened page, counted by the browser without parsing the page."""
+    from selenium.webdriver.common.by import By
+    return len(driver.find_elements(By.CSS_SELECTOR, '.%s .%s' % (GDOM.RESULT_DIV_CLASS,
+                                                                  GDOM.RESULT_DESCRIPTION_CLASS)))
+
+
+def get_search_result_divs_on_opened_page(driver):
+    from selenium.webdriver.common.by import By
+    return driver.find_elements(By.CLASS_NAME, GDOM.RESULT_DIV_CLASS)
+
+
 def request_next_page(driver, simulate_clicking, disable_javascript):
     """
     Find next page element/url and if exists request it.
@@ -176,6 +382,7 @@ def request_next_page(driver, simulate_clicking, disable_javascript):
     :return: Whether the next page element exists or not
     :rtype: bool
     """
+    from selenium.webdriver.common.action_chains import ActionChains
     if simulate_clicking:
         next_page_element = get_next_page_element(driver)
         if next_page_element:
@@ -202,6 +409,8 @@ def wait_for_page_load_after_clicking_on_link(driver):
     Our technique to make the operation a blocking operation by waiting until the new page request is to see whether the
     search results that appeared while we were simulated-typing went stale.
     """
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
     a_div = get_search_result_divs(driver)[0]
     logging.debug('wait for staleness after clicking next page')
     WebDriverWait(driver, timeout=5).until(
@@ -210,30 +419,39 @@ def wait_for_page_load_after_clicking_on_link(driver):
     logging.debug('staleness ended')
 
 
-def parse_one_search_result_page(driver):
+def parse_one_search_result_page(driver, route=None):
     """
-    Wait the search result page to load and call page parse function.
+    Wait the search result page to load, check for bot police and call page parse function.
 
     :param driver: selenium driver with which we'll open results page
     :type driver: selenium.webdriver.chrome.webdriver.WebDriver
+    :param route: if given, whether the page got through, was blocked or failed is reported to the proxy pool of
+    the route
+    :type route: qacrawler.proxies.ProxyRoute
     :return: A list of SearchResult objects. If there are no results return an empty list
     :rtype: list[SearchResult]
     """
+    from selenium.common.exceptions import TimeoutException
     try:
         wait_for_search_results(driver)
     except TimeoutException:
         logging.warning('TimeoutException: Either there are no search results (e.g. false alarm) '
-                        'or Google realized that we are a bot :-( '
-                        'or there is connection problem (less likely).')
+                        'or there is connection problem.')
+        report_to_route(route, get_outcome_of_page_without_results(driver))
         return []
+    check_google_bot_police(driver, route)
+    report_to_route(route, proxies.OK)
     results = parse_opened_results_page(driver)
-    logging.debug('Collected %d search results.' % len(results))
+    logging.debug('Collected %d search results.', len(results))
     return results
 
 
 def wait_for_search_results(driver, timeout=10):
-    elem = WebDriverWait(driver, timeout=timeout).until(
-        EC.presence_of_element_located((By.CLASS_NAME, GDOM.RESULT_DIV_CLASS))
+    """Wait until the opened page has search results, or is the bot police's page (which has none)."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    WebDriverWait(driver, timeout=timeout).until(
+        lambda driver: driver.find_elements(By.CLASS_NAME, GDOM.RESULT_DIV_CLASS) or is_caught_by_bot_police(driver)
     )
     logging.debug('wait_for_search_results ENDED')
 
@@ -254,6 +472,7 @@ def get_next_page_element(driver):
     :return: next page element if exists else None
     :rtype: selenium.webdriver.remote.webelement.WebElement
     """
+    from selenium.webdriver.common.by import By
     next_page_elements = driver.find_elements(By.ID, GDOM.NEXT_PAGE_ID)
     if next_page_elements:
         next_page_element = next_page_elements[0]
@@ -272,6 +491,7 @@ def get_next_page_url_js(driver):
     :return: url if exists else None
     :rtype: str
     """
+    from selenium.webdriver.common.by import By
     next_page_link = driver.find_elements(By.ID, GDOM.NEXT_PAGE_ID)
     if next_page_link:
         next_page_url = next_page_link[0].get_attribute('href')
@@ -292,6 +512,7 @@ def get_next_page_url_no_js(driver):
     :return: url if exists else None
     :rtype: str
     """
+    from selenium.webdriver.common.by import By
     navigation_elements = driver.find_elements(By.CLASS_NAME, GDOM.NAVIGATION_LINK_CLASS)
     if not navigation_elements:
         logging.debug('There is no next page.')
@@ -315,18 +536,41 @@ def parse_opened_results_page(driver):
     :return: A list of SearchResult objects
     :rtype: list[SearchResult]
     """
-    elements = get_search_result_divs(driver)
+    return parse_results_page_source(driver.page_source)
+
+
+def parse_results_page_source(page_source):
+    """Parse the HTML source of a search result page into a list of SearchResult objects.
+
+    Does not need a browser, hence saved result pages can be parsed directly from disk.
+
+    :param page_source: HTML source of a search results page
+    :type page_source: str
+    :return: A list of SearchResult objects
+    :rtype: list[SearchResult]
+    """
+    elements = get_search_result_divs_from_source(page_source)
     results = []
     for no, elem in enumerate(elements):
         try:
             results.append(SearchResult(elem))
         except NotAParsableSearchResult:
             logging.debug('Search result DIV no %d is not parsable. '
-                          'It can be a non-website result such as a video.' % no)
+                          'It can be a non-website result such as a video.', no)
             continue
     return results
 
 
+def has_results_container(page_source):
+    """Whether the HTML source of a page has the container of search results, unlike e.g. the page of a query
+    without results or the bot police's page.
+
+    :rtype: bool
+    """
+    soup = BeautifulSoup(page_source, 'html.parser')
+    return soup.find(id=GDOM.RESULTS_CONTAINER_ID) is not None
+
+
 def get_search_result_divs(driver):
     """From the opened page, get a list of DIVs where each DIV is a result.
 
@@ -334,13 +578,27 @@ def get_search_result_divs(driver):
     :type driver: selenium.webdriver.chrome.webdriver.WebDriver
     :rtype: list[bs4.element.Tag]
     """
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
+    return get_search_result_divs_from_source(driver.page_source)
+
+
+def get_search_result_divs_from_source(page_source):
+    """From the HTML source of a results page, get a list of DIVs where each DIV is a result.
+
+    :param page_source: HTML source of a search results page
+    :type page_source: str
+    :rtype: list[bs4.element.Tag]
+    """
+    soup = BeautifulSoup(page_source, 'html.parser')
     elements = soup.select('.' + GDOM.RESULT_DIV_CLASS)  # tag: div
     return elements
 
 
 class SearchResult(object):
-    """Parses search result information such as title, url, snippet from div and keep them in related attributes"""
+    """Parses search result information such as title, url, snippet from div and keep them in related attributes
+
+    Titles, urls and related link texts are interned, hence results of the same page held in memory (e.g. by the
+    pipeline, the tabs or the result sinks) share one string object each.
+    """
     def __init__(self, element):
         """Parse a search result DIV to get title, url, short description.
 
@@ -349,7 +607,7 @@ class SearchResult(object):
         """
         self.element = element
         self.title = self.parse_title(element)
-        logging.debug('parsing result ' + self.title)
+        logging.debug('parsing result %s', self.title)
         self.url = self.parse_url(element)
         self.snippet = self.parse_snippet(element)
         self.related_links = self.parse_related_links(element)
@@ -359,7 +617,7 @@ class SearchResult(object):
         title = element.select_one('.' + GDOM.RESULT_TITLE_CLASS)
         if title is None:
             raise NotAParsableSearchResult
-        return title.text.encode('ascii', 'ignore')
+        return intern(title.text.encode('ascii', 'ignore'))
 
     @staticmethod
     def parse_url(element):
@@ -368,7 +626,7 @@ class SearchResult(object):
         if anchor is None:
             raise NotAParsableSearchResult
         url = anchor['href']
-        return url.encode('ascii', 'ignore')
+        return intern(url.encode('ascii', 'ignore'))
 
     @staticmethod
     def parse_snippet(element):
@@ -383,7 +641,7 @@ class SearchResult(object):
         related_links_div = element.select_one('.' + GDOM.RESULT_RELATED_LINKS_DIV_CLASS)  # tag: div
         if related_links_div:
             related_links = related_links_div.select('.' + GDOM.RESULT_RELATED_LINK_CLASS)  # tag: a
-            related_links = [rl.text.encode('ascii', 'ignore') for rl in related_links]
+            related_links = [intern(rl.text.encode('ascii', 'ignore')) for rl in related_links]
         else:
             related_links = None
         return related_links
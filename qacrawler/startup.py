@@ -0,0 +1,40 @@
+"""
+Readiness report of crawler startup.
+
+Startup phases (loading the dataset, launching the browser, disabling Javascript etc.) can run concurrently on
+different threads. StartupReport records when each phase started and how long it took, and logs them once the
+crawler is ready, so slow phases stand out.
+"""
+import contextlib
+import logging
+import threading
+import time
+
+
+class StartupReport(object):
+    def __init__(self):
+        self.start = time.time()
+        self.phases = []
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record the duration of the code run in this context as the phase name."""
+        phase_start = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases.append((name, phase_start - self.start, time.time() - phase_start))
+
+    def format(self):
+        """
+        :return: phases in the order they started, with their start times and durations in seconds
+        :rtype: str
+        """
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        return ', '.join('%s %.2fs (at %.2fs)' % (name, duration, start) for name, start, duration in phases)
+
+    def log_ready(self):
+        logging.info('Ready in %.2f seconds. Startup phases: %s.' % (time.time() - self.start, self.format()))
@@ -0,0 +1,221 @@
+"""
+Crawling several queries at once in the tabs of one browser.
+
+Each extra worker process launches its own browser, and has to disable Javascript and save the results per page
+preferences again. Here one browser opens num_tabs tabs, which share its preferences and cookies, hence the
+one-time setup of main.get_prepared_driver applies to all of them.
+
+A driver runs one command at a time, but a page requested by script keeps loading while the driver works on other
+tabs. TabScheduler assigns a query to each tab and goes round the tabs: it requests the next page of a tab once its
+politeness wait is over, and parses and saves a tab's page once it has loaded, so that num_tabs page loads are in
+flight. A page has loaded when the document of the tab is complete and is not the one marked stale when the page
+was requested.
+
+Queries and next pages are requested by url, hence typing and clicking are not simulated.
+"""
+import logging
+import random
+import time
+
+import crawler
+import proxies
+import sr_parser
+
+NAVIGATE_SCRIPT = ("document.documentElement.setAttribute('data-qacrawler-stale', '1'); "
+                   "window.location.href = arguments[0];")
+READY_SCRIPT = ("return document.readyState == 'complete' && "
+                "!document.documentElement.hasAttribute('data-qacrawler-stale');")
+OPEN_TAB_SCRIPT = "window.open('about:blank');"
+
+
+class Tab(object):
+    """A browser tab and the query it crawls."""
+    def __init__(self, handle):
+        self.handle = handle
+        self.entry = None
+        self.results = []
+        self.num_snippets = 0
+        self.page_no = 0
+        self.next_url = None
+        self.request_at = None
+        self.requested_at = None
+
+    @property
+    def is_idle(self):
+        return self.entry is None
+
+    @property
+    def is_loading(self):
+        return self.requested_at is not None
+
+    def assign(self, entry, url, request_at):
+        self.entry = entry
+        self.results = []
+        self.num_snippets = 0
+        self.page_no = 0
+        self.schedule(url, request_at)
+
+    def schedule(self, url, request_at):
+        self.next_url = url
+        self.request_at = request_at
+        self.requested_at = None
+
+
+class TabScheduler(object):
+    def __init__(self, settings, num_tabs=4, page_timeout=10.0, poll_interval=0.05):
+        """
+        :param settings: Crawler settings object, of which driver is shared by the tabs
+        :type settings: crawler.CrawlerSettings
+        :param num_tabs: number of queries crawled at once
+        :type num_tabs: int
+        :param page_timeout: seconds to wait for a page to load
+        :type page_timeout: float
+        :param poll_interval: seconds to sleep when no tab has loaded or is due for a request
+        :type poll_interval: float
+        """
+        self.settings = settings
+        self.driver = settings.driver
+        self.num_tabs = num_tabs
+        self.page_timeout = page_timeout
+        self.poll_interval = poll_interval
+        self.tabs = []
+        self.current_handle = None
+        self.max_loading = 0
+
+    def open_tabs(self):
+        """Open tabs until there are num_tabs of them, keeping the tab the driver is on as the first one."""
+        handles = list(self.driver.window_handles)
+        while len(handles) < self.num_tabs:
+            self.driver.execute_script(OPEN_TAB_SCRIPT)
+            handles = list(self.driver.window_handles)
+        self.current_handle = self.driver.current_window_handle
+        first = handles.index(self.current_handle)
+        handles = handles[first:] + handles[:first]
+        self.tabs = [Tab(handle) for handle in handles[:self.num_tabs]]
+        logging.info('Crawling in %d tabs.' % len(self.tabs))
+
+    def crawl(self, entries):
+        """
+        Crawl search results of given Jeopardy entries, num_tabs of them at once.
+
+        :param entries: Jeopary dataset entries
+        :type entries: collections.Iterable[qacrawler.jeopardy.Entry]
+        """
+        sr_parser.set_gdom(self.settings.disable_javascript)
+        if not self.tabs:
+            self.open_tabs()
+        entries = iter(entries)
+        has_entries = True
+        while True:
+            progressed = False
+            for tab in self.tabs:
+                if tab.is_idle and has_entries:
+                    has_entries = self.assign_next_entry(tab, entries)
+                if tab.is_idle:
+                    continue
+                if tab.is_loading:
+                    progressed = self.check_loaded(tab) or progressed
+                elif time.time() >= tab.request_at:
+                    self.request(tab)
+                    progressed = True
+            if not has_entries and all(tab.is_idle for tab in self.tabs):
+                return
+            if not progressed:
+                time.sleep(self.poll_interval)
+
+    def assign_next_entry(self, tab, entries):
+        """Assign the next entry to an idle tab.
+
+        :return: whether there was an entry to assign
+        :rtype: bool
+        """
+        if self.settings.watchdog is not None:
+            self.settings.watchdog.wait_while_paused()
+        entry = next(entries, None)
+        if entry is None:
+            return False
+        logging.info('Question no %06d: %s. Crawl!' % (entry.id, entry.question))
+        tab.assign(entry, sr_parser.get_search_url(entry.question), time.time())
+        return True
+
+    def switch_to(self, tab):
+        if tab.handle != self.current_handle:
+            self.driver.switch_to.window(tab.handle)
+            self.current_handle = tab.handle
+
+    def request(self, tab):
+        """Request the scheduled page of the tab without waiting for it to load."""
+        self.switch_to(tab)
+        sr_parser.wait_for_route(self.settings)
+        logging.debug('Loading page %d of question no %06d.', tab.page_no, tab.entry.id)
+        self.driver.execute_script(NAVIGATE_SCRIPT, tab.next_url)
+        tab.requested_at = time.time()
+        self.max_loading = max(self.max_loading, sum(1 for other in self.tabs if other.is_loading))
+
+    def check_loaded(self, tab):
+        """Parse the page of the tab if it has loaded, and request the next page or finish the query.
+
+        :return: whether the page has loaded or timed out
+        :rtype: bool
+        """
+        self.switch_to(tab)
+        if not self.driver.execute_script(READY_SCRIPT):
+            if time.time() - tab.requested_at < self.page_timeout:
+                return False
+            logging.warning('Question no %06d. Page %d did not load in %.0f seconds.' %
+                            (tab.entry.id, tab.page_no, self.page_timeout))
+            sr_parser.report_to_route(self.settings.route, proxies.FAILED)
+            self.finish(tab)
+            return True
+        sr_parser.check_google_bot_police(self.driver, self.settings.route)
+        sr_parser.report_to_route(self.settings.route, proxies.OK)
+        page_source = self.driver.page_source
+        page_results = sr_parser.parse_results_page_source(page_source)
+        logging.debug('Collected %d search results.', len(page_results))
+        if self.settings.watchdog is not None:
+            self.settings.watchdog.observe_page(page_results, lambda: page_source, query=tab.entry.question,
+                                                page_no=tab.page_no)
+        tab.results.extend(page_results)
+        tab.num_snippets += sr_parser.count_snippets(page_results)
+        next_url = self.get_next_page_url(tab) if page_results else None
+        if next_url is None:
+            self.finish(tab)
+        else:
+            tab.page_no += 1
+            wait_duration = self.settings.wait_duration + random.random()  # as in sr_parser.wait_with_variance
+            tab.schedule(next_url, time.time() + wait_duration)
+        return True
+
+    def get_next_page_url(self, tab):
+        """
+        :return: url of the next page of the tab's query, None if it should not be requested or does not exist
+        :rtype: str
+        """
+        if not sr_parser.should_request_next_page(self.settings, tab.num_snippets, tab.page_no):
+            return None
+        if self.settings.disable_javascript:
+            return sr_parser.get_next_page_url_no_js(self.driver)
+        return sr_parser.get_next_page_url_js(self.driver)
+
+    def finish(self, tab):
+        """Save the results of the tab's query and free the tab."""
+        entry, results = tab.entry, tab.results
+        tab.entry = None
+        tab.results = []
+        tab.requested_at = None
+        logging.info('Question no %06d. Collected %d search results.' % (entry.id, len(results)))
+        if results:
+            crawler.save_results_for_entry(results, entry, self.settings.output_folder,
+                                           interner=self.settings.interner, sinks=self.settings.sinks)
+
+
+def crawl(settings, entries):
+    """
+    Crawl search results of given Jeopardy entries like crawler.crawl, but settings.num_tabs of them at once.
+
+    :param settings: Crawler settings object
+    :type settings: crawler.CrawlerSettings
+    :param entries: Jeopary dataset entries
+    :type entries: collections.Iterable[qacrawler.jeopardy.Entry]
+    """
+    TabScheduler(settings, num_tabs=settings.num_tabs).crawl(entries)
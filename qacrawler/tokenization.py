@@ -0,0 +1,257 @@
+"""
+Tokenization stage over crawler outputs.
+
+Tokenizes questions, answers and snippets of crawled JSON files once per crawl, on all cores, in two passes:
+
+1) Worker processes tokenize the output files and count token frequencies. The counts are merged into a
+   Vocabulary in which more frequent tokens have smaller integer ids.
+2) Worker processes map tokens to ids and write, for each crawled entry, a %06d-%s-tok.json file that holds
+   the tokens together with their ids.
+
+The vocabulary is saved as vocabulary.tsv ("token<TAB>count" lines, where the line number is the token id).
+
+Example command to tokenize crawler outputs.
+
+$ python tokenization.py --input-folder OUTPUT_FOLDER --output-folder TOKENIZED_FOLDER --processes 16
+"""
+import argparse
+import codecs
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from nltk.tokenize import TreebankWordTokenizer
+
+import crawler
+
+VOCABULARY_FILE_NAME = 'vocabulary.tsv'
+
+_tokenizer = TreebankWordTokenizer()
+_worker_settings = {}
+
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(level=getattr(logging, args.log_level),
+                        format='%(levelname)s:%(asctime)s:%(module)s:%(funcName)s:%(message)s')
+    start = time.time()
+    vocabulary = tokenize_crawl(args.input_folder, args.output_folder, min_count=args.min_count,
+                                lowercase=not args.keep_case, processes=args.processes)
+    logging.info('Tokenized the crawl with a vocabulary of %d tokens in %.1f seconds.' %
+                 (len(vocabulary), time.time() - start))
+
+
+def tokenize_crawl(input_folder, output_folder, min_count=1, lowercase=True, processes=None, chunksize=64):
+    """
+    Tokenize all crawler output files in input_folder into output_folder and build their vocabulary.
+
+    :param input_folder: folder of crawler's JSON output files
+    :type input_folder: str
+    :param output_folder: folder to write tokenized files and the vocabulary into
+    :type output_folder: str
+    :param min_count: tokens seen less than min_count times are mapped to Vocabulary.UNKNOWN
+    :type min_count: int
+    :param lowercase: whether to lowercase text before tokenizing
+    :type lowercase: bool
+    :param processes: number of worker processes. Defaults to the number of CPUs.
+    :type processes: int
+    :rtype: Vocabulary
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    file_paths = crawler.list_output_files(input_folder)
+    logging.info('Tokenizing %d files.' % len(file_paths))
+
+    pool = multiprocessing.Pool(processes=processes, initializer=initialize_worker,
+                                initargs=(output_folder, lowercase, None))
+    token_counts = collections.Counter()
+    try:
+        for file_token_counts in pool.imap_unordered(tokenize_output_file, file_paths, chunksize=chunksize):
+            token_counts.update(file_token_counts)
+    finally:
+        pool.close()
+        pool.join()
+
+    vocabulary = Vocabulary.from_counts(token_counts, min_count=min_count)
+    vocabulary.save(os.path.join(output_folder, VOCABULARY_FILE_NAME))
+
+    tokenized_paths = [tokenized_file_path(output_folder, path) for path in file_paths]
+    pool = multiprocessing.Pool(processes=processes, initializer=initialize_worker,
+                                initargs=(output_folder, lowercase, vocabulary))
+    try:
+        for _ in pool.imap_unordered(add_token_ids, tokenized_paths, chunksize=chunksize):
+            pass
+    finally:
+        pool.close()
+        pool.join()
+    return vocabulary
+
+
+def initialize_worker(output_folder, lowercase, vocabulary):
+    _worker_settings['output_folder'] = output_folder
+    _worker_settings['lowercase'] = lowercase
+    _worker_settings['vocabulary'] = vocabulary
+
+
+def tokenize_output_file(file_path):
+    """
+    Tokenize the question, the answer and the snippets of a crawler output file, and save the tokens.
+
+    Runs in a worker process.
+
+    :param file_path: path to a crawler's JSON output file
+    :type file_path: str
+    :return: frequencies of the tokens in the file
+    :rtype: collections.Counter
+    """
+    lowercase = _worker_settings['lowercase']
+    with open(file_path, 'rt') as f:
+        output = json.load(f)
+    tokenized = {'id': output.get('id'),
+                 'question_tokens': tokenize(output.get('question'), lowercase),
+                 'answer_tokens': tokenize(output.get('answer'), lowercase),
+                 'snippet_tokens': [tokenize(result['snippet'], lowercase) for result in output['search_results']]}
+    token_counts = collections.Counter(tokenized['question_tokens'])
+    token_counts.update(tokenized['answer_tokens'])
+    for snippet_tokens in tokenized['snippet_tokens']:
+        token_counts.update(snippet_tokens)
+    with open(tokenized_file_path(_worker_settings['output_folder'], file_path), 'wt') as f:
+        json.dump(tokenized, f)
+    return token_counts
+
+
+def add_token_ids(tokenized_path):
+    """Add the token id lists next to the token lists of a tokenized file. Runs in a worker process."""
+    vocabulary = _worker_settings['vocabulary']
+    with open(tokenized_path, 'rt') as f:
+        tokenized = json.load(f)
+    tokenized['question_ids'] = vocabulary.get_ids(tokenized['question_tokens'])
+    tokenized['answer_ids'] = vocabulary.get_ids(tokenized['answer_tokens'])
+    tokenized['snippet_ids'] = [vocabulary.get_ids(tokens) for tokens in tokenized['snippet_tokens']]
+    with open(tokenized_path, 'wt') as f:
+        json.dump(tokenized, f)
+
+
+def tokenize(text, lowercase=True):
+    """
+    Split text into word tokens.
+
+    :param text: text to tokenize. Can be None, e.g. for search results without snippet.
+    :type text: str
+    :rtype: list[str]
+    """
+    if not text:
+        return []
+    if lowercase:
+        text = text.lower()
+    return _tokenizer.tokenize(text)
+
+
+def tokenized_file_path(output_folder, file_path):
+    """Get the path of tokenized file of a crawler output, e.g. 000042-tag.json -> 000042-tag-tok.json"""
+    file_name = os.path.splitext(os.path.basename(file_path))[0] + crawler.TOKENIZED_SUFFIX
+    return os.path.join(output_folder, file_name)
+
+
+class Vocabulary(object):
+    """
+    Mapping between tokens and integer ids.
+
+    Ids are given in decreasing order of frequency after the reserved tokens, PADDING (0) and UNKNOWN (1). Tokens
+    of the same frequency are in alphabetical order, hence ids do not depend on the order counts are merged in.
+    """
+    PADDING = u'<pad>'
+    UNKNOWN = u'<unk>'
+    RESERVED_TOKENS = [PADDING, UNKNOWN]
+
+    def __init__(self, tokens, counts):
+        """
+        :param tokens: tokens in the order of their ids
+        :type tokens: list[str]
+        :param counts: frequencies of the tokens
+        :type counts: list[int]
+        """
+        self.tokens = tokens
+        self.counts = counts
+        self.token_ids = dict((token, no) for no, token in enumerate(tokens))
+        self.unknown_id = self.token_ids[Vocabulary.UNKNOWN]
+
+    @classmethod
+    def from_counts(cls, token_counts, min_count=1):
+        """
+        :param token_counts: frequencies of tokens
+        :type token_counts: collections.Counter
+        :param min_count: tokens seen less than min_count times are left out
+        :type min_count: int
+        :rtype: Vocabulary
+        """
+        frequent = sorted(((token, count) for token, count in token_counts.items()
+                           if count >= min_count and token not in Vocabulary.RESERVED_TOKENS),
+                          key=lambda item: (-item[1], item[0]))
+        tokens = Vocabulary.RESERVED_TOKENS + [token for token, _ in frequent]
+        counts = [0] * len(Vocabulary.RESERVED_TOKENS) + [count for _, count in frequent]
+        return cls(tokens, counts)
+
+    @classmethod
+    def load(cls, file_path):
+        tokens, counts = [], []
+        with codecs.open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                token, count = line.rstrip(u'\n').rsplit(u'\t', 1)
+                tokens.append(token)
+                counts.append(int(count))
+        return cls(tokens, counts)
+
+    def save(self, file_path):
+        with codecs.open(file_path, 'w', encoding='utf-8') as f:
+            for token, count in zip(self.tokens, self.counts):
+                f.write(u'%s\t%d\n' % (token, count))
+
+    def get_ids(self, tokens):
+        """
+        :type tokens: list[str]
+        :rtype: list[int]
+        """
+        return [self.token_ids.get(token, self.unknown_id) for token in tokens]
+
+    def get_tokens(self, ids):
+        """
+        :type ids: list[int]
+        :rtype: list[str]
+        """
+        return [self.tokens[no] for no in ids]
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+def parse_command_line_arguments():
+    """Parse command line arguments
+
+    :return: An object of which attributes are command line arguments
+    :rtype: argparse.ArgumentParser
+    """
+    argparser = argparse.ArgumentParser(description='Tokenize crawled SearchQA data and build its vocabulary')
+    argparser.add_argument('-i', '--input-folder', type=str, required=True,
+                           help='Folder of crawler output files')
+    argparser.add_argument('-o', '--output-folder', type=str, required=True,
+                           help='Folder to write tokenized files and the vocabulary into. '
+                                'If given folder does not exist it will be created first.')
+    argparser.add_argument('-m', '--min-count', type=int, default=1,
+                           help='Tokens seen less than this many times are mapped to the unknown token')
+    argparser.add_argument('-p', '--processes', type=int, default=None,
+                           help='Number of worker processes. Defaults to the number of CPUs.')
+    argparser.add_argument('--keep-case', action='store_true',
+                           help='When included text is not lowercased before tokenizing')
+    argparser.add_argument('-g', '--log-level', type=str, default='INFO',
+                           help='Set the level of log messages',
+                           choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = argparser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Watchdog over the parse yield of search result pages, to detect changes in Google's page layout early.
+
+When Google changes its markup, the class names in google_dom_info silently stop matching and pages yield no
+results (RESULT_DIV_CLASS or RESULT_TITLE_CLASS changed) or results without snippets (RESULT_DESCRIPTION_CLASS
+changed). The watchdog keeps a rolling window of per-page yields and snippet fill rates and raises an alarm when
+they drop within a few queries. Pages without the results container (RESULTS_CONTAINER_ID), e.g. of queries
+without results, blocked or timed out pages, say nothing about the layout and are not observed. On alarm it
+snapshots the offending pages into a folder for diagnosis and pauses the crawl until resumed, e.g. by
+`kill -USR1 CRAWLER_PID` after google_dom_info is fixed or the alarm was false.
+"""
+import collections
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+import sr_parser
+
+PageObservation = collections.namedtuple('PageObservation', ['num_results', 'num_snippets'])
+
+
+class ParseWatchdog(object):
+    def __init__(self, snapshot_folder='watchdog', window=10, min_pages=5, min_results_per_page=3.0,
+                 min_snippet_fill_rate=0.5, max_empty_pages=3, max_snapshots=5):
+        """
+        :param snapshot_folder: folder into which offending pages and a report are saved on alarm
+        :type snapshot_folder: str
+        :param window: number of last pages the yields are computed over
+        :type window: int
+        :param min_pages: number of pages needed in the window before yields are judged
+        :type min_pages: int
+        :param min_results_per_page: alarm when the average number of parsed results per page is below this
+        :type min_results_per_page: float
+        :param min_snippet_fill_rate: alarm when the ratio of parsed results with a snippet is below this
+        :type min_snippet_fill_rate: float
+        :param max_empty_pages: alarm when this many consecutive pages have a results container but no parsed results
+        :type max_empty_pages: int
+        :param max_snapshots: number of last poor pages kept to be saved on alarm
+        :type max_snapshots: int
+        """
+        self.snapshot_folder = snapshot_folder
+        self.min_pages = min_pages
+        self.min_results_per_page = min_results_per_page
+        self.min_snippet_fill_rate = min_snippet_fill_rate
+        self.max_empty_pages = max_empty_pages
+        self.observations = collections.deque(maxlen=window)
+        self.poor_pages = collections.deque(maxlen=max_snapshots)
+        self.num_empty_pages = 0
+        self.num_alarms = 0
+        self.lock = threading.RLock()  # resume may be called by a signal handler while the lock is held
+        self.running = threading.Event()
+        self.running.set()
+
+    def observe_page(self, results, get_page_source, query=None, page_no=0):
+        """
+        Record the yield of a parsed page, and raise an alarm if the recent yields look like a layout change.
+
+        :param results: the results parsed from the page
+        :type results: list[sr_parser.SearchResult]
+        :param get_page_source: function with no arguments that returns the HTML source of the page. Only called
+        for poor pages, to keep them for the snapshot.
+        :type get_page_source: () -> str
+        :param query: search query of the page
+        :type query: str
+        :param page_no: number of the page in the query's result pages, starting from 0
+        :type page_no: int
+        :return: whether an alarm is raised
+        :rtype: bool
+        """
+        observation = PageObservation(len(results), sr_parser.count_snippets(results))
+        is_poor = (observation.num_results < self.min_results_per_page or
+                   observation.num_snippets < self.min_snippet_fill_rate * observation.num_results)
+        page_source = get_page_source() if is_poor else None
+        if not results and not sr_parser.has_results_container(page_source):
+            logging.debug('Page %d of "%s" has no results container, not observed.', page_no, query)
+            return False
+        with self.lock:
+            self.observations.append(observation)
+            self.num_empty_pages = self.num_empty_pages + 1 if observation.num_results == 0 else 0
+            if is_poor:
+                self.poor_pages.append((query, page_no, page_source))
+            reasons = self.get_alarm_reasons()
+            if not reasons or not self.running.is_set():
+                return False
+            self.raise_alarm(reasons)
+            return True
+
+    def get_alarm_reasons(self):
+        """
+        :return: descriptions of the yields that are below their thresholds
+        :rtype: list[str]
+        """
+        reasons = []
+        if self.num_empty_pages >= self.max_empty_pages:
+            reasons.append('%d consecutive pages without results' % self.num_empty_pages)
+        if len(self.observations) < self.min_pages:
+            return reasons
+        num_results = sum(observation.num_results for observation in self.observations)
+        num_snippets = sum(observation.num_snippets for observation in self.observations)
+        results_per_page = float(num_results) / len(self.observations)
+        if results_per_page < self.min_results_per_page:
+            reasons.append('%.1f results per page in the last %d pages' % (results_per_page, len(self.observations)))
+        if num_results and float(num_snippets) / num_results < self.min_snippet_fill_rate:
+            reasons.append('%d of %d results have snippets' % (num_snippets, num_results))
+        return reasons
+
+    def raise_alarm(self, reasons):
+        """Snapshot the poor pages and pause the crawl."""
+        self.num_alarms += 1
+        self.running.clear()
+        folder = self.save_snapshot(reasons)
+        logging.critical('Parse yield dropped, Google may have changed its page layout: %s. '
+                         'Pages are saved into %s. Paused. Send SIGUSR1 (kill -USR1 %d) to resume.' %
+                         ('; '.join(reasons), folder, os.getpid()))
+
+    def save_snapshot(self, reasons):
+        """
+        Save the kept poor pages and a report of the yields and the DOM information in use.
+
+        :return: path of the snapshot folder
+        :rtype: str
+        """
+        folder = os.path.join(self.snapshot_folder, '%s-%d' % (time.strftime('%Y%m%d-%H%M%S'), self.num_alarms))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        pages = []
+        for no, (query, page_no, page_source) in enumerate(self.poor_pages):
+            file_name = 'page-%02d.html' % no
+            with open(os.path.join(folder, file_name), 'wt') as f:
+                f.write(page_source.encode('utf-8') if isinstance(page_source, unicode) else page_source)
+            pages.append({'file': file_name, 'query': query, 'page_no': page_no})
+        dom_info = dict((name, getattr(sr_parser.GDOM, name)) for name in dir(sr_parser.GDOM) if name.isupper())
+        report = {'reasons': reasons, 'pages': pages, 'dom_info': dom_info,
+                  'observations': [observation._asdict() for observation in self.observations]}
+        with open(os.path.join(folder, 'report.json'), 'wt') as f:
+            json.dump(report, f, indent=2)
+        return folder
+
+    def wait_while_paused(self):
+        """Block the calling worker while the crawl is paused."""
+        if self.running.is_set():
+            return
+        logging.info('Waiting for the watchdog to be resumed.')
+        while not self.running.wait(1.0):  # a timeout lets signals and KeyboardInterrupt through on Python 2
+            pass
+
+    def resume(self):
+        """Forget the observed yields and let the workers continue."""
+        with self.lock:
+            self.observations.clear()
+            self.poor_pages.clear()
+            self.num_empty_pages = 0
+            self.running.set()
+        logging.warning('Watchdog resumed.')
+
+    def install_resume_signal(self, signal_number=signal.SIGUSR1):
+        """Resume on the given signal. Must be called from the main thread."""
+        signal.signal(signal_number, lambda signum, frame: self.resume())
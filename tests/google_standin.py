@@ -0,0 +1,175 @@
+"""
+Local stand-in for Google Search, to run the crawler end-to-end without reaching real Google.
+
+Serves the non-Javascript versions of the pages the crawler visits, with the DOM information in
+qacrawler.google_dom_info.GoogleDomInfoWithoutJS:
+- / and /search without a query: a page with the search box
+- /search?q=QUERY&start=N: a results page built by filling result templates (tests/data/parsed.tsv) with the query,
+  with "About N results" stats and a "Next" navigation link while there are more results
+- /preferences: the page with the number of results per page select, which is saved into a cookie by /setprefs
+
+Latency and "unusual traffic" (bot police) pages can be injected.
+
+Usage in a Python interpreter at tests folder:
+
+server = google_standin.start_google_standin(latency=0.1, unusual_traffic_rate=0.01)
+sr_parser.set_google_url(server.url)
+...
+server.shutdown()
+"""
+import cgi
+import os
+import random
+import threading
+import time
+import urllib
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from Cookie import SimpleCookie
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+
+TEMPLATES_PATH = os.path.join(os.path.dirname(__file__), 'data', 'parsed.tsv')
+UNUSUAL_TRAFFIC_TEXT = 'Our systems have detected unusual traffic from your computer network.'
+
+PAGE = '<!DOCTYPE html><html><head><title>%(title)s</title></head><body>%(body)s</body></html>'
+SEARCH_FORM = ('<form action="/search" method="GET"><div id="sbhost-container">'
+               '<input id="sbhost" name="q" type="text" value="%(query)s"></div></form>')
+RESULT = ('<div class="g"><h3 class="r"><a href="%(url)s">%(title)s</a></h3>'
+          '<div class="s"><cite class="_Rm">%(url)s</cite><span class="st">%(snippet)s</span></div>'
+          '%(related_links)s</div>')
+RELATED_LINKS = '<div class="osl">%s</div>'
+RELATED_LINK = '<a class="fl" href="%(url)s#%(link)s">%(link)s</a> '
+RESULTS_CONTAINER = '<div id="ires">%s</div>'
+RESULT_STATS = '<div id="resultStats">About %s results</div>'
+NEXT_PAGE_LINK = '<table id="nav"><tr><td><a class="fl" href="/search?%s">Next</a></td></tr></table>'
+PREFERENCES_FORM = ('<form action="/setprefs" method="GET"><select id="numsel" name="num">%s</select>'
+                    '<input name="submit2" type="submit" value="Save"></form>')
+
+
+class GoogleStandIn(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server with the stand-in's configuration and request statistics."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, latency_variation=0.0, unusual_traffic_rate=0.0,
+                 results_per_query=100, templates_path=TEMPLATES_PATH):
+        """
+        :param latency: seconds to wait before responding to each request
+        :type latency: float
+        :param latency_variation: maximum random seconds added to latency
+        :type latency_variation: float
+        :param unusual_traffic_rate: probability of responding with an "unusual traffic" page to a search
+        :type unusual_traffic_rate: float
+        :param results_per_query: number of results each query has in total
+        :type results_per_query: int
+        """
+        HTTPServer.__init__(self, address, StandInRequestHandler)
+        self.latency = latency
+        self.latency_variation = latency_variation
+        self.unusual_traffic_rate = unusual_traffic_rate
+        self.results_per_query = results_per_query
+        self.templates = load_result_templates(templates_path)
+        self.lock = threading.Lock()
+        self.request_counts = {}
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def count_request(self, kind):
+        with self.lock:
+            self.request_counts[kind] = self.request_counts.get(kind, 0) + 1
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency + random.random() * server.latency_variation)
+        url = urlparse(self.path)
+        params = dict((key, values[0]) for key, values in parse_qs(url.query, keep_blank_values=True).items())
+        if url.path in ('/', '/search'):
+            self.respond_search(params)
+        elif url.path == '/preferences':
+            server.count_request('preferences')
+            self.send_html(PAGE % {'title': 'Search Settings', 'body': self.preferences_form()})
+        elif url.path == '/setprefs':
+            server.count_request('setprefs')
+            self.send_response(302)
+            self.send_header('Set-Cookie', 'num=%d; Path=/' % int(params.get('num', 10)))
+            self.send_header('Location', '/')
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+    def respond_search(self, params):
+        server = self.server
+        query = params.get('q', '').strip()
+        if not query:
+            server.count_request('front')
+            self.send_html(PAGE % {'title': 'Google', 'body': SEARCH_FORM % {'query': ''}})
+            return
+        if random.random() < server.unusual_traffic_rate:
+            server.count_request('unusual_traffic')
+            self.send_html(PAGE % {'title': 'Sorry...', 'body': '<p>%s</p>' % UNUSUAL_TRAFFIC_TEXT}, status=503)
+            return
+        server.count_request('search')
+        start = int(params.get('start', 0))
+        num = self.get_results_per_page()
+        ranks = range(start, min(start + num, server.results_per_query))
+        body = SEARCH_FORM % {'query': cgi.escape(query, quote=True)}
+        body += RESULT_STATS % '{:,}'.format(server.results_per_query)
+        body += RESULTS_CONTAINER % ''.join(self.format_result(query, rank) for rank in ranks)
+        if start + num < server.results_per_query:
+            body += NEXT_PAGE_LINK % cgi.escape(urllib.urlencode({'q': query, 'start': start + num}), quote=True)
+        self.send_html(PAGE % {'title': '%s - Google Search' % cgi.escape(query), 'body': body})
+
+    def format_result(self, query, rank):
+        title, url, snippet, related_links = self.server.templates[rank % len(self.server.templates)]
+        url = '%s?q=%s&rank=%d' % (url, urllib.quote_plus(query), rank)
+        related = ''.join(RELATED_LINK % {'url': url, 'link': link} for link in related_links)
+        return RESULT % {'url': cgi.escape(url, quote=True),
+                         'title': cgi.escape('%s (%d)' % (title, rank)),
+                         'snippet': cgi.escape('%s %s' % (query, snippet)),
+                         'related_links': RELATED_LINKS % related if related_links else ''}
+
+    def get_results_per_page(self):
+        cookie = SimpleCookie(self.headers.getheader('Cookie', ''))
+        return int(cookie['num'].value) if 'num' in cookie else 10
+
+    def preferences_form(self):
+        selected = self.get_results_per_page()
+        options = ''.join('<option value="%d"%s>%d</option>' % (num, ' selected' if num == selected else '', num)
+                          for num in [10, 20, 30, 50, 100])
+        return PREFERENCES_FORM % options
+
+    def send_html(self, html, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(html)))
+        self.end_headers()
+        self.wfile.write(html)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_result_templates(templates_path):
+    """Read result templates (title, url, snippet, related links) from a crawler's TSV output."""
+    templates = []
+    with open(templates_path, 'rt') as f:
+        for line in f.read().split('\n'):
+            title, url, snippet, related_links = line.split('\t')
+            templates.append((title, url, snippet, related_links.split(';') if related_links else []))
+    return templates
+
+
+def start_google_standin(**kwargs):
+    """Start a stand-in server on a free local port in a background thread.
+
+    :rtype: GoogleStandIn
+    """
+    server = GoogleStandIn(**kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
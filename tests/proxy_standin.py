@@ -0,0 +1,85 @@
+"""
+Local stand-in for an outbound HTTP proxy, to test crawling through a pool of proxies without real ones.
+
+Forwards GET requests for absolute urls (as browsers send them to a proxy), e.g. to the Google stand-in of
+google_standin.py. A proxy whose route Google has blocked is simulated by answering a ratio of the requests with an
+"unusual traffic" page instead of forwarding them.
+
+Usage in a Python interpreter at tests folder:
+
+proxy = proxy_standin.start_proxy_standin(block_rate=0.5)
+pool = proxies.ProxyPool([proxy.url])
+...
+proxy.shutdown()
+"""
+import random
+import threading
+import urllib2
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import google_standin
+
+
+class ProxyStandIn(ThreadingMixIn, HTTPServer):
+    """Threaded forward proxy with the number of requests it forwarded and blocked."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), block_rate=0.0):
+        """
+        :param block_rate: probability of answering with an "unusual traffic" page instead of forwarding
+        :type block_rate: float
+        """
+        HTTPServer.__init__(self, address, ProxyRequestHandler)
+        self.block_rate = block_rate
+        self.opener = urllib2.build_opener(urllib2.ProxyHandler({}))
+        self.lock = threading.Lock()
+        self.request_counts = {'forwarded': 0, 'blocked': 0}
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def count_request(self, kind):
+        with self.lock:
+            self.request_counts[kind] += 1
+
+
+class ProxyRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        if random.random() < server.block_rate:
+            server.count_request('blocked')
+            body = '<p>%s</p>' % google_standin.UNUSUAL_TRAFFIC_TEXT
+            self.send_html(503, google_standin.PAGE % {'title': 'Sorry...', 'body': body})
+            return
+        server.count_request('forwarded')
+        try:
+            response = server.opener.open(self.path)
+            status, body = response.getcode(), response.read()
+        except urllib2.HTTPError as e:
+            status, body = e.code, e.read()
+        self.send_html(status, body)
+
+    def send_html(self, status, html):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(html)))
+        self.end_headers()
+        self.wfile.write(html)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_proxy_standin(**kwargs):
+    """Start a stand-in proxy on a free local port in a background thread.
+
+    :rtype: ProxyStandIn
+    """
+    server = ProxyStandIn(**kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
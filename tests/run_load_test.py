@@ -0,0 +1,199 @@
+"""
+End-to-end load test of the crawler against the local Google stand-in server.
+
+Runs collect_query_results_from_google -> crawl -> save_results_for_entry with real browser drivers for each given
+number of workers, and reports queries per second, latency percentiles, "unusual traffic" pages served by the
+stand-in's bot police and resource use: CPU time of this process and its finished child processes, and the peak
+resident memory of this process with all its descendants, e.g. drivers and their browsers, sampled from /proc.
+
+Example command, run at tests folder:
+
+$ python run_load_test.py --workers 1 2 4 --queries 200 --latency 0.2 --unusual-traffic-rate 0.01 --num-pages 2
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.abspath('..'))
+
+import google_standin
+from qacrawler import crawler
+from qacrawler import jeopardy
+from qacrawler import main
+from qacrawler import sr_parser
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), 'data', 'tiny_dataset.json')
+
+
+def run_load_test(server, num_workers, num_queries, args):
+    """
+    Crawl num_queries entries with num_workers browsers sharing a queue of entries.
+
+    :rtype: dict
+    """
+    output_folder = tempfile.mkdtemp(prefix='load_test_')
+    entries = generate_entries(num_queries)
+    lock = threading.Lock()
+    latencies = []
+    blocked_before = server.request_counts.get('unusual_traffic', 0)
+    cpu_seconds_before = get_cpu_seconds()
+    memory_sampler = PeakMemorySampler()
+    memory_sampler.start()
+
+    def work():
+        settings = None
+        while True:
+            with lock:
+                if not entries:
+                    break
+                entry = entries.pop()
+            if settings is None:
+                settings = get_settings(args, output_folder)
+            start = time.time()
+            try:
+                crawler.crawl(settings, [entry])
+            except SystemExit:  # caught by the bot police, sr_parser quits the driver and exits
+                settings = None
+                continue
+            with lock:
+                latencies.append(time.time() - start)
+        if settings is not None:
+            settings.driver.quit()
+
+    start = time.time()
+    workers = [threading.Thread(target=work) for _ in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    duration = time.time() - start
+    cpu_seconds = get_cpu_seconds() - cpu_seconds_before
+    max_rss_mb = memory_sampler.stop()
+    shutil.rmtree(output_folder)
+
+    latencies.sort()
+    return {'workers': num_workers,
+            'queries': len(latencies),
+            'blocked': server.request_counts.get('unusual_traffic', 0) - blocked_before,
+            'qps': len(latencies) / duration,
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else float('nan'),
+            'cpu_seconds': cpu_seconds,
+            'max_rss_mb': max_rss_mb}
+
+
+def get_settings(args, output_folder):
+    driver = main.get_prepared_driver(args.driver_type, disable_javascript=True,
+                                      results_per_page=args.results_per_page)
+    return crawler.CrawlerSettings(driver, args.num_pages, output_folder, args.wait_duration,
+                                   simulate_typing=False, simulate_clicking=False, disable_javascript=True)
+
+
+def generate_entries(num_entries):
+    """Generate entries by cycling the tiny dataset's entries with new ids."""
+    dataset = jeopardy.Dataset(DATASET_PATH)
+    return [jeopardy.Entry(dataset.data[no % dataset.size], entry_id=no) for no in range(num_entries)]
+
+
+def get_cpu_seconds():
+    """Get CPU seconds of this process and its finished child processes."""
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage_self.ru_utime + usage_self.ru_stime + usage_children.ru_utime + usage_children.ru_stime
+
+
+def get_process_tree_rss_mb(root_pid):
+    """Get the current resident memory in MB of a process and all its descendants, read from /proc."""
+    children = {}
+    rss_pages = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as f:
+                stat = f.read()
+            with open('/proc/%s/statm' % name) as f:
+                rss_pages[int(name)] = int(f.read().split()[1])
+        except (IOError, IndexError, ValueError):  # the process exited while being read
+            continue
+        parent_pid = int(stat[stat.rindex(')') + 1:].split()[1])  # the command in parentheses can contain spaces
+        children.setdefault(parent_pid, []).append(int(name))
+    total_pages, pids = 0, [root_pid]
+    while pids:
+        pid = pids.pop()
+        total_pages += rss_pages.get(pid, 0)
+        pids.extend(children.get(pid, []))
+    return total_pages * resource.getpagesize() / (1024.0 * 1024.0)
+
+
+class PeakMemorySampler(threading.Thread):
+    """Samples the resident memory of this process tree every interval seconds until stopped, keeping the peak."""
+    def __init__(self, interval=0.5):
+        super(PeakMemorySampler, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while True:
+            self.peak_rss_mb = max(self.peak_rss_mb, get_process_tree_rss_mb(os.getpid()))
+            if self.stopped.wait(self.interval):
+                break
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak_rss_mb
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def format_report(report):
+    return ('workers=%(workers)d queries=%(queries)d blocked=%(blocked)d qps=%(qps).2f '
+            'p50=%(p50).2fs p90=%(p90).2fs p99=%(p99).2fs max=%(max).2fs '
+            'cpu=%(cpu_seconds).1fs max_rss=%(max_rss_mb).0fMB' % report)
+
+
+def parse_command_line_arguments():
+    argparser = argparse.ArgumentParser(description='Load test the crawler against a local Google stand-in')
+    argparser.add_argument('-k', '--workers', type=int, nargs='+', default=[1],
+                           help='Numbers of concurrent workers (browsers) to test, e.g. 1 2 4')
+    argparser.add_argument('-q', '--queries', type=int, default=50,
+                           help='Number of queries per test')
+    argparser.add_argument('-d', '--driver-type', type=str, default='Firefox',
+                           choices=['Firefox', 'Chrome'])
+    argparser.add_argument('-n', '--num-pages', type=int, default=1,
+                           help='Number of search result pages to parse per query')
+    argparser.add_argument('--results-per-page', type=int, default=10,
+                           choices=[10, 20, 30, 50, 100])
+    argparser.add_argument('-w', '--wait-duration', type=float, default=0,
+                           help='Number of seconds to wait before getting the next page')
+    argparser.add_argument('--latency', type=float, default=0.0,
+                           help='Seconds the stand-in waits before each response')
+    argparser.add_argument('--latency-variation', type=float, default=0.0,
+                           help='Maximum random seconds added to latency')
+    argparser.add_argument('--unusual-traffic-rate', type=float, default=0.0,
+                           help='Probability of the stand-in serving an "unusual traffic" page to a search')
+    return argparser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_command_line_arguments()
+    server = google_standin.start_google_standin(latency=args.latency, latency_variation=args.latency_variation,
+                                                 unusual_traffic_rate=args.unusual_traffic_rate)
+    sr_parser.set_google_url(server.url)
+    for num_workers in args.workers:
+        print(format_report(run_load_test(server, num_workers, args.queries, args)))
+    print('stand-in requests: %s' % server.request_counts)
+    server.shutdown()
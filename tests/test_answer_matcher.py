@@ -0,0 +1,33 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import answer_matcher
+
+MATCHER = answer_matcher.AnswerMatcher.from_answers([
+    (0, 'Copernicus'),
+    (1, '(Lou) Gehrig'),
+    (2, 'the Appian Way'),
+    (3, 'Rome'),
+    (4, 'Appian'),
+])
+
+
+def test_finding_all_answers_in_one_pass():
+    text = u'Lou Gehrig walked the Appian Way to Rome, not Romeo.'
+    occurrences = set((occ.key, text[occ.start:occ.end]) for occ in MATCHER.find(text))
+    assert occurrences == {(1, u'Lou Gehrig'), (1, u'Gehrig'), (2, u'the Appian Way'), (2, u'Appian Way'),
+                           (4, u'Appian'), (3, u'Rome')}
+
+
+def test_annotating_snippets_of_an_entry():
+    snippets = [u'COPERNICUS was an astronomer.', None, u'Nicolaus Copernicus, like Copernicus']
+    spans = MATCHER.annotate_snippets(snippets, key=0)
+    assert spans == [[(0, 10)], [], [(9, 19), (26, 36)]]
+    assert MATCHER.annotate_snippets([u'Rome and Copernicus'], key=3) == [[(0, 4)]]
+
+
+def test_finding_the_occurrences_of_one_answer():
+    text = u'Lou Gehrig walked the Appian Way to Rome.'
+    assert [text[occ.start:occ.end] for occ in MATCHER.find(text, key=4)] == [u'Appian']
+    assert MATCHER.find(text, key=0) == []
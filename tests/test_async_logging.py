@@ -0,0 +1,64 @@
+import gzip
+import json
+import logging
+import os
+import Queue
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import async_logging
+
+
+def make_logger(name, log_file, max_bytes=0, sampling_rates=None):
+    queue = Queue.Queue()
+    queue_handler = async_logging.QueueHandler(queue)
+    if sampling_rates:
+        queue_handler.addFilter(async_logging.DebugSamplingFilter(sampling_rates))
+    file_handler = async_logging.GzipRotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=2)
+    file_handler.setFormatter(async_logging.JsonFormatter())
+    listener = async_logging.QueueListener(queue, [file_handler], queue_handler=queue_handler)
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(queue_handler)
+    listener.start()
+    return logger, listener
+
+
+def read_json_lines(file_path):
+    with open(file_path, 'rt') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_are_written_as_json_lines(tmpdir):
+    log_file = str(tmpdir.join('crawler.log'))
+    logger, listener = make_logger('test_json_lines', log_file, sampling_rates={'test_async_logging': 0.25})
+    for no in range(8):
+        logger.debug('parsing result %d', no)
+    logger.info('Collected %d search results.', 8)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception('Could not parse.')
+    listener.stop()
+
+    records = read_json_lines(log_file)
+    assert [record['message'] for record in records] == ['parsing result 0', 'parsing result 4',
+                                                         'Collected 8 search results.', 'Could not parse.']
+    assert records[2]['level'] == 'INFO'
+    assert records[2]['function'] == 'test_records_are_written_as_json_lines'
+    assert 'ZeroDivisionError' in records[3]['exception']
+
+
+def test_rotated_files_are_compressed(tmpdir):
+    log_file = str(tmpdir.join('crawler.log'))
+    logger, listener = make_logger('test_rotation', log_file, max_bytes=300)
+    for no in range(20):
+        logger.info('message %d', no)
+    listener.stop()
+
+    assert sorted(os.listdir(str(tmpdir))) == ['crawler.log', 'crawler.log.1.gz', 'crawler.log.2.gz']
+    with gzip.open(log_file + '.1.gz', 'rb') as f:
+        rotated = [json.loads(line)['message'] for line in f]
+    current = [record['message'] for record in read_json_lines(log_file)]
+    assert rotated + current == ['message %d' % no for no in range(20 - len(rotated) - len(current), 20)]
@@ -0,0 +1,47 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import batching
+from qacrawler import packed_dataset
+
+
+def write_packed_dataset(file_path):
+    """Entry i has i snippets of length i + 1, and an empty snippet."""
+    with packed_dataset.PackedDatasetWriter(file_path, with_tokens=True) as writer:
+        for no in range(8):
+            snippets = [u'snippet'] * no + [None]
+            token_ids = [[2, 3], [4]] + [[5] * (no + 1)] * no + [[]]
+            writer.add(100 + no, u'question', u'answer', snippets, token_ids)
+
+
+def test_snippet_filter_and_cap(tmpdir):
+    file_path = str(tmpdir.join('tiny.sqa'))
+    write_packed_dataset(file_path)
+    iterator = batching.BucketBatchIterator(packed_dataset.PackedDataset(file_path), batch_size=2,
+                                            min_snippets=3, max_snippets=5, shuffle=False)
+    assert [entry.no for entry in iterator.entries] == [3, 4, 5, 6, 7]
+    batches = list(iterator)
+    assert [list(batch.entry_ids) for batch in batches] == [[103, 104], [105, 106], [107]]
+    assert batches[0].questions.tolist() == [[2, 3], [2, 3]]
+    assert batches[0].snippets.shape == (2, 4, 5)
+    assert batches[0].snippet_lengths.tolist() == [[4, 4, 4, 0], [5, 5, 5, 5]]
+    assert batches[2].snippet_lengths.tolist() == [[8, 8, 8, 8, 8]]  # capped at max_snippets
+    assert iterator.num_tokens == sum(batch.num_tokens for batch in batches)
+    assert 0 < iterator.padding_ratio < 1
+
+
+def test_bucketing_and_workers(tmpdir):
+    file_path = str(tmpdir.join('tiny.sqa'))
+    write_packed_dataset(file_path)
+    dataset = packed_dataset.PackedDataset(file_path)
+    iterator = batching.BucketBatchIterator(dataset, batch_size=2, min_snippets=0, seed=3)
+    for batch in iterator:
+        assert abs(int(batch.entry_ids[0]) - int(batch.entry_ids[-1])) <= 1  # similar lengths are batched together
+    assert iterator.epoch == 1
+
+    inline = batching.BucketBatchIterator(dataset, batch_size=3, min_snippets=0, seed=5)
+    on_workers = batching.BucketBatchIterator(dataset, batch_size=3, min_snippets=0, seed=5, num_workers=2,
+                                              prefetch=2)
+    assert ([batch.snippets.tolist() for batch in inline] ==
+            [batch.snippets.tolist() for batch in on_workers])
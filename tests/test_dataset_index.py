@@ -0,0 +1,58 @@
+import json
+import os
+import shutil
+import struct
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import dataset_index
+from qacrawler import jeopardy
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), 'data', 'tiny_dataset.json')
+DATASET = jeopardy.Dataset(DATASET_PATH)
+INDEX = dataset_index.DatasetIndex.build(DATASET)
+
+
+def test_selecting_entries():
+    assert INDEX.select('value >= 400') == [6]
+    assert INDEX.select('round == "Jeopardy!" and value < $300') == [0, 1, 2, 3, 4, 5]
+    assert INDEX.select('category ~ history or category in [\'THE COMPANY LINE\']') == [0, 3, 6]
+    assert INDEX.select('not (air_date >= 2004-12-31) or show_number != 4680') == []
+
+
+def test_saved_index_is_loaded(tmpdir):
+    dataset_path = str(tmpdir.join('tiny_dataset.json'))
+    shutil.copy(DATASET_PATH, dataset_path)
+    dataset_index.DatasetIndex.build(DATASET).save(dataset_path)
+
+    loaded = dataset_index.DatasetIndex.load(dataset_path)
+    assert loaded.select('value == 200') == INDEX.select('value == 200')
+    dataset, entry_nos = dataset_index.select_entries(dataset_path, 'category ~ "history"')
+    assert entry_nos == [0, 6]
+    assert dataset.size == DATASET.size
+    assert [dataset.get_entry(no).to_dict() for no in range(dataset.size)] == \
+           [DATASET.get_entry(no).to_dict() for no in range(DATASET.size)]
+    assert dataset_index.DatasetIndex.load(dataset_path).entry_offsets == dataset.entry_offsets
+
+
+def test_postings_are_saved_as_64_bit_integers(tmpdir):
+    dataset_path = str(tmpdir.join('tiny_dataset.json'))
+    shutil.copy(DATASET_PATH, dataset_path)
+    dataset_index.DatasetIndex.build(DATASET).save(dataset_path)
+    keys_path, postings_path = dataset_index.get_index_paths(dataset_path)
+    with open(keys_path, 'rt') as f:
+        saved = json.load(f)
+    with open(postings_path, 'rb') as f:
+        data = f.read()
+    assert len(data) == 8 * saved['num_postings']
+    round_offsets = saved['offsets']['round']
+    jeopardy_no = saved['keys']['round'].index('Jeopardy!')
+    start, end = round_offsets[jeopardy_no], round_offsets[jeopardy_no + 1]
+    assert list(struct.unpack_from('<%dq' % (end - start), data, 8 * start)) == INDEX.select('round == "Jeopardy!"')
+
+    saved['posting_format'] = '<l'  # an index saved in another format is stale
+    with open(keys_path, 'wt') as f:
+        json.dump(saved, f)
+    assert dataset_index.DatasetIndex.load(dataset_path) is None
+    assert dataset_index.DatasetIndex.load_or_build(dataset_path).select('value >= 400') == [6]
+    assert dataset_index.DatasetIndex.load(dataset_path) is not None
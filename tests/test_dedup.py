@@ -0,0 +1,53 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import dedup
+
+SNIPPET = (u'Nicolaus Copernicus was a Renaissance-era mathematician and astronomer who formulated a model '
+           u'of the universe that placed the Sun rather than the Earth at the center of the universe.')
+NEAR_DUPLICATE = SNIPPET.replace(u'Renaissance-era', u'Renaissance era') + u' ...'
+DIFFERENT = u'Galileo Galilei was an Italian astronomer, physicist and engineer, sometimes described as a polymath.'
+
+
+class Result(object):
+    def __init__(self, snippet):
+        self.snippet = snippet
+
+
+def test_finding_near_duplicates():
+    index = dedup.NearDuplicateIndex(threshold=0.6)
+    assert index.find_or_add(0, SNIPPET) is None
+    assert index.find_or_add(1, DIFFERENT) is None
+    assert index.find_or_add(2, NEAR_DUPLICATE) == 0
+
+
+def test_deduplicating_query_results_keeps_order():
+    results = [Result(SNIPPET), Result(None), Result(DIFFERENT), Result(SNIPPET)]
+    deduplicated = dedup.deduplicate_results(results)
+    assert deduplicated == results[:3]
+
+
+def test_snippet_store():
+    store = dedup.SnippetStore()
+    assert store.add(SNIPPET) == (0, True)
+    assert store.add(DIFFERENT) == (1, True)
+    assert store.add(SNIPPET) == (0, False)
+    assert store.get(1) == DIFFERENT
+
+
+def test_candidates_of_a_shared_bucket_are_all_verified():
+    index = dedup.NearDuplicateIndex(threshold=0.8, num_permutations=64, num_bands=8)
+    first = (0,) * 64
+    second = (0,) * 8 + (1,) * 56  # shares only the first band with first, and is not similar to it
+    near_second = list(second)
+    for band_no in range(1, 8):
+        near_second[band_no * 8] = 2  # shares only the first band with second, but is 57/64 similar to it
+    signatures = {u'first': first, u'second': second, u'near second': tuple(near_second)}
+    index.hasher.get_signature = lambda text: signatures[text]
+
+    assert index.find_or_add(0, u'first') is None
+    assert index.find_or_add(1, u'second') is None
+    assert index.find_or_add(2, u'near second') == 1
+    index.remove(1)
+    assert index.find_or_add(3, u'near second') is None
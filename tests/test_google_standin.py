@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import urllib2
+sys.path.insert(0, os.path.abspath('..'))
+
+import pytest
+from bs4 import BeautifulSoup
+
+import google_standin
+import urllib_driver
+from qacrawler import crawler
+from qacrawler import jeopardy
+from qacrawler import proxies
+from qacrawler import sr_parser
+from qacrawler.google_dom_info import GoogleDomInfoWithoutJS as GDom
+
+DATASET = jeopardy.Dataset(os.path.join(os.path.dirname(__file__), 'data', 'tiny_dataset.json'))
+
+
+def test_results_pages_are_parsable():
+    server = google_standin.start_google_standin(results_per_query=15)
+    opener = urllib2.build_opener(urllib2.HTTPCookieProcessor())
+    try:
+        sr_parser.set_gdom(disable_javascript=True)
+        opener.open(server.url + '/setprefs?num=10&submit2=Save').read()
+        first_page = opener.open(server.url + '/search?q=cheese').read()
+        results = sr_parser.parse_results_page_source(first_page)
+        assert len(results) == 10
+        assert results[0].title == 'Cheese - Wikipedia, the free encyclopedia (0)'
+        assert results[0].snippet.startswith('cheese Cheese is a food')
+        assert results[0].related_links == ['Etymology', 'History', 'Production', 'Processing']
+
+        navigation_links = BeautifulSoup(first_page, 'html.parser').select('.' + GDom.NAVIGATION_LINK_CLASS)
+        assert navigation_links[-1].text == 'Next'
+        second_page = opener.open(server.url + navigation_links[-1]['href']).read()
+        assert len(sr_parser.parse_results_page_source(second_page)) == 5
+        assert server.request_counts == {'setprefs': 1, 'front': 1, 'search': 2}
+    finally:
+        server.shutdown()
+
+
+def test_unusual_traffic_page():
+    server = google_standin.start_google_standin(unusual_traffic_rate=1.0)
+    try:
+        urllib2.urlopen(server.url + '/search?q=cheese')
+        assert False, 'Expected an HTTP error'
+    except urllib2.HTTPError as e:
+        assert 'unusual traffic' in e.read()
+    finally:
+        server.shutdown()
+
+
+def get_route():
+    """A route of a proxy pool that only records outcomes, since the urllib2 driver does not use proxies."""
+    return proxies.ProxyPool(['http://10.0.0.1:3128'], requests_per_minute=6000, burst=10).lease()
+
+
+def crawl_standin(server, output_folder, entries, num_pages, monkeypatch, route=None):
+    """Crawl entries from the stand-in with a urllib2 driver, without politeness waits."""
+    monkeypatch.setattr(sr_parser, 'GOOGLE_URL', server.url)
+    monkeypatch.setattr(sr_parser, 'wait_with_variance', lambda duration, variation=1.0: None)
+    driver = urllib_driver.UrllibDriver()
+    settings = crawler.CrawlerSettings(driver, num_pages, output_folder, 0, simulate_typing=False,
+                                       simulate_clicking=False, disable_javascript=True, route=route)
+    crawler.crawl(settings, entries)
+    return driver
+
+
+def test_crawl_saves_results_of_standin(tmpdir, monkeypatch):
+    server = google_standin.start_google_standin(results_per_query=15)
+    entries = [DATASET.get_entry(no) for no in range(2)]
+    route = get_route()
+    try:
+        crawl_standin(server, str(tmpdir), entries, 3, monkeypatch, route=route)
+        assert server.request_counts == {'front': 2, 'search': 4}
+        assert route.proxy.counts == {proxies.OK: 4, proxies.BLOCKED: 0, proxies.FAILED: 0}  # one per results page
+    finally:
+        server.shutdown()
+    for entry in entries:
+        with open(str(tmpdir.join(crawler.generate_filename(entry, 'json'))), 'rt') as f:
+            output = json.load(f)
+        assert output['question'] == entry.question
+        assert len(output['search_results']) == 15
+        assert output['search_results'][14]['title'].endswith('(14)')
+
+
+def test_crawl_exits_on_unusual_traffic_page(tmpdir, monkeypatch):
+    server = google_standin.start_google_standin(unusual_traffic_rate=1.0)
+    route = get_route()
+    try:
+        with pytest.raises(SystemExit):
+            crawl_standin(server, str(tmpdir), [DATASET.get_entry(0)], 2, monkeypatch, route=route)
+        assert server.request_counts == {'front': 1, 'unusual_traffic': 1}
+        assert route.proxy.counts == {proxies.OK: 0, proxies.BLOCKED: 1, proxies.FAILED: 0}
+    finally:
+        server.shutdown()
+    assert tmpdir.listdir() == []
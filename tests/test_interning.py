@@ -0,0 +1,58 @@
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import crawler
+from qacrawler import interning
+from qacrawler import jeopardy
+from qacrawler import sr_parser
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), 'data', 'tiny_dataset.json')
+
+
+class Result(object):
+    def __init__(self, title, url):
+        self.title = title
+        self.url = url
+        self.snippet = 'snippet of ' + title
+        self.related_links = None
+
+    def to_dict(self):
+        return {'title': self.title, 'url': self.url, 'snippet': self.snippet, 'related_links': self.related_links}
+
+
+RESULTS = [Result('Cheese - Wikipedia', 'https://en.wikipedia.org/wiki/Cheese'),
+           Result('Copernicus - Wikipedia', 'https://en.wikipedia.org/wiki/Copernicus'),
+           Result('Cheese - Wikipedia', 'https://en.wikipedia.org/wiki/Cheese')]
+
+
+def test_interning_results():
+    interner = interning.CrawlInterner()
+    interned = [interner.intern_result(res) for res in RESULTS]
+    assert [res['url_id'] for res in interned] == [0, 1, 0]
+    assert [res['host_id'] for res in interned] == [0, 0, 0]
+    assert interner.get_result_host(interned[1]) == 'en.wikipedia.org'
+    assert interner.resolve_result(interned[1]) == RESULTS[1].to_dict()
+
+
+def test_saved_tables_keep_ids(tmpdir):
+    output_folder = str(tmpdir)
+    entry = jeopardy.Dataset(DATASET_PATH).get_entry(0)
+    crawler.save_results_for_entry(RESULTS, entry, output_folder, interner=interning.CrawlInterner(output_folder))
+
+    with open(os.path.join(output_folder, crawler.generate_filename(entry, 'json')), 'rt') as f:
+        output = json.load(f)
+    reloaded = interning.CrawlInterner(output_folder)
+    assert [reloaded.resolve_result(res) for res in output['search_results']] == [res.to_dict() for res in RESULTS]
+    assert reloaded.intern_result(Result('New page', 'http://www.cheese.com/'))['url_id'] == 2
+
+
+def test_parsed_results_share_strings():
+    sr_parser.set_gdom(disable_javascript=False)
+    with open(os.path.join(os.path.dirname(__file__), 'data', 'one_result.html'), 'rt') as f:
+        page_source = f.read()
+    first, second = [sr_parser.parse_results_page_source(page_source)[0] for _ in range(2)]
+    assert first.url == second.url
+    assert first.url is second.url
+    assert first.title is second.title
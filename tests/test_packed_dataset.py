@@ -0,0 +1,48 @@
+import os
+import pickle
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import packed_dataset
+
+
+def write_tiny_packed_dataset(file_path):
+    with packed_dataset.PackedDatasetWriter(file_path, with_tokens=True) as writer:
+        writer.add(7, u'Galileo supported him', u'Copernicus', [u'Copernicus was an astronomer', None],
+                   token_ids=[[2, 3, 4], [5], [5, 6, 7, 8], []])
+        writer.add(42, u'Caf\xe9 question', u'answer', [], token_ids=[[9, 10], [11]])
+
+
+def test_reading_by_index(tmpdir):
+    file_path = str(tmpdir.join('tiny.sqa'))
+    write_tiny_packed_dataset(file_path)
+    dataset = packed_dataset.PackedDataset(file_path)
+
+    assert len(dataset) == 2
+    entry = dataset[0]
+    assert entry.id == 7
+    assert entry.answer == u'Copernicus'
+    assert entry.snippets == [u'Copernicus was an astronomer', u'']
+    assert dataset[1].question == u'Caf\xe9 question'
+    assert dataset.get_num_snippets(1) == 0
+    assert [list(ids) for ids in dataset.get_token_ids(0)] == [[2, 3, 4], [5], [5, 6, 7, 8], []]
+
+
+def test_pickling_reopens_file(tmpdir):
+    file_path = str(tmpdir.join('tiny.sqa'))
+    write_tiny_packed_dataset(file_path)
+    dataset = pickle.loads(pickle.dumps(packed_dataset.PackedDataset(file_path)))
+
+    assert dataset[1].id == 42
+    assert [list(ids) for ids in dataset.get_token_ids(1)] == [[9, 10], [11]]
+
+
+def test_64_bit_tables(tmpdir):
+    table = packed_dataset.Int64Table(signed=True, values=[0, -1, 2 ** 40])
+    assert len(table) == 3
+    assert [table[0], table[1], table[-1]] == [0, -1, 2 ** 40]
+
+    file_path = str(tmpdir.join('large_id.sqa'))
+    with packed_dataset.PackedDatasetWriter(file_path) as writer:
+        writer.add(2 ** 33 + 5, u'question', u'answer', [u'snippet'])
+    assert packed_dataset.PackedDataset(file_path)[0].id == 2 ** 33 + 5
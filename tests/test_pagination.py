@@ -0,0 +1,41 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import pagination
+from qacrawler import sr_parser
+
+
+def test_results_per_page_reaches_target_in_fewest_pages():
+    assert pagination.PaginationPolicy(target_snippets=50).choose_results_per_page() == 50
+    assert pagination.PaginationPolicy(target_snippets=25).choose_results_per_page() == 30
+    policy = pagination.PaginationPolicy(target_snippets=150)
+    assert policy.choose_results_per_page() == 100
+    assert policy.get_num_pages(100) == 2
+    assert policy.get_num_pages(50) == 3
+
+
+def test_next_page_is_requested_only_while_useful():
+    policy = pagination.PaginationPolicy(target_snippets=50, min_snippets=41)
+    assert policy.should_request_next_page(46, None, pages_left=1, results_per_page=50)
+    assert not policy.should_request_next_page(50, None, pages_left=1, results_per_page=50)
+    assert not policy.should_request_next_page(46, None, pages_left=0, results_per_page=50)
+    # Google estimates fewer results than the minimum
+    assert not policy.should_request_next_page(12, 30, pages_left=2, results_per_page=10)
+    # remaining pages can not bring the question above the minimum
+    assert not policy.should_request_next_page(8, 1000, pages_left=3, results_per_page=10)
+    assert policy.should_request_next_page(11, 1000, pages_left=3, results_per_page=10)
+
+
+def test_minimum_is_capped_at_target():
+    policy = pagination.PaginationPolicy(target_snippets=30)
+    assert policy.min_snippets == 30
+    assert policy.should_request_next_page(10, 1000000, pages_left=3, results_per_page=10)
+    assert not policy.should_request_next_page(10, 1000000, pages_left=1, results_per_page=10)
+
+
+def test_parse_number_of_results():
+    assert sr_parser.parse_number_of_results('About 1,230,000 results (0.42 seconds)') == 1230000
+    assert sr_parser.parse_number_of_results('Page 2 of about 345 results') == 345
+    assert sr_parser.parse_number_of_results('1 result') == 1
+    assert sr_parser.parse_number_of_results('No results found') is None
@@ -0,0 +1,93 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+import pytest
+
+from qacrawler import crawler
+from qacrawler import interning
+from qacrawler import jeopardy
+from qacrawler import parquet_export
+
+DATASET = jeopardy.Dataset(os.path.join(os.path.dirname(__file__), 'data', 'tiny_dataset.json'))
+
+
+class Result(object):
+    def __init__(self, title, url, snippet):
+        self.title = title
+        self.url = url
+        self.snippet = snippet
+        self.related_links = ['History'] if snippet else []
+
+    def to_dict(self):
+        return {'title': self.title, 'url': self.url, 'snippet': self.snippet, 'related_links': self.related_links}
+
+
+RESULTS = [Result('Cheese', 'https://en.wikipedia.org/wiki/Cheese', 'Cheese is a food'),
+           Result('Video', 'https://www.youtube.com/watch?v=1', None)]
+
+
+def test_rows_of_an_entry():
+    columns = parquet_export.empty_columns()
+    entry = DATASET.get_entry(3)
+    parquet_export.append_rows(columns, entry.to_dict(), [res.to_dict() for res in RESULTS],
+                               {'crawled_at': 1.5, 'parser_version': 1})
+    assert columns['entry_id'] == [3, 3]
+    assert columns['answer'] == [entry.answer, entry.answer]
+    assert columns['rank'] == [0, 1]
+    assert columns['host'] == [u'en.wikipedia.org', u'www.youtube.com']
+    assert columns['snippet'] == [u'Cheese is a food', None]
+    assert columns['related_links'] == [[u'History'], []]
+    assert columns['crawled_at'] == [1.5, 1.5]
+
+
+def test_export_and_read_columns(tmpdir):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    output_folder = str(tmpdir.mkdir('outputs'))
+    for no in [0, 1, 5]:
+        crawler.save_results_for_entry(RESULTS, DATASET.get_entry(no), output_folder)
+    export_folder = str(tmpdir.join('export'))
+    assert parquet_export.export_crawl(output_folder, export_folder, block_size=2) == 3
+    assert sorted(os.listdir(export_folder)) == ['entry_block=0', 'entry_block=2']
+
+    table = pyarrow_parquet.read_table(export_folder, columns=['entry_id', 'rank', 'url'])
+    assert table.num_rows == 6
+    assert sorted(table.column('entry_id').to_pylist()) == [0, 0, 1, 1, 5, 5]
+    parser_versions = pyarrow_parquet.read_table(export_folder, columns=['parser_version']).to_pydict()
+    assert set(parser_versions['parser_version']) == {1}
+
+
+def test_sink_writes_small_files(tmpdir, monkeypatch):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    export_folder = str(tmpdir)
+    sink = parquet_export.ParquetSink(export_folder, rows_per_file=4, flush_interval=60.0)
+    sink.add(DATASET.get_entry(0), RESULTS)
+    assert not os.listdir(export_folder)
+    sink.add(DATASET.get_entry(1), RESULTS)  # 4 rows
+    assert len(os.listdir(os.path.join(export_folder, 'entry_block=0'))) == 1
+
+    now = sink.last_flush
+    monkeypatch.setattr(parquet_export.time, 'time', lambda: now + 61.0)
+    sink.add(DATASET.get_entry(2), RESULTS)  # buffered for longer than flush_interval
+    assert len(os.listdir(os.path.join(export_folder, 'entry_block=0'))) == 2
+    sink.add(DATASET.get_entry(3), RESULTS)
+    sink.close()
+    table = pyarrow_parquet.read_table(export_folder, columns=['entry_id', 'title', 'crawled_at']).to_pydict()
+    assert sorted(table['entry_id']) == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert set(table['title']) == {u'Cheese', u'Video'}
+
+
+def test_export_resolves_interned_outputs(tmpdir):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    output_folder = str(tmpdir.mkdir('outputs'))
+    interner = interning.CrawlInterner(output_folder)
+    for no in [0, 1]:
+        crawler.save_results_for_entry(RESULTS, DATASET.get_entry(no), output_folder, interner=interner)
+    export_folder = str(tmpdir.join('export'))
+    assert parquet_export.export_crawl(output_folder, export_folder) == 2
+
+    table = pyarrow_parquet.read_table(export_folder, columns=['entry_id', 'rank', 'title', 'url', 'host'])
+    rows = sorted(zip(*[table.column(name).to_pylist() for name in ['entry_id', 'rank', 'title', 'url', 'host']]))
+    assert rows[:2] == [(0, 0, u'Cheese', u'https://en.wikipedia.org/wiki/Cheese', u'en.wikipedia.org'),
+                        (0, 1, u'Video', u'https://www.youtube.com/watch?v=1', u'www.youtube.com')]
+    assert len(rows) == 4
@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import crawler
+from qacrawler import jeopardy
+from qacrawler import pipeline
+from qacrawler import sr_parser
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+DATASET = jeopardy.Dataset(os.path.join(DATA_FOLDER, 'tiny_dataset.json'))
+
+
+def test_pipelined_crawl(tmpdir, monkeypatch):
+    with open(os.path.join(DATA_FOLDER, 'one_result.html'), 'rt') as f:
+        page_source = f.read()
+    num_pages = {0: 2, 1: 0, 2: 1}
+
+    def iterate_page_sources(query, settings):
+        sr_parser.set_gdom(settings.disable_javascript)
+        entry_no = [entry.id for entry in entries if entry.question == query][0]
+        for _ in range(num_pages[entry_no]):
+            yield page_source
+
+    monkeypatch.setattr(sr_parser, 'iterate_search_result_page_sources', iterate_page_sources)
+    entries = [DATASET.get_entry(no) for no in range(3)]
+    settings = crawler.CrawlerSettings(None, 2, str(tmpdir), 0, False, False, disable_javascript=False,
+                                       pipeline=True)
+    pipeline.crawl(settings, entries)
+
+    assert sorted(os.listdir(str(tmpdir))) == [crawler.generate_filename(entries[no], 'json') for no in [0, 2]]
+    with open(str(tmpdir.join(crawler.generate_filename(entries[0], 'json'))), 'rt') as f:
+        output = json.load(f)
+    assert len(output['search_results']) == 2
+    assert output['answer'] == 'Copernicus'
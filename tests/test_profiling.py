@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+import time
+import types
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import profiling
+
+
+def burn_cpu(seconds):
+    start = time.time()
+    while time.time() - start < seconds:
+        pass
+
+
+def wait(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+Phases = types.ModuleType('phases')
+Phases.wait = wait
+
+
+def test_phases_measure_the_cpu_time_of_their_thread(tmpdir):
+    profiler = profiling.Profiler(str(tmpdir), trace_memory=False)
+    profiler.instrument(Phases, 'wait')
+    busy = threading.Thread(target=burn_cpu, args=(0.3,))
+    busy.start()
+    assert Phases.wait(0.2) == 0.2
+    assert Phases.wait(0.1) == 0.1
+    busy.join()
+
+    stats = profiler.phase_stats['wait']
+    assert stats.calls == 2
+    assert stats.wall_total >= 0.3
+    assert stats.cpu_total < 0.1  # the other thread's CPU time is not counted
+    profiler.dump()
+    with open(str(tmpdir.join('phases.tsv')), 'rt') as f:
+        lines = f.read().split('\n')
+    assert lines[0] == profiling.PhaseStats.TSV_HEADER
+    assert lines[1].split('\t')[:2] == ['wait', '2']
+
+
+def test_stack_samples_are_dumped_collapsed(tmpdir):
+    profiler = profiling.Profiler(str(tmpdir), sampling_interval=0.005, trace_memory=False)
+    profiler.start()
+    busy = threading.Thread(target=burn_cpu, args=(0.2,), name='busy-thread')
+    busy.start()
+    busy.join()
+    profiler.stop()
+
+    with open(str(tmpdir.join('cpu.collapsed')), 'rt') as f:
+        lines = f.read().splitlines()
+    busy_lines = [line for line in lines if line.startswith('busy-thread;')]
+    assert busy_lines
+    stack, count = busy_lines[0].rsplit(' ', 1)
+    assert int(count) > 0
+    assert 'test_profiling.py:burn_cpu:' in stack.split(';')[-1]
+    assert not any(line.startswith('profiler-') for line in lines)
@@ -0,0 +1,166 @@
+import argparse
+import os
+import sys
+import threading
+import urllib2
+sys.path.insert(0, os.path.abspath('..'))
+
+import pytest
+
+import google_standin
+import proxy_standin
+import urllib_driver
+from qacrawler import crawler
+from qacrawler import driver_wrapper
+from qacrawler import jeopardy
+from qacrawler import main
+from qacrawler import proxies
+from qacrawler import service
+from qacrawler import sr_parser
+
+DATASET = jeopardy.Dataset(os.path.join(os.path.dirname(__file__), 'data', 'tiny_dataset.json'))
+
+
+def test_token_bucket_limits_rate_and_burst():
+    bucket = proxies.TokenBucket(rate=2.0, capacity=2, now=100.0)
+    assert bucket.take(100.0) == 0.0
+    assert bucket.take(100.0) == 0.0
+    assert bucket.take(100.0) == pytest.approx(0.5)
+    assert bucket.take(100.5) == 0.0
+    assert bucket.take(110.0) == 0.0  # tokens do not pile up beyond capacity
+    assert bucket.take(110.0) == 0.0
+    assert bucket.take(110.0) > 0.0
+
+
+def test_pool_spreads_leases_and_retires_blocked_proxies():
+    pool = proxies.ProxyPool(['http://10.0.0.1:3128', 'socks5://10.0.0.2:1080'], max_consecutive_blocks=2)
+    first, second = pool.lease(), pool.lease()
+    assert set([first.proxy.url, second.proxy.url]) == set(['http://10.0.0.1:3128', 'socks5://10.0.0.2:1080'])
+    second.report(proxies.BLOCKED)
+    first.report(proxies.OK)
+    assert second.proxy.health < first.proxy.health
+    assert pool.lease().proxy is first.proxy  # equally leased, healthier
+    second.report(proxies.BLOCKED)
+    assert second.proxy.retired
+    assert all(pool.lease().proxy is first.proxy for _ in range(3))
+    first.report(proxies.BLOCKED)
+    first.report(proxies.BLOCKED)
+    with pytest.raises(proxies.NoProxyAvailable):
+        pool.lease()
+    with pytest.raises(ValueError):
+        proxies.Proxy('10.0.0.3', proxies.TokenBucket(1.0, 1))
+
+
+def test_pool_retires_failing_proxies():
+    pool = proxies.ProxyPool(['http://10.0.0.1:3128'], max_consecutive_failures=2)
+    route = pool.lease()
+    route.report(proxies.FAILED)
+    route.report(proxies.OK)
+    route.report(proxies.FAILED)
+    assert not route.proxy.retired
+    assert route.proxy.health < 1.0
+    route.report(proxies.FAILED)
+    assert route.proxy.retired
+    with pytest.raises(proxies.NoProxyAvailable):
+        pool.lease()
+
+
+def test_crawling_through_standin_proxies():
+    google = google_standin.start_google_standin()
+    standins = [proxy_standin.start_proxy_standin(), proxy_standin.start_proxy_standin(),
+                proxy_standin.start_proxy_standin(block_rate=1.0)]
+    pool = proxies.ProxyPool([standin.url for standin in standins], requests_per_minute=6000, burst=5)
+    try:
+        def work():
+            for query_no in range(8):
+                try:
+                    route = pool.lease()
+                except proxies.NoProxyAvailable:
+                    return
+                route.wait()
+                try:
+                    page = route.proxy.build_opener().open(google.url + '/search?q=cheese%d' % query_no).read()
+                except urllib2.HTTPError as e:
+                    page = e.read()
+                route.report(proxies.BLOCKED if google_standin.UNUSUAL_TRAFFIC_TEXT in page else proxies.OK)
+                route.release()
+
+        workers = [threading.Thread(target=work) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        stats = pool.stats()
+        assert [proxy['retired'] for proxy in stats] == [False, False, True]
+        assert stats[2]['counts'][proxies.BLOCKED] == standins[2].request_counts['blocked'] == 3
+        assert sum(proxy['counts'][proxies.OK] for proxy in stats) == google.request_counts['search'] == 21
+        assert all(standin.request_counts['forwarded'] > 0 for standin in standins[:2])
+    finally:
+        for server in [google] + standins:
+            server.shutdown()
+
+
+def use_standins(monkeypatch, google):
+    """Point the crawler to the Google stand-in, with urllib2 drivers that go through the stand-in proxies."""
+    monkeypatch.setattr(sr_parser, 'GOOGLE_URL', google.url)
+    monkeypatch.setattr(sr_parser, 'GOOGLE_PREFERENCES_URL', google.url + '/preferences?hl=en')
+    monkeypatch.setattr(sr_parser, 'wait_with_variance', lambda duration, variation=1.0: None)
+    monkeypatch.setattr(driver_wrapper, 'get_selenium_driver',
+                        lambda driver_type, proxy=None: urllib_driver.UrllibDriver(proxy=proxy))
+    monkeypatch.setattr(driver_wrapper, 'disable_javascript', lambda driver, driver_type: None)
+    # the urllib2 driver can not use the select of the preferences page, whose visit is still checked
+    monkeypatch.setattr(main, 'find_select_and_set', lambda driver, num_results, route=None: None)
+    monkeypatch.setattr(main, 'save_preferences', lambda driver: None)
+
+
+def test_service_worker_fails_over_when_blocked_while_starting(tmpdir, monkeypatch):
+    google = google_standin.start_google_standin(results_per_query=5)
+    blocked, healthy = proxy_standin.start_proxy_standin(block_rate=1.0), proxy_standin.start_proxy_standin()
+    proxies_path = tmpdir.join('proxies.txt')
+    proxies_path.write('%s\n%s\n' % (blocked.url, healthy.url))
+    use_standins(monkeypatch, google)
+    args = argparse.Namespace(proxies=str(proxies_path), proxy_requests_per_minute=6000, proxy_burst=10,
+                              driver_type='Firefox', disable_javascript=True, results_per_page=20, num_pages=1,
+                              wait_duration=0, simulate_typing=False, simulate_clicking=False)
+    search_service = service.SearchService(service.get_settings_factory(args), num_workers=1, restart_delay=0)
+    search_service.start()
+    try:
+        results = search_service.search('cheese', timeout=10)
+        assert len(results) == 5
+        assert blocked.request_counts == {'forwarded': 0, 'blocked': 1}  # the dummy query of the preferences
+        assert healthy.request_counts['forwarded'] == 4  # dummy query, preferences, front page and results page
+        assert search_service.workers[0].settings.route.proxy.url == healthy.url
+        blocked_stats, healthy_stats = search_service.workers[0].settings.route.pool.stats()
+        assert blocked_stats['counts'] == {proxies.OK: 0, proxies.BLOCKED: 1, proxies.FAILED: 0}
+        assert blocked_stats['leases'] == 0
+        assert healthy_stats['counts'][proxies.OK] == 1
+    finally:
+        search_service.stop()
+        for server in [google, blocked, healthy]:
+            server.shutdown()
+
+
+def test_main_fails_over_to_another_proxy_when_blocked(tmpdir, monkeypatch):
+    google = google_standin.start_google_standin(results_per_query=5)
+    blocked, healthy = proxy_standin.start_proxy_standin(block_rate=1.0), proxy_standin.start_proxy_standin()
+    use_standins(monkeypatch, google)
+    pool = proxies.ProxyPool([blocked.url, healthy.url], requests_per_minute=6000, burst=10)
+    route = pool.lease()
+    settings = crawler.CrawlerSettings(urllib_driver.UrllibDriver(proxy=route.proxy), 1, str(tmpdir), 0,
+                                       simulate_typing=False, simulate_clicking=False, disable_javascript=True,
+                                       route=route)
+    entries = [DATASET.get_entry(no) for no in range(2)]
+    get_driver = lambda next_route: urllib_driver.UrllibDriver(proxy=next_route.proxy)
+    monkeypatch.setattr(main, 'initialize', lambda: (settings, entries, get_driver))
+    try:
+        main.main()
+        assert blocked.request_counts == {'forwarded': 0, 'blocked': 1}
+        assert settings.route.proxy.url == healthy.url
+        assert [proxy['leases'] for proxy in pool.stats()] == [0, 1]
+    finally:
+        for server in [google, blocked, healthy]:
+            server.shutdown()
+    # the entry that was blocked is crawled again through the healthy proxy
+    assert sorted(path.basename for path in tmpdir.listdir()) == \
+        sorted(crawler.generate_filename(entry, 'json') for entry in entries)
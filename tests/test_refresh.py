@@ -0,0 +1,58 @@
+import json
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import crawler
+from qacrawler import jeopardy
+from qacrawler import refresh
+from qacrawler import sr_parser
+
+DATASET = jeopardy.Dataset(os.path.join(os.path.dirname(__file__), 'data', 'tiny_dataset.json'))
+
+
+class Result(object):
+    def __init__(self, snippet):
+        self.snippet = snippet
+
+    def to_dict(self):
+        return {'title': 'title', 'url': 'http://example.com', 'snippet': self.snippet, 'related_links': []}
+
+
+def save_output(folder, entry_no, num_snippets, crawled_at=None, parser_version=None):
+    crawler.save_results_for_entry([Result('snippet')] * num_snippets + [Result(None)], DATASET.get_entry(entry_no),
+                                   folder)
+    file_path = os.path.join(folder, crawler.generate_filename(DATASET.get_entry(entry_no), 'json'))
+    with open(file_path, 'rt') as f:
+        output = json.load(f)
+    if crawled_at is not None:
+        output['crawl_metadata']['crawled_at'] = crawled_at
+    if parser_version is not None:
+        output['crawl_metadata']['parser_version'] = parser_version
+    with open(file_path, 'wt') as f:
+        json.dump(output, f)
+
+
+def test_metadata_is_recorded_at_save_time(tmpdir):
+    save_output(str(tmpdir), 0, num_snippets=3)
+    status = refresh.read_output_status(str(tmpdir.join(crawler.generate_filename(DATASET.get_entry(0), 'json'))))
+    assert status.entry_no == 0
+    assert status.num_snippets == 3
+    assert status.parser_version == sr_parser.PARSER_VERSION
+    assert time.time() - status.crawled_at < 60
+
+
+def test_schedule_in_priority_order(tmpdir):
+    now = time.time()
+    folder = str(tmpdir)
+    save_output(folder, 0, num_snippets=50, crawled_at=now - 100 * refresh.SECONDS_PER_DAY)
+    save_output(folder, 1, num_snippets=50, crawled_at=now)
+    save_output(folder, 2, num_snippets=45, crawled_at=now, parser_version=0)
+    save_output(folder, 3, num_snippets=10, crawled_at=now)
+    save_output(folder, 4, num_snippets=30, crawled_at=now - 10 * refresh.SECONDS_PER_DAY)
+
+    criteria = refresh.RefreshCriteria(older_than_days=30, min_snippets=41, outdated_parser=True, now=now)
+    assert refresh.schedule_refresh(folder, criteria) == [2, 3, 4, 0]
+    assert refresh.schedule_refresh(folder, refresh.RefreshCriteria(older_than_days=5, now=now)) == [4, 0]
+    assert not refresh.RefreshCriteria().has_criteria()
@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+import tarfile
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import reparser
+from qacrawler import sr_parser
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def test_page_source_parsing():
+    sr_parser.set_gdom(disable_javascript=False)
+    page_source = reparser.read_saved_page(DATA_FOLDER, 'cheese - Google Search.html')
+    results = sr_parser.parse_results_page_source(page_source)
+
+    with open(os.path.join(DATA_FOLDER, 'parsed.tsv'), 'rt') as f:
+        parsed_rows = [line.split('\t') for line in f.read().split('\n')]
+    assert [(sr.title, sr.url) for sr in results] == [(row[0], row[1]) for row in parsed_rows]
+
+
+def test_reparsing_folder(tmpdir):
+    output_folder = str(tmpdir)
+    num_pages, num_results = reparser.reparse(DATA_FOLDER, output_folder, disable_javascript=False,
+                                              processes=2)
+    assert num_pages == 2
+    assert num_results == 11 + 1
+
+    with open(os.path.join(output_folder, 'one_result.json'), 'rt') as f:
+        output = json.load(f)
+    assert output['search_results'][0]['url'] == 'https://en.wikipedia.org/wiki/Cheese'
+
+
+def test_pages_with_the_same_name_in_subfolders(tmpdir):
+    with open(os.path.join(DATA_FOLDER, 'one_result.html'), 'rt') as f:
+        page_source = f.read()
+    for folder in ['2015', '2016']:
+        tmpdir.join('pages', folder, 'page.html').write_binary(page_source, ensure=True)
+    output_folder = str(tmpdir.join('outputs'))
+    num_pages, _ = reparser.reparse(str(tmpdir.join('pages')), output_folder, disable_javascript=False, processes=2)
+    assert num_pages == 2
+    assert sorted(os.listdir(output_folder)) == ['2015', '2016']
+    assert os.listdir(os.path.join(output_folder, '2016')) == ['page.json']
+
+
+def test_reparsed_pages_keep_their_crawl_time(tmpdir):
+    page_path = tmpdir.join('pages', 'page.html')
+    page_path.write_binary(reparser.read_saved_page(DATA_FOLDER, 'one_result.html'), ensure=True)
+    os.utime(str(page_path), (1400000000, 1400000000))
+    archive_path = str(tmpdir.join('pages.tar'))
+    with tarfile.open(archive_path, 'w') as archive:
+        archive.add(str(page_path), arcname='archived.html')
+
+    for input_path in [str(tmpdir.join('pages')), archive_path]:
+        reparser.reparse(input_path, str(tmpdir.join('outputs')), disable_javascript=False, processes=1)
+    for name in ['page.json', 'archived.json']:
+        with open(str(tmpdir.join('outputs', name)), 'rt') as f:
+            crawl_metadata = json.load(f)['crawl_metadata']
+        assert crawl_metadata['crawled_at'] == 1400000000
+        assert crawl_metadata['parser_version'] == sr_parser.PARSER_VERSION
@@ -0,0 +1,76 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+import pytest
+
+from qacrawler import crawler
+from qacrawler import jeopardy
+from qacrawler import result_store
+
+DATASET = jeopardy.Dataset(os.path.join(os.path.dirname(__file__), 'data', 'tiny_dataset.json'))
+
+
+class Result(object):
+    def __init__(self, title, url, snippet):
+        self.title = title
+        self.url = url
+        self.snippet = snippet
+        self.related_links = ['History']
+
+    def to_dict(self):
+        return {'title': self.title, 'url': self.url, 'snippet': self.snippet, 'related_links': self.related_links}
+
+
+CHEESE = Result('Cheese', 'https://en.wikipedia.org/wiki/Cheese', 'Swiss cheese is a generic name')
+MILK = Result('Milk', 'https://en.wikipedia.org/wiki/Milk', 'Milk is the source of cheese')
+EMPTY = Result('Video', 'https://www.youtube.com/watch?v=1', None)
+
+
+def test_store_and_search(tmpdir):
+    store = result_store.ResultStore(str(tmpdir.join('crawl.db')), batch_size=2)
+    store.add(DATASET.get_entry(0), [CHEESE, EMPTY])
+    store.add(DATASET.get_entry(1), [MILK, CHEESE])
+    store.add(DATASET.get_entry(2), [EMPTY])
+    assert store.pending  # the third entry waits for the next batch
+    assert store.find_url(CHEESE.url) == [(0, 0), (1, 1)]
+    assert store.search_snippets(u'swiss cheese') == [(0, 0), (1, 1)]
+    assert store.search_snippets(u'cheese', max_rank=1) == [(0, 0), (1, 0)]
+
+    store.add(DATASET.get_entry(1), [EMPTY])  # re-crawled
+    assert store.find_url(CHEESE.url) == [(0, 0)]
+    assert store.search_snippets(u'milk') == []
+    rows = store.connection.execute('SELECT id, tag, num_results FROM entries ORDER BY id').fetchall()
+    assert rows == [(0, DATASET.get_entry(0).tag, 2), (1, DATASET.get_entry(1).tag, 1),
+                    (2, DATASET.get_entry(2).tag, 1)]
+    store.close()
+
+
+def test_import_crawl_outputs(tmpdir):
+    output_folder = tmpdir.mkdir('outputs')
+    crawler.save_results_for_entry([CHEESE, MILK], DATASET.get_entry(3), str(output_folder))
+    store = result_store.ResultStore(str(tmpdir.join('crawl.db')))
+    assert result_store.import_crawl(str(output_folder), store) == 1
+    row = store.connection.execute('SELECT question, answer, tag FROM entries WHERE id = 3').fetchone()
+    entry = DATASET.get_entry(3)
+    assert row == (entry.question, entry.answer, entry.tag)
+    assert store.find_url(MILK.url) == [(3, 1)]
+    store.close()
+
+
+def test_pending_batch_is_written_when_the_crawl_exits(tmpdir, monkeypatch):
+    from qacrawler import main
+    store = result_store.ResultStore(str(tmpdir.join('crawl.db')), batch_size=10)
+    settings = crawler.CrawlerSettings(None, 1, str(tmpdir), 0, False, False, False, sinks=[store])
+
+    def crawl_until_blocked(settings, entries):
+        crawler.save_results_for_entry([CHEESE], entries[0], settings.output_folder, sinks=settings.sinks)
+        raise SystemExit  # as sr_parser.check_google_bot_police does
+
+    monkeypatch.setattr(main, 'initialize', lambda: (settings, [DATASET.get_entry(0)], None))
+    monkeypatch.setattr(crawler, 'crawl', crawl_until_blocked)
+    with pytest.raises(SystemExit):
+        main.main()
+    reopened = result_store.ResultStore(str(tmpdir.join('crawl.db')))
+    assert reopened.find_url(CHEESE.url) == [(0, 0)]
+    reopened.close()
@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+import threading
+import urllib2
+sys.path.insert(0, os.path.abspath('..'))
+
+import pytest
+
+from qacrawler import service
+from qacrawler import sr_parser
+
+
+class FakeDriver(object):
+    def quit(self):
+        pass
+
+
+class FakeSettings(object):
+    def __init__(self):
+        self.driver = FakeDriver()
+        self.route = None
+
+
+class Result(object):
+    def __init__(self, title):
+        self.title = title
+
+    def to_dict(self):
+        return {'title': self.title}
+
+
+def start_service(monkeypatch, collect, num_workers=1, restart_delay=0, **kwargs):
+    """Start a service of which workers get fake settings, and collect results with the given function."""
+    factory_calls = []
+
+    def settings_factory():
+        factory_calls.append(1)
+        return FakeSettings()
+
+    monkeypatch.setattr(sr_parser, 'collect_query_results_from_google', collect)
+    search_service = service.SearchService(settings_factory, num_workers=num_workers,
+                                            restart_delay=restart_delay, **kwargs)
+    search_service.start()
+    return search_service, factory_calls
+
+
+def test_results_are_cached(monkeypatch):
+    searched = []
+
+    def collect(question, settings):
+        searched.append(question)
+        return [Result(question.upper())]
+
+    search_service, _ = start_service(monkeypatch, collect)
+    try:
+        assert search_service.search('cheese', timeout=5) == [{'title': 'CHEESE'}]
+        assert search_service.search_batch(['cheese', 'wine'], timeout=5) == [[{'title': 'CHEESE'}],
+                                                                              [{'title': 'WINE'}]]
+        assert searched == ['cheese', 'wine']
+        assert search_service.health()['cache'] == {'size': 2, 'hits': 1, 'misses': 2}
+    finally:
+        search_service.stop()
+
+
+def test_full_queue_fails_the_rest_of_the_batch_and_timeouts(monkeypatch):
+    release = threading.Event()
+
+    def collect(question, settings):
+        release.wait(5)
+        return [Result(question)]
+
+    search_service, _ = start_service(monkeypatch, collect, num_workers=0, queue_size=2)
+    try:
+        jobs = search_service.submit_batch(['a', 'b', 'c'], deadline=None)
+        assert [job.done.is_set() for job in jobs] == [False, False, True]
+        with pytest.raises(service.ServiceBusy):
+            jobs[2].wait(0)
+        with pytest.raises(service.ServiceBusy):
+            search_service.search('d', timeout=1)
+        with pytest.raises(service.SearchTimeout):
+            jobs[0].wait(0)
+    finally:
+        release.set()
+        search_service.stop()
+
+
+def test_worker_restarts_after_its_driver_stops(monkeypatch):
+    calls = []
+
+    def collect(question, settings):
+        calls.append(question)
+        if len(calls) == 1:
+            sys.exit()  # as sr_parser.quit_driver_and_exit does when caught by bot police
+        return [Result(question)]
+
+    search_service, factory_calls = start_service(monkeypatch, collect, restart_delay=0.5)
+    try:
+        with pytest.raises(service.WorkerFailure):
+            search_service.search('cheese', timeout=5)
+        assert search_service.health()['workers'] == ['restarting']
+        assert search_service.search('cheese', timeout=5) == [{'title': 'cheese'}]
+        assert len(factory_calls) == 2
+        assert search_service.health()['workers'] == ['ready']
+    finally:
+        search_service.stop()
+
+
+def test_worker_retries_when_its_driver_stops_while_starting(monkeypatch):
+    factory_calls = []
+
+    def settings_factory():
+        factory_calls.append(1)
+        if len(factory_calls) == 1:
+            sys.exit()  # as sr_parser.quit_driver_and_exit does when the preferences page is blocked
+        return FakeSettings()
+
+    monkeypatch.setattr(sr_parser, 'collect_query_results_from_google', lambda question, settings: [Result(question)])
+    search_service = service.SearchService(settings_factory, num_workers=1, restart_delay=0.1)
+    search_service.start()
+    try:
+        assert search_service.search('cheese', timeout=5) == [{'title': 'cheese'}]
+        assert search_service.workers[0].is_alive()
+        assert len(factory_calls) == 2
+    finally:
+        search_service.stop()
+
+
+def test_empty_results_are_not_cached(monkeypatch):
+    searched = []
+
+    def collect(question, settings):
+        searched.append(question)
+        return [Result(question)] if len(searched) > 1 else []
+
+    search_service, _ = start_service(monkeypatch, collect)
+    try:
+        assert search_service.search('cheese', timeout=5) == []
+        assert search_service.search('cheese', timeout=5) == [{'title': 'cheese'}]
+        assert search_service.search('cheese', timeout=5) == [{'title': 'cheese'}]
+        assert searched == ['cheese', 'cheese']
+    finally:
+        search_service.stop()
+
+
+def test_invalid_requests_get_bad_request():
+    assert service.validate_search_request({'question': 'cheese', 'timeout': 5}) is None
+    assert service.validate_search_request({'questions': ['a', 'b']}) is None
+    for request in [['cheese'], {'question': 'cheese', 'timeout': '5'}, {'question': 'cheese', 'timeout': -1},
+                    {'questions': 'cheese'}, {'question': 3}, {}]:
+        assert service.validate_search_request(request) is not None
+
+    search_service = service.SearchService(lambda: FakeSettings(), num_workers=0)
+    server = service.SearchHTTPServer(('127.0.0.1', 0), search_service)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        urllib2.urlopen('http://%s:%d/search' % server.server_address, json.dumps('cheese'))
+        assert False, 'Expected an HTTP error'
+    except urllib2.HTTPError as e:
+        assert e.code == 400
+        assert json.loads(e.read()) == {'error': 'Request must be a JSON object.'}
+    finally:
+        server.shutdown()
+        server.server_close()
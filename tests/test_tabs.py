@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import crawler
+from qacrawler import jeopardy
+from qacrawler import proxies
+from qacrawler import sr_parser
+from qacrawler import tabs
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+DATASET = jeopardy.Dataset(os.path.join(DATA_FOLDER, 'tiny_dataset.json'))
+
+
+class FakeElement(object):
+    def __init__(self, href):
+        self.href = href
+
+    def get_attribute(self, name):
+        return self.href
+
+
+class FakeTabbedDriver(object):
+    """Browser of which tabs load a page after it is polled load_polls times."""
+    def __init__(self, page_source, load_polls=3):
+        self.page_source = page_source
+        self.load_polls = load_polls
+        self.window_handles = ['tab-0']
+        self.current_window_handle = 'tab-0'
+        self.urls = {}
+        self.polls_left = {}
+        self.switch_to = self
+
+    def window(self, handle):
+        self.current_window_handle = handle
+
+    def execute_script(self, script, *args):
+        handle = self.current_window_handle
+        if script == tabs.OPEN_TAB_SCRIPT:
+            self.window_handles.append('tab-%d' % len(self.window_handles))
+        elif script == tabs.NAVIGATE_SCRIPT:
+            self.urls.setdefault(handle, []).append(args[0])
+            self.polls_left[handle] = self.load_polls
+        elif script == tabs.READY_SCRIPT:
+            self.polls_left[handle] -= 1
+            return self.polls_left[handle] <= 0
+
+    def find_elements(self, by, value):
+        if value == sr_parser.GDOM.NEXT_PAGE_ID:
+            return [FakeElement(self.urls[self.current_window_handle][-1] + '&start=10')]
+        return []
+
+
+def test_tab_scheduler_crawls_queries_at_once(tmpdir, monkeypatch):
+    monkeypatch.setattr(tabs.random, 'random', lambda: 0.0)
+    with open(os.path.join(DATA_FOLDER, 'one_result.html'), 'rt') as f:
+        driver = FakeTabbedDriver(f.read())
+    entries = [DATASET.get_entry(no) for no in range(3)]
+    settings = crawler.CrawlerSettings(driver, 2, str(tmpdir), 0, False, False, disable_javascript=False,
+                                       num_tabs=2)
+    scheduler = tabs.TabScheduler(settings, num_tabs=2, poll_interval=0.0)
+    scheduler.crawl(entries)
+
+    assert driver.window_handles == ['tab-0', 'tab-1']
+    assert scheduler.max_loading == 2
+    assert sorted(os.listdir(str(tmpdir))) == sorted(crawler.generate_filename(entry, 'json') for entry in entries)
+    with open(str(tmpdir.join(crawler.generate_filename(entries[1], 'json'))), 'rt') as f:
+        output = json.load(f)
+    assert len(output['search_results']) == 2  # one result on each of 2 pages
+    requested = sum(driver.urls.values(), [])
+    assert len(requested) == 6
+    assert requested.count(sr_parser.get_search_url(entries[2].question)) == 1
+
+
+def test_search_url():
+    expected = sr_parser.GOOGLE_URL + '/search?q=caf%C3%A9+%26+cr%C3%A8me'
+    assert sr_parser.get_search_url(u'caf\xe9 & cr\xe8me') == expected
+
+
+def test_pages_that_do_not_load_are_reported_as_failed(tmpdir):
+    with open(os.path.join(DATA_FOLDER, 'one_result.html'), 'rt') as f:
+        driver = FakeTabbedDriver(f.read(), load_polls=1000)
+    route = proxies.ProxyPool(['http://10.0.0.1:3128'], requests_per_minute=6000, burst=10).lease()
+    settings = crawler.CrawlerSettings(driver, 2, str(tmpdir), 0, False, False, disable_javascript=False,
+                                       num_tabs=2, route=route)
+    tabs.TabScheduler(settings, num_tabs=2, page_timeout=0.0, poll_interval=0.0).crawl([DATASET.get_entry(0)])
+    assert route.proxy.counts == {proxies.OK: 0, proxies.BLOCKED: 0, proxies.FAILED: 1}
+    assert tmpdir.listdir() == []
@@ -0,0 +1,40 @@
+import collections
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import batching
+from qacrawler import tokenization
+from qacrawler.tokenization import Vocabulary
+
+
+def test_vocabulary_ids():
+    counts = collections.Counter({u'the': 5, u'cheese': 2, u'apple': 2, u'rare': 1, Vocabulary.UNKNOWN: 7})
+    vocabulary = Vocabulary.from_counts(counts, min_count=2)
+    assert vocabulary.tokens == [Vocabulary.PADDING, Vocabulary.UNKNOWN, u'the', u'apple', u'cheese']
+    assert vocabulary.get_ids([Vocabulary.PADDING, u'the', u'cheese', u'rare']) == [0, 2, 4, 1]
+    assert vocabulary.get_tokens([3, 1]) == [u'apple', Vocabulary.UNKNOWN]
+    assert vocabulary.get_ids([Vocabulary.PADDING]) == [batching.PADDING_ID]
+
+
+def test_tokenize_crawl(tmpdir):
+    input_folder = tmpdir.mkdir('outputs')
+    outputs = {'000001-a.json': {'id': 1, 'question': 'The cheese', 'answer': 'Cheese',
+                                 'search_results': [{'snippet': 'the cheese, the wine'}, {'snippet': None}]},
+               '000002-b.json': {'id': 2, 'question': 'The wine', 'answer': 'Wine',
+                                 'search_results': [{'snippet': 'Wine.'}]}}
+    for name, output in outputs.items():
+        input_folder.join(name).write(json.dumps(output))
+    output_folder = str(tmpdir.join('tokenized'))
+    vocabulary = tokenization.tokenize_crawl(str(input_folder), output_folder, processes=2)
+
+    assert vocabulary.tokens[2:] == [u'the', u'wine', u'cheese', u',', u'.']
+    assert Vocabulary.load(os.path.join(output_folder, tokenization.VOCABULARY_FILE_NAME)).tokens == vocabulary.tokens
+    assert sorted(os.listdir(output_folder)) == ['000001-a-tok.json', '000002-b-tok.json', 'vocabulary.tsv']
+    with open(os.path.join(output_folder, '000001-a-tok.json'), 'rt') as f:
+        tokenized = json.load(f)
+    assert tokenized['question_tokens'] == [u'the', u'cheese']
+    assert tokenized['question_ids'] == [2, 4]
+    assert tokenized['snippet_ids'] == [[2, 4, 5, 2, 3], []]
+    assert vocabulary.get_tokens(tokenized['answer_ids']) == [u'cheese']
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+
+from qacrawler import sr_parser
+from qacrawler import watchdog
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+EMPTY_PAGE = '<html><div id="ires">%d</div></html>'
+
+
+def parse_fixture(file_name):
+    with open(os.path.join(DATA_FOLDER, file_name), 'rt') as f:
+        page_source = f.read()
+    return sr_parser.parse_results_page_source(page_source), page_source
+
+
+def test_empty_pages_pause_and_snapshot(tmpdir):
+    sr_parser.set_gdom(disable_javascript=False)
+    results, page_source = parse_fixture('one_result.html')
+    parse_watchdog = watchdog.ParseWatchdog(snapshot_folder=str(tmpdir), max_empty_pages=3)
+    assert not parse_watchdog.observe_page(results * 10, lambda: page_source, query='healthy')
+    assert not parse_watchdog.observe_page([], lambda: EMPTY_PAGE % 1, query='changed', page_no=0)
+    assert not parse_watchdog.observe_page([], lambda: '<html>No results</html>', query='no results')
+    assert not parse_watchdog.observe_page([], lambda: EMPTY_PAGE % 2, query='changed', page_no=1)
+    assert parse_watchdog.observe_page([], lambda: EMPTY_PAGE % 3, query='changed again')
+    assert not parse_watchdog.running.is_set()
+
+    snapshot_folder = tmpdir.join(os.listdir(str(tmpdir))[0])
+    report = json.loads(snapshot_folder.join('report.json').read())
+    assert report['reasons'] == ['3 consecutive pages without results']
+    assert [page['query'] for page in report['pages']] == ['changed', 'changed', 'changed again']
+    assert snapshot_folder.join('page-02.html').read() == EMPTY_PAGE % 3
+    assert report['dom_info']['RESULT_DIV_CLASS'] == 'rc'
+
+    parse_watchdog.resume()
+    assert parse_watchdog.running.is_set()
+    parse_watchdog.wait_while_paused()
+
+
+def test_missing_snippets_raise_alarm(tmpdir):
+    sr_parser.set_gdom(disable_javascript=False)
+    results, page_source = parse_fixture('one_result.html')
+    for result in results:
+        result.snippet = None
+    parse_watchdog = watchdog.ParseWatchdog(snapshot_folder=str(tmpdir), min_pages=5)
+    alarms = [parse_watchdog.observe_page(results * 10, lambda: page_source) for _ in range(6)]
+    assert alarms == [False, False, False, False, True, False]
+    assert parse_watchdog.get_alarm_reasons() == ['0 of 60 results have snippets']
+
+
+def test_pages_without_results_container_are_not_observed(tmpdir):
+    sr_parser.set_gdom(disable_javascript=False)
+    parse_watchdog = watchdog.ParseWatchdog(snapshot_folder=str(tmpdir), max_empty_pages=3, min_pages=1)
+    no_results_page = '<html><p>Your search did not match any documents.</p></html>'
+    alarms = [parse_watchdog.observe_page([], lambda: no_results_page, query='no results') for _ in range(5)]
+    assert alarms == [False] * 5
+    assert parse_watchdog.num_empty_pages == 0
+    assert tmpdir.listdir() == []
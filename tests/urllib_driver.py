@@ -0,0 +1,101 @@
+"""
+Minimal stand-in for a Selenium driver that fetches pages with urllib2 and finds elements with BeautifulSoup.
+
+Supports what the crawler does on the pages of the Google stand-in with Javascript disabled: opening urls, typing
+into and submitting the search box, and reading the texts and addresses of links. Hence the crawler can be run
+end-to-end against the stand-in without a browser, also through the HTTP proxy stand-ins of proxy_standin.py.
+"""
+import re
+import urllib
+import urllib2
+from urlparse import urljoin
+
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+
+URL_SAFE_CHARACTERS = "%/:=&?~#+!$,;'@()*[]"
+ID_XPATH_PATTERN = re.compile(r'^//\*\[@id="([^"]+)"\]$')
+SELECTORS = {By.ID: '#%s', By.CLASS_NAME: '.%s', By.NAME: '[name="%s"]', By.CSS_SELECTOR: '%s'}
+
+
+class UrllibElement(object):
+    def __init__(self, driver, tag):
+        self.driver = driver
+        self.tag = tag
+        self.value = tag.get('value', u'')
+
+    @property
+    def text(self):
+        return self.tag.get_text()
+
+    def get_attribute(self, name):
+        if name == 'value':
+            return self.value
+        value = self.tag.get(name)
+        if name == 'href' and value is not None:
+            return urljoin(self.driver.current_url, value)
+        return value
+
+    def clear(self):
+        self.value = u''
+
+    def send_keys(self, keys):
+        self.value += keys.replace(Keys.ENTER, u'')
+        if Keys.ENTER in keys:
+            self.submit()
+
+    def submit(self):
+        """Submit the form of the element by GET, with the values of its named text inputs."""
+        form = self.tag.find_parent('form')
+        fields = dict((field['name'], field.get('value', u'')) for field in form.find_all('input')
+                      if field.get('name') and field.get('type') != 'submit')
+        fields[self.tag['name']] = self.value
+        fields = dict((name, value.encode('utf-8')) for name, value in fields.items())
+        self.driver.get(urljoin(self.driver.current_url, form['action']) + '?' + urllib.urlencode(fields))
+
+
+class UrllibDriver(object):
+    def __init__(self, proxy=None):
+        """
+        :param proxy: if given, requests are sent through this HTTP proxy, like the browsers of driver_wrapper
+        :type proxy: qacrawler.proxies.Proxy
+        """
+        handlers = [urllib2.HTTPCookieProcessor()]
+        if proxy is not None:
+            address = 'http://%s:%d' % (proxy.host, proxy.port)
+            handlers.append(urllib2.ProxyHandler({'http': address, 'https': address}))
+        self.opener = urllib2.build_opener(*handlers)
+        self.current_url = None
+        self.page_source = u''
+        self.soup = BeautifulSoup('', 'html.parser')
+        self.has_quit = False
+
+    def get(self, url):
+        # like a browser, percent-encode e.g. the spaces of a query in the url
+        url = urllib.quote(url.encode('utf-8') if isinstance(url, unicode) else url, safe=URL_SAFE_CHARACTERS)
+        try:
+            response = self.opener.open(url)
+        except urllib2.HTTPError as e:  # like a browser, show the page of an error response
+            response = e
+        self.current_url = response.geturl()
+        self.page_source = response.read().decode('utf-8')
+        self.soup = BeautifulSoup(self.page_source, 'html.parser')
+
+    def find_elements(self, by, value):
+        if by == By.XPATH:
+            match = ID_XPATH_PATTERN.match(value)
+            if match is None:
+                raise ValueError('Only XPaths of the form //*[@id="ID"] are supported, not %s.' % value)
+            by, value = By.ID, match.group(1)
+        return [UrllibElement(self, tag) for tag in self.soup.select(SELECTORS[by] % value)]
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException('No element %s=%s on %s.' % (by, value, self.current_url))
+        return elements[0]
+
+    def quit(self):
+        self.has_quit = True